@@ -0,0 +1,118 @@
+# Background Job Scheduling for Driving School Platform
+import os
+import asyncio
+import socket
+import uuid
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Unique identity of this worker process, used as the lease owner
+WORKER_ID = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+_background_tasks: List[asyncio.Task] = []
+
+def background_jobs_enabled() -> bool:
+    """Background jobs can be disabled per process (e.g. for one-off scripts)"""
+    return os.environ.get('ENABLE_BACKGROUND_JOBS', 'true').lower() in ('1', 'true', 'yes')
+
+class JobLease:
+    """Cross-worker lease stored in the `job_leases` collection.
+
+    Only the worker currently holding the lease runs the job; an expired lease
+    can be taken over by any worker.
+    """
+
+    def __init__(self, db, name: str, ttl_seconds: int = 300):
+        self.db = db
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.owner = WORKER_ID
+
+    async def acquire(self) -> bool:
+        """Acquire or renew the lease; returns False if another worker holds it"""
+        now = datetime.utcnow()
+        try:
+            await self.db.job_leases.update_one(
+                {
+                    "_id": self.name,
+                    "$or": [
+                        {"expires_at": {"$lt": now}},
+                        {"owner": self.owner}
+                    ]
+                },
+                {
+                    "$set": {
+                        "owner": self.owner,
+                        "acquired_at": now,
+                        "expires_at": now + timedelta(seconds=self.ttl_seconds)
+                    }
+                },
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # The lease document exists and is held by someone else
+            return False
+
+    async def release(self):
+        """Release the lease if we still own it"""
+        await self.db.job_leases.delete_one({"_id": self.name, "owner": self.owner})
+
+async def run_periodic(
+    name: str,
+    interval_seconds: float,
+    job: Callable[[], Awaitable],
+    lease: Optional[JobLease] = None
+):
+    """Run `job` every `interval_seconds`, optionally only while holding `lease`"""
+    while True:
+        try:
+            if lease is None or await lease.acquire():
+                await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Background job {name} failed: {str(e)}")
+        await asyncio.sleep(interval_seconds)
+
+def start_background_job(
+    name: str,
+    interval_seconds: float,
+    job: Callable[[], Awaitable],
+    lease: Optional[JobLease] = None
+) -> asyncio.Task:
+    """Schedule a periodic job on the running event loop"""
+    task = asyncio.create_task(run_periodic(name, interval_seconds, job, lease), name=name)
+    _background_tasks.append(task)
+    logger.info(f"Started background job {name} (every {interval_seconds}s)")
+    return task
+
+async def run_once(name: str, job: Callable[[], Awaitable], lease: Optional[JobLease] = None):
+    """Run `job` a single time, optionally only while holding `lease`"""
+    try:
+        if lease is None or await lease.acquire():
+            await job()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Background job {name} failed: {str(e)}")
+    finally:
+        if lease is not None:
+            await lease.release()
+
+def start_one_off_job(name: str, job: Callable[[], Awaitable], lease: Optional[JobLease] = None) -> asyncio.Task:
+    """Run a job once in the background without blocking startup"""
+    task = asyncio.create_task(run_once(name, job, lease), name=name)
+    _background_tasks.append(task)
+    return task
+
+async def stop_background_jobs():
+    """Cancel all periodic jobs started by this process"""
+    for task in _background_tasks:
+        task.cancel()
+    await asyncio.gather(*_background_tasks, return_exceptions=True)
+    _background_tasks.clear()
@@ -0,0 +1,184 @@
+# Content-Addressed Blob Storage for Driving School Platform
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from upload_staging import StagedUpload
+from storage_backends import StorageBackend
+
+logger = logging.getLogger(__name__)
+
+class BlobStore:
+    """Stores uploads once per SHA-256 digest and tracks them in `blobs`.
+
+    `ref_count` is maintained incrementally as files are attached and replaced;
+    the mark-and-sweep collector recomputes it from the referencing documents
+    and deletes blobs nothing points at any more.
+    """
+
+    def __init__(self, db_client, primary: StorageBackend, fallback: Optional[StorageBackend] = None, image_derivatives=None):
+        self.db = db_client.driving_school_platform
+        self.image_derivatives = image_derivatives
+        self.primary = primary
+        self.fallback = fallback
+        self.backends = {backend.name: backend for backend in (fallback, primary) if backend}
+        self.gc_grace_minutes = int(os.environ.get('BLOB_GC_GRACE_MINUTES', '60'))
+        self.gc_batch_size = int(os.environ.get('BLOB_GC_BATCH_SIZE', '500'))
+
+    async def ensure_indexes(self):
+        await self.db.blobs.create_index([("key", ASCENDING)], unique=True)
+        await self.db.blobs.create_index([("sha256", ASCENDING)], unique=True, sparse=True)
+        await self.db.blobs.create_index([("url", ASCENDING)])
+
+    @staticmethod
+    def blob_key(sha256: str, filename: str) -> str:
+        extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+        return f"blobs/{sha256[:2]}/{sha256}" + (f".{extension}" if extension else "")
+
+    async def store(self, staged: StagedUpload, resource_type: str = "auto", derivatives: Optional[Dict] = None) -> Dict:
+        """Store a staged upload unless identical content is already stored; takes one reference"""
+        existing = await self.db.blobs.find_one_and_update(
+            {"sha256": staged.sha256},
+            {"$inc": {"ref_count": 1}, "$set": {"last_referenced_at": datetime.utcnow()}}
+        )
+        if existing:
+            if derivatives and not existing.get("derivatives"):
+                await self.db.blobs.update_one({"_id": existing["_id"]}, {"$set": {"derivatives": derivatives}})
+                existing["derivatives"] = derivatives
+            return {**existing, "deduplicated": True}
+
+        key = self.blob_key(staged.sha256, staged.filename)
+        backend = self.primary
+        try:
+            stored = await backend.put(staged, key, resource_type)
+        except Exception as e:
+            if not self.fallback or backend is self.fallback:
+                raise
+            logger.warning(f"{backend.name} upload failed, falling back to {self.fallback.name}: {str(e)}")
+            backend = self.fallback
+            stored = await backend.put(staged, key, resource_type)
+
+        now = datetime.utcnow()
+        blob = {
+            "key": stored["key"],
+            "sha256": staged.sha256,
+            "url": stored["url"],
+            "backend": backend.name,
+            "size": stored.get("size") or staged.size,
+            "format": stored.get("format", ""),
+            "width": stored.get("width"),
+            "height": stored.get("height"),
+            "content_type": staged.content_type,
+            "derivatives": derivatives,
+            "created_at": now
+        }
+        reference = {"$inc": {"ref_count": 1}, "$set": {"last_referenced_at": now}}
+        try:
+            # Concurrent uploads of the same content write the same key; the first insert wins
+            await self.db.blobs.update_one({"sha256": staged.sha256}, {"$setOnInsert": blob, **reference}, upsert=True)
+        except DuplicateKeyError:
+            await self.db.blobs.update_one({"sha256": staged.sha256}, reference)
+        return {**blob, "deduplicated": False}
+
+    async def register(self, key: str, url: str, backend: StorageBackend, size: int, content_type: Optional[str] = None) -> Dict:
+        """Track an object written directly to storage (presigned upload) as a referenced blob"""
+        now = datetime.utcnow()
+        blob = {
+            "key": key,
+            "url": url,
+            "backend": backend.name,
+            "size": size,
+            "content_type": content_type,
+            "created_at": now
+        }
+        await self.db.blobs.update_one(
+            {"key": key},
+            {"$setOnInsert": blob, "$inc": {"ref_count": 1}, "$set": {"last_referenced_at": now}},
+            upsert=True
+        )
+        return blob
+
+    async def release(self, url: Optional[str]):
+        """Drop one reference held by a replaced or deleted file URL"""
+        if url:
+            await self.db.blobs.update_one(
+                {"url": url, "ref_count": {"$gt": 0}},
+                {"$inc": {"ref_count": -1}}
+            )
+
+    async def _mark(self) -> Dict[str, int]:
+        """Count references to each URL from documents, profile photos, teacher photos and school photos"""
+        references: Dict[str, int] = {}
+
+        def add(url):
+            if url:
+                references[url] = references.get(url, 0) + 1
+
+        async for document in self.db.documents.find({}, {"file_url": 1}):
+            add(document.get("file_url"))
+        async for user in self.db.users.find({"profile_photo_url": {"$ne": None}}, {"profile_photo_url": 1}):
+            add(user.get("profile_photo_url"))
+        # Teacher records keep their own copy of the profile photo URL
+        async for teacher in self.db.teachers.find({"photo_url": {"$nin": [None, ""]}}, {"photo_url": 1}):
+            add(teacher.get("photo_url"))
+        async for school in self.db.driving_schools.find({}, {"photos": 1, "logo_url": 1}):
+            for url in school.get("photos") or []:
+                add(url)
+            add(school.get("logo_url"))
+        return references
+
+    async def collect_garbage(self) -> Dict:
+        """Mark referenced blobs, correct ref counts and sweep unreferenced blobs past the grace period"""
+        started_at = datetime.utcnow()
+        references = await self._mark()
+        # Blobs created after this cutoff may belong to uploads whose document is not written yet
+        cutoff = started_at - timedelta(minutes=self.gc_grace_minutes)
+
+        stats = {"blobs": 0, "recounted": 0, "deleted": 0, "bytes_freed": 0}
+        recounts = []
+        garbage = []
+        async for blob in self.db.blobs.find({}, {"key": 1, "sha256": 1, "url": 1, "ref_count": 1, "backend": 1, "size": 1, "created_at": 1, "last_referenced_at": 1}):
+            stats["blobs"] += 1
+            count = references.get(blob["url"], 0)
+            if count == 0 and (blob.get("last_referenced_at") or blob["created_at"]) < cutoff:
+                # Sweep at most one batch per run; the rest is picked up next time
+                if len(garbage) < self.gc_batch_size:
+                    garbage.append(blob)
+            elif count != blob.get("ref_count", 0):
+                recounts.append(UpdateOne({"_id": blob["_id"]}, {"$set": {"ref_count": count}}))
+
+            if len(recounts) >= self.gc_batch_size:
+                await self.db.blobs.bulk_write(recounts, ordered=False)
+                stats["recounted"] += len(recounts)
+                recounts = []
+        if recounts:
+            await self.db.blobs.bulk_write(recounts, ordered=False)
+            stats["recounted"] += len(recounts)
+
+        for blob in garbage:
+            backend = self.backends.get(blob.get("backend"))
+            if not backend:
+                continue
+            # Skip blobs that were referenced again while the collector was running
+            claimed = await self.db.blobs.find_one_and_delete({
+                "_id": blob["_id"],
+                "last_referenced_at": blob.get("last_referenced_at")
+            })
+            if not claimed:
+                continue
+            try:
+                await backend.delete(blob["key"])
+            except Exception as e:
+                logger.warning(f"Failed to delete blob {blob['key']} from {backend.name}: {str(e)}")
+                await self.db.blobs.insert_one(claimed)
+                continue
+            if self.image_derivatives and blob.get("sha256"):
+                await self.image_derivatives.discard(blob["sha256"])
+            stats["deleted"] += 1
+            stats["bytes_freed"] += blob.get("size") or 0
+
+        if stats["deleted"] or stats["recounted"]:
+            logger.info(f"Blob GC: {stats}")
+        return stats
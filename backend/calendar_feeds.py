@@ -0,0 +1,210 @@
+# Calendar Feeds for Driving School Platform
+import os
+import hashlib
+import secrets
+import logging
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Dict, Iterable, List, Optional
+from pymongo import ASCENDING, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+FEED_PAST_DAYS = int(os.environ.get('CALENDAR_FEED_PAST_DAYS', '30'))
+FEED_FUTURE_DAYS = int(os.environ.get('CALENDAR_FEED_FUTURE_DAYS', '180'))
+FEED_PRODID = "-//Driving School Platform//Schedule//EN"
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def ics_escape(value) -> str:
+    text = str(getattr(value, "value", value) or "")
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n")
+
+def ics_datetime(value: datetime) -> str:
+    """Naive UTC datetime in iCalendar UTC form"""
+    return value.strftime("%Y%m%dT%H%M%SZ")
+
+def fold(line: str) -> str:
+    """One content line, folded at 75 octets without splitting UTF-8 characters (RFC 5545 3.1)"""
+    encoded = line.encode()
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode())
+        start, limit = end, 74
+    return "\r\n ".join(parts) + "\r\n"
+
+class CalendarFeedService:
+    """Per-user iCalendar feeds of sessions, exams and video rooms.
+
+    A feed is addressed by an unguessable token of which only the SHA-256 is
+    stored on the user. Every write that changes someone's schedule bumps a
+    counter in `schedule_versions` for each calendar owner id it touches
+    (user ids, teacher ids, expert ids), and the feed ETag is derived from
+    those counters, so a poll that hits the ETag is answered from two small
+    indexed reads without touching the sessions collection.
+    """
+
+    def __init__(self, db_client):
+        self.db = db_client.driving_school_platform
+
+    async def ensure_indexes(self):
+        await self.db.users.create_index([("calendar_feed.token_hash", ASCENDING)], unique=True, sparse=True)
+        await self.db.exam_schedules.create_index([("student_id", ASCENDING), ("scheduled_at", ASCENDING)])
+        await self.db.exam_schedules.create_index([("external_expert_id", ASCENDING), ("scheduled_at", ASCENDING)])
+        await self.db.video_rooms.create_index([("teacher_id", ASCENDING), ("scheduled_at", ASCENDING)])
+        await self.db.video_rooms.create_index([("student_id", ASCENDING), ("scheduled_at", ASCENDING)])
+
+    async def owner_ids(self, user: Dict) -> List[str]:
+        """Ids the user's bookings may be filed under: the user id, plus the teacher or expert profile id"""
+        ids = [user["id"]]
+        if user["role"] == "teacher":
+            teacher = await self.db.teachers.find_one({"user_id": user["id"]}, {"id": 1})
+            if teacher:
+                ids.append(teacher["id"])
+        elif user["role"] == "external_expert":
+            expert = await self.db.external_experts.find_one({"user_id": user["id"]}, {"id": 1})
+            if expert:
+                ids.append(expert["id"])
+        return ids
+
+    async def issue_token(self, user: Dict) -> str:
+        """Create or rotate the user's feed token; the old feed URL stops working"""
+        token = secrets.token_urlsafe(32)
+        await self.db.users.update_one(
+            {"id": user["id"]},
+            {"$set": {"calendar_feed": {
+                "token_hash": hash_token(token),
+                "owner_ids": await self.owner_ids(user),
+                "created_at": datetime.utcnow()
+            }}}
+        )
+        return token
+
+    async def revoke_token(self, user_id: str) -> bool:
+        result = await self.db.users.update_one(
+            {"id": user_id, "calendar_feed": {"$exists": True}},
+            {"$unset": {"calendar_feed": ""}}
+        )
+        return result.modified_count > 0
+
+    async def find_feed(self, token: str) -> Optional[Dict]:
+        return await self.db.users.find_one(
+            {"calendar_feed.token_hash": hash_token(token)},
+            {"id": 1, "role": 1, "is_active": 1, "calendar_feed": 1}
+        )
+
+    async def touch(self, owner_ids: Iterable[Optional[str]]):
+        """Bump the schedule version of each calendar owner"""
+        now = datetime.utcnow()
+        updates = [
+            UpdateOne({"_id": owner_id}, {"$inc": {"version": 1}, "$set": {"updated_at": now}}, upsert=True)
+            for owner_id in sorted({owner_id for owner_id in owner_ids if owner_id})
+        ]
+        if updates:
+            await self.db.schedule_versions.bulk_write(updates, ordered=False)
+
+    async def touch_sessions(self, sessions: List[Dict]):
+        """Sessions and video rooms: both sides of each booking"""
+        await self.touch(owner_id for session in sessions for owner_id in (session.get("teacher_id"), session.get("student_id")))
+
+    async def touch_exams(self, exams: List[Dict]):
+        await self.touch(owner_id for exam in exams for owner_id in (exam.get("student_id"), exam.get("external_expert_id")))
+
+    def window(self, now: Optional[datetime] = None):
+        today = (now or datetime.utcnow()).replace(hour=0, minute=0, second=0, microsecond=0)
+        return today - timedelta(days=FEED_PAST_DAYS), today + timedelta(days=FEED_FUTURE_DAYS)
+
+    async def etag(self, feed: Dict, now: Optional[datetime] = None) -> str:
+        """Strong ETag from the owners' schedule versions and the day the window starts on"""
+        owner_ids = feed["calendar_feed"]["owner_ids"]
+        versions = {
+            row["_id"]: row["version"]
+            async for row in self.db.schedule_versions.find({"_id": {"$in": owner_ids}}, {"version": 1})
+        }
+        window_start, _ = self.window(now)
+        digest = hashlib.sha256("|".join(
+            [feed["role"], feed["calendar_feed"]["token_hash"], window_start.date().isoformat()]
+            + [f"{owner_id}:{versions.get(owner_id, 0)}" for owner_id in owner_ids]
+        ).encode()).hexdigest()
+        return f'"{digest[:32]}"'
+
+    def _event(self, uid: str, start: datetime, minutes: int, summary: str, location: Optional[str], description: str, cancelled: bool, stamp: Optional[datetime]) -> str:
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:{uid}",
+            f"DTSTAMP:{ics_datetime(stamp or start)}",
+            f"DTSTART:{ics_datetime(start)}",
+            f"DTEND:{ics_datetime(start + timedelta(minutes=minutes))}",
+            f"SUMMARY:{ics_escape(summary)}",
+            f"STATUS:{'CANCELLED' if cancelled else 'CONFIRMED'}"
+        ]
+        if location:
+            lines.append(f"LOCATION:{ics_escape(location)}")
+        if description:
+            lines.append(f"DESCRIPTION:{ics_escape(description)}")
+        lines.append("END:VEVENT")
+        return "".join(fold(line) for line in lines)
+
+    async def events(self, feed: Dict, now: Optional[datetime] = None) -> AsyncIterator[str]:
+        """The VCALENDAR body, yielded one event at a time"""
+        owner_ids = feed["calendar_feed"]["owner_ids"]
+        role = feed["role"]
+        window_start, window_end = self.window(now)
+        in_window = {"$gte": window_start, "$lt": window_end}
+        yield "".join(fold(line) for line in [
+            "BEGIN:VCALENDAR",
+            "VERSION:2.0",
+            f"PRODID:{FEED_PRODID}",
+            "CALSCALE:GREGORIAN",
+            "METHOD:PUBLISH",
+            "X-WR-CALNAME:Driving School"
+        ])
+
+        if role in ("student", "teacher"):
+            side = "student_id" if role == "student" else "teacher_id"
+            async for session in self.db.sessions.find({side: {"$in": owner_ids}, "scheduled_at": in_window}).sort("scheduled_at", ASCENDING):
+                session_type = str(getattr(session.get("session_type"), "value", session.get("session_type") or "driving"))
+                yield self._event(
+                    f"session-{session['id']}@driving-school",
+                    session["scheduled_at"],
+                    session.get("duration_minutes") or 60,
+                    f"{session_type.capitalize()} session",
+                    session.get("location"),
+                    session.get("notes") or "",
+                    session.get("status") == "cancelled",
+                    session.get("updated_at") or session.get("created_at")
+                )
+            async for room in self.db.video_rooms.find({side: {"$in": owner_ids}, "scheduled_at": in_window}).sort("scheduled_at", ASCENDING):
+                other = room.get("teacher_name") if role == "student" else room.get("student_name")
+                yield self._event(
+                    f"video-room-{room['id']}@driving-school",
+                    room["scheduled_at"],
+                    room.get("duration_minutes") or 60,
+                    f"Video lesson with {other}" if other else "Video lesson",
+                    room.get("room_url"),
+                    room.get("room_url") or "",
+                    False,
+                    room.get("created_at")
+                )
+
+        if role in ("student", "external_expert"):
+            side = "student_id" if role == "student" else "external_expert_id"
+            async for exam in self.db.exam_schedules.find({side: {"$in": owner_ids}, "scheduled_at": in_window}).sort("scheduled_at", ASCENDING):
+                exam_type = str(getattr(exam.get("exam_type"), "value", exam.get("exam_type") or ""))
+                yield self._event(
+                    f"exam-{exam['id']}@driving-school",
+                    exam["scheduled_at"],
+                    exam.get("duration_minutes") or 90,
+                    f"{exam_type.capitalize()} exam",
+                    exam.get("location"),
+                    f"Status: {exam.get('status')}",
+                    exam.get("status") == "cancelled",
+                    exam.get("cancelled_at") or exam.get("created_at")
+                )
+
+        yield fold("END:VCALENDAR")
@@ -0,0 +1,113 @@
+# Per-User Document Requirement Status for Driving School Platform
+import logging
+from typing import Dict, List, Optional
+from pymongo import ASCENDING, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+class DocumentStatusService:
+    """Keeps `users.document_status` (document type -> status) and
+    `users.documents_complete` (requirement set -> bool) in sync with `documents`.
+
+    Both fields are written in one pipeline update, so completeness is a field
+    read and "all required documents accepted" is an indexable query such as
+    {"documents_complete.student": True}.
+    """
+
+    def __init__(self, db_client, required_documents: Dict[str, List[str]]):
+        self.db = db_client.driving_school_platform
+        self.required_documents = required_documents
+        self.backfill_batch_size = 500
+
+    async def ensure_indexes(self):
+        for role in self.required_documents:
+            await self.db.users.create_index([(f"documents_complete.{role}", ASCENDING)])
+
+    def _completeness_stage(self) -> dict:
+        return {"$set": {
+            f"documents_complete.{role}": {
+                "$and": [{"$eq": [f"$document_status.{document_type}", "accepted"]} for document_type in document_types]
+            }
+            for role, document_types in self.required_documents.items()
+        }}
+
+    async def set_statuses(self, user_id: str, statuses: Dict[str, str]):
+        """Atomically record new statuses for some document types and recompute completeness"""
+        result = await self.db.users.update_one(
+            {"id": user_id, "document_status": {"$exists": True}},
+            [
+                {"$set": {f"document_status.{document_type}": status for document_type, status in statuses.items()}},
+                self._completeness_stage()
+            ]
+        )
+        if result.matched_count == 0:
+            # No map yet (user not backfilled): build it from the documents, which already include this change
+            await self.refresh(user_id)
+
+    async def _statuses_from_documents(self, user_ids: List[str]) -> Dict[str, Dict[str, str]]:
+        """Rebuild status maps from `documents`; any accepted copy of a type counts as accepted"""
+        statuses: Dict[str, Dict[str, str]] = {user_id: {} for user_id in user_ids}
+        async for row in self.db.documents.aggregate([
+            {"$match": {"user_id": {"$in": user_ids}}},
+            {"$sort": {"upload_date": 1}},
+            {"$group": {
+                "_id": {"user_id": "$user_id", "document_type": "$document_type"},
+                "statuses": {"$push": "$status"}
+            }}
+        ]):
+            document_statuses = row["statuses"]
+            status = "accepted" if "accepted" in document_statuses else document_statuses[-1]
+            statuses[row["_id"]["user_id"]][row["_id"]["document_type"]] = status or "pending"
+        return statuses
+
+    async def refresh(self, user_id: str):
+        """Recompute a user's status map after bulk document changes"""
+        statuses = await self._statuses_from_documents([user_id])
+        await self.db.users.update_one(
+            {"id": user_id},
+            [{"$set": {"document_status": statuses[user_id]}}, self._completeness_stage()]
+        )
+
+    def is_complete_for(self, user: dict, role: str) -> Optional[bool]:
+        """Completeness from an already loaded user document; None if it has no status map yet"""
+        if "document_status" not in user:
+            return None
+        document_status = user["document_status"] or {}
+        return all(document_status.get(document_type) == "accepted" for document_type in self.required_documents.get(role, []))
+
+    async def is_complete(self, user_id: str, role: str) -> bool:
+        user = await self.db.users.find_one({"id": user_id}, {"document_status": 1})
+        if not user:
+            return False
+        complete = self.is_complete_for(user, role)
+        if complete is None:
+            await self.refresh(user_id)
+            user = await self.db.users.find_one({"id": user_id}, {"document_status": 1})
+            complete = self.is_complete_for(user, role)
+        return bool(complete)
+
+    async def backfill(self):
+        """Build status maps for users created before they existed"""
+        updated = 0
+        while True:
+            users = await self.db.users.find(
+                {"document_status": {"$exists": False}},
+                {"id": 1}
+            ).limit(self.backfill_batch_size).to_list(length=self.backfill_batch_size)
+            if not users:
+                break
+            user_ids = [user["id"] for user in users]
+            statuses = await self._statuses_from_documents(user_ids)
+            result = await self.db.users.bulk_write([
+                UpdateOne(
+                    {"id": user_id, "document_status": {"$exists": False}},
+                    [{"$set": {"document_status": statuses[user_id]}}, self._completeness_stage()]
+                )
+                for user_id in user_ids
+            ], ordered=False)
+            updated += result.modified_count
+            if result.modified_count == 0:
+                break
+        if updated:
+            logger.info(f"Backfilled document status for {updated} users")
+        return updated
@@ -8,13 +8,130 @@ from email import encoders
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict
 import json
+import uuid
+import zlib
 import asyncio
 import logging
+from functools import lru_cache
+from string import Template
+from bson import Binary
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from enum import Enum
 
 logger = logging.getLogger(__name__)
 
+# Email templates are compiled once at import time and reused for every render
+_EMAIL_LAYOUT_TEMPLATE = Template("""
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <meta charset="utf-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+            <title>$title</title>
+        </head>
+        <body style="font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f4f4f4;">
+            <div style="max-width: 600px; margin: 0 auto; background-color: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
+
+                <!-- Header -->
+                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center;">
+                    <h1 style="margin: 0; font-size: 28px;">🚗 Driving School Platform</h1>
+                    <p style="margin: 10px 0 0 0; opacity: 0.9;">مدرسة تعليم القيادة الجزائرية</p>
+                </div>
+
+                $content
+
+                <!-- CTA Button -->
+                <div style="padding: 0 30px 30px;">
+                    <a href="$frontend_url/dashboard"
+                       style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 12px 30px; text-decoration: none; border-radius: 25px; font-weight: bold;">
+                        Open Dashboard
+                    </a>
+                </div>
+
+                <!-- Footer -->
+                <div style="background-color: #f8f9fa; padding: 20px; text-align: center; color: #666; font-size: 14px;">
+                    <p style="margin: 0;">This is an automated message from the Driving School Platform</p>
+                    <p style="margin: 5px 0 0 0;">🇩🇿 Algeria Driving Education System</p>
+                </div>
+            </div>
+        </body>
+        </html>
+        """)
+
+_PRIORITY_BADGE_TEMPLATE = Template("""
+                <!-- Priority Badge -->
+                <div style="padding: 20px; border-left: 4px solid $priority_color; background-color: #f8f9fa;">
+                    <div style="display: inline-block; background-color: $priority_color; color: white; padding: 4px 12px; border-radius: 12px; font-size: 12px; font-weight: bold; text-transform: uppercase;">
+                        $priority Priority
+                    </div>
+                </div>""")
+
+_NOTIFICATION_CONTENT_TEMPLATE = Template("""$priority_badge
+
+                <!-- Content -->
+                <div style="padding: 30px;">
+                    <h2 style="color: #333; margin-top: 0;">$title</h2>
+                    <p style="color: #666; line-height: 1.6; font-size: 16px;">$message</p>
+
+                    <!-- Metadata -->
+                    $metadata
+                </div>""")
+
+_DIGEST_CONTENT_TEMPLATE = Template("""
+                <!-- Digest -->
+                <div style="padding: 30px;">
+                    <h2 style="color: #333; margin-top: 0;">$title</h2>
+                    $items
+                </div>""")
+
+_DIGEST_ITEM_TEMPLATE = Template("""
+                    <div style="border-left: 4px solid $priority_color; padding: 10px 15px; margin-bottom: 15px; background-color: #f8f9fa;">
+                        <span style="display: inline-block; background-color: $priority_color; color: white; padding: 2px 8px; border-radius: 10px; font-size: 11px; font-weight: bold; text-transform: uppercase;">$priority</span>
+                        <h3 style="color: #333; margin: 8px 0 4px 0;">$title</h3>
+                        <p style="color: #666; line-height: 1.6; margin: 0;">$message</p>
+                        $metadata
+                    </div>""")
+
+_METADATA_BLOCK_TEMPLATE = Template(
+    "<div style='background-color: #f8f9fa; padding: 15px; border-radius: 6px; margin-top: 20px;'>"
+    "<h4 style='margin: 0 0 10px 0; color: #495057;'>Additional Information:</h4>"
+    "$rows"
+    "</div>"
+)
+
+_METADATA_ROW_TEMPLATE = Template("<p style='margin: 5px 0; color: #6c757d;'><strong>$key:</strong> $value</p>")
+
+_PRIORITY_COLORS = {
+    "low": "#28a745",
+    "medium": "#ffc107",
+    "high": "#fd7e14",
+    "urgent": "#dc3545"
+}
+
+def _priority_value(priority) -> str:
+    """Plain string value of a priority (stored documents hold strings, callers may pass the enum)"""
+    return getattr(priority, "value", priority)
+
+def _priority_color(priority: str) -> str:
+    return _PRIORITY_COLORS.get(priority, "#007bff")
+
+@lru_cache(maxsize=None)
+def _priority_badge(priority: str) -> str:
+    return _PRIORITY_BADGE_TEMPLATE.substitute(priority=priority, priority_color=_priority_color(priority))
+
+def _channel_value(channel) -> str:
+    """Plain string value of a channel, as stored in delivery_status keys"""
+    return getattr(channel, "value", channel)
+
+@lru_cache(maxsize=256)
+def _format_metadata_key(key: str) -> str:
+    return key.replace('_', ' ').title()
+
+class DeliveryFailedError(Exception):
+    """A notification could not be delivered through one of its external channels"""
+
 class NotificationPriority(str, Enum):
     LOW = "low"
     MEDIUM = "medium"
@@ -27,6 +144,440 @@ class NotificationChannel(str, Enum):
     PUSH = "push"
     IN_APP = "in_app"
 
+# Notification templates: id -> type, priority, channels and per-locale title/message
+# format strings. Notifications store only the template id and its params (in
+# `metadata`); title and message are rendered when the notification is read.
+DEFAULT_LOCALE = "en"
+SUPPORTED_LOCALES = ("en", "fr", "ar")
+
+NOTIFICATION_TEMPLATES = {
+    "enrollment_accepted": {
+        "type": "enrollment_approved",
+        "title": {
+            "en": "Enrollment Accepted - You Can Start Learning!",
+            "fr": "Inscription acceptée - Vous pouvez commencer !",
+            "ar": "تم قبول التسجيل - يمكنك بدء التعلم!"
+        },
+        "message": {
+            "en": "Congratulations! Your enrollment at {school_name} has been accepted. You are now an official student and can start your lessons immediately!",
+            "fr": "Félicitations ! Votre inscription à {school_name} a été acceptée. Vous êtes maintenant élève officiel et pouvez commencer vos leçons immédiatement !",
+            "ar": "تهانينا! تم قبول تسجيلك في {school_name}. أنت الآن طالب رسمي ويمكنك بدء دروسك فورًا!"
+        }
+    },
+    "enrollment_rejected": {
+        "type": "enrollment_rejected",
+        "title": {
+            "en": "Enrollment Rejected",
+            "fr": "Inscription rejetée",
+            "ar": "تم رفض التسجيل"
+        },
+        "message": {
+            "en": "Your enrollment at {school_name} was rejected. Reason: {reason}",
+            "fr": "Votre inscription à {school_name} a été rejetée. Motif : {reason}",
+            "ar": "تم رفض تسجيلك في {school_name}. السبب: {reason}"
+        }
+    },
+    "enrollment_refused": {
+        "type": "enrollment_rejected",
+        "title": {
+            "en": "Enrollment Refused",
+            "fr": "Inscription refusée",
+            "ar": "تم رفض التسجيل"
+        },
+        "message": {
+            "en": "Your enrollment at {school_name} has been refused. Reason: {rejection_reason}",
+            "fr": "Votre inscription à {school_name} a été refusée. Motif : {rejection_reason}",
+            "ar": "تم رفض تسجيلك في {school_name}. السبب: {rejection_reason}"
+        }
+    },
+    "teacher_assigned": {
+        "type": "teacher_assigned",
+        "title": {
+            "en": "Teacher Assigned",
+            "fr": "Moniteur assigné",
+            "ar": "تم تعيين المدرب"
+        },
+        "message": {
+            "en": "Your teacher {teacher_name} has been assigned for all your courses",
+            "fr": "Votre moniteur {teacher_name} a été assigné à tous vos cours",
+            "ar": "تم تعيين مدربك {teacher_name} لجميع دوراتك"
+        }
+    },
+    "student_assigned": {
+        "type": "student_assigned",
+        "title": {
+            "en": "New Student Assigned",
+            "fr": "Nouvel élève assigné",
+            "ar": "تم تعيين طالب جديد"
+        },
+        "message": {
+            "en": "You have been assigned to teach {student_name} all courses",
+            "fr": "Vous avez été assigné pour enseigner tous les cours à {student_name}",
+            "ar": "تم تعيينك لتدريس {student_name} جميع الدورات"
+        }
+    },
+    "course_teacher_assigned": {
+        "type": "teacher_assigned",
+        "title": {
+            "en": "Teacher Assigned to Your Course",
+            "fr": "Moniteur assigné à votre cours",
+            "ar": "تم تعيين مدرب لدورتك"
+        },
+        "message": {
+            "en": "Teacher {teacher_name} has been assigned to your {course_type} course.",
+            "fr": "Le moniteur {teacher_name} a été assigné à votre cours {course_type}.",
+            "ar": "تم تعيين المدرب {teacher_name} لدورة {course_type} الخاصة بك."
+        }
+    },
+    "course_student_assigned": {
+        "type": "student_assigned",
+        "title": {
+            "en": "New Student Assigned",
+            "fr": "Nouvel élève assigné",
+            "ar": "تم تعيين طالب جديد"
+        },
+        "message": {
+            "en": "You have been assigned to teach {student_name} for {course_type} course.",
+            "fr": "Vous avez été assigné pour enseigner le cours {course_type} à {student_name}.",
+            "ar": "تم تعيينك لتدريس {student_name} في دورة {course_type}."
+        }
+    },
+    "document_rejected": {
+        "type": "document_rejected",
+        "title": {
+            "en": "Document Rejected",
+            "fr": "Document rejeté",
+            "ar": "تم رفض الوثيقة"
+        },
+        "message": {
+            "en": "Your {document_label} has been rejected. Reason: {reason}. Please upload a new version.",
+            "fr": "Votre {document_label} a été rejeté. Motif : {reason}. Veuillez téléverser une nouvelle version.",
+            "ar": "تم رفض {document_label}. السبب: {reason}. يرجى رفع نسخة جديدة."
+        }
+    },
+    "document_refused": {
+        "type": "document_refused",
+        "title": {
+            "en": "Document Refused",
+            "fr": "Document refusé",
+            "ar": "تم رفض الوثيقة"
+        },
+        "message": {
+            "en": "Your {document_label} was refused. Reason: {reason}",
+            "fr": "Votre {document_label} a été refusé. Motif : {reason}",
+            "ar": "تم رفض {document_label}. السبب: {reason}"
+        }
+    },
+    "documents_approved": {
+        "type": "documents_approved",
+        "title": {
+            "en": "Documents Approved",
+            "fr": "Documents approuvés",
+            "ar": "تمت الموافقة على الوثائق"
+        },
+        "message": {
+            "en": "All your documents have been approved! Your enrollment is now pending final approval.",
+            "fr": "Tous vos documents ont été approuvés ! Votre inscription est en attente de validation finale.",
+            "ar": "تمت الموافقة على جميع وثائقك! تسجيلك الآن في انتظار الموافقة النهائية."
+        }
+    },
+    "enrollment_payment_completed": {
+        "type": "payment_completed",
+        "title": {
+            "en": "Payment Completed",
+            "fr": "Paiement effectué",
+            "ar": "تم الدفع"
+        },
+        "message": {
+            "en": "Student has completed payment for enrollment at {school_name}",
+            "fr": "Un élève a effectué le paiement de son inscription à {school_name}",
+            "ar": "أكمل طالب دفع رسوم التسجيل في {school_name}"
+        }
+    },
+    "payment_succeeded": {
+        "type": "payment_completed",
+        "priority": NotificationPriority.HIGH,
+        "channels": [NotificationChannel.EMAIL, NotificationChannel.IN_APP],
+        "title": {
+            "en": "Payment Successful! 💳",
+            "fr": "Paiement réussi ! 💳",
+            "ar": "تم الدفع بنجاح! 💳"
+        },
+        "message": {
+            "en": "Your payment of {amount} DZD has been processed successfully. You can now upload your documents to complete enrollment.",
+            "fr": "Votre paiement de {amount} DZD a été traité avec succès. Vous pouvez maintenant téléverser vos documents pour finaliser l'inscription.",
+            "ar": "تمت معالجة دفعتك البالغة {amount} دج بنجاح. يمكنك الآن رفع وثائقك لإكمال التسجيل."
+        }
+    },
+    "payment_failed": {
+        "type": "payment_failed",
+        "priority": NotificationPriority.HIGH,
+        "channels": [NotificationChannel.EMAIL, NotificationChannel.IN_APP],
+        "title": {
+            "en": "Payment Failed ❌",
+            "fr": "Échec du paiement ❌",
+            "ar": "فشل الدفع ❌"
+        },
+        "message": {
+            "en": "Your payment of {amount} DZD could not be processed. Please try again or contact support.",
+            "fr": "Votre paiement de {amount} DZD n'a pas pu être traité. Veuillez réessayer ou contacter le support.",
+            "ar": "تعذرت معالجة دفعتك البالغة {amount} دج. يرجى المحاولة مرة أخرى أو الاتصال بالدعم."
+        }
+    },
+    "payment_expired": {
+        "type": "payment_expired",
+        "title": {
+            "en": "Payment Expired",
+            "fr": "Paiement expiré",
+            "ar": "انتهت صلاحية الدفع"
+        },
+        "message": {
+            "en": "Your payment of {amount} DZD was not completed in time and has expired. Please start a new payment to continue your enrollment.",
+            "fr": "Votre paiement de {amount} DZD n'a pas été finalisé à temps et a expiré. Veuillez effectuer un nouveau paiement pour poursuivre votre inscription.",
+            "ar": "لم يكتمل دفعك البالغ {amount} دج في الوقت المحدد وانتهت صلاحيته. يرجى إجراء دفع جديد لمتابعة تسجيلك."
+        }
+    },
+    "payment_reminder": {
+        "type": "payment_reminder",
+        "channels": [NotificationChannel.EMAIL, NotificationChannel.IN_APP],
+        "title": {
+            "en": "Payment Reminder",
+            "fr": "Rappel de paiement",
+            "ar": "تذكير بالدفع"
+        },
+        "message": {
+            "en": "Your enrollment payment for {school_name} is still pending. Please complete your payment to continue.",
+            "fr": "Le paiement de votre inscription à {school_name} est toujours en attente. Veuillez le finaliser pour continuer.",
+            "ar": "لا يزال دفع رسوم تسجيلك في {school_name} معلقًا. يرجى إكمال الدفع للمتابعة."
+        }
+    },
+    "certificate_ready": {
+        "type": "certificate_ready",
+        "title": {
+            "en": "Certificate Ready!",
+            "fr": "Certificat prêt !",
+            "ar": "الشهادة جاهزة!"
+        },
+        "message": {
+            "en": "Congratulations! Your driving certificate is ready for download.",
+            "fr": "Félicitations ! Votre certificat de conduite est prêt à être téléchargé.",
+            "ar": "تهانينا! شهادة القيادة الخاصة بك جاهزة للتحميل."
+        }
+    },
+    "session_scheduled_student": {
+        "type": "session_scheduled",
+        "title": {
+            "en": "New Session Scheduled",
+            "fr": "Nouvelle séance programmée",
+            "ar": "تمت جدولة حصة جديدة"
+        },
+        "message": {
+            "en": "A {session_type} session has been scheduled with teacher {teacher_name} on {scheduled_at_display}.",
+            "fr": "Une séance {session_type} a été programmée avec le moniteur {teacher_name} le {scheduled_at_display}.",
+            "ar": "تمت جدولة حصة {session_type} مع المدرب {teacher_name} بتاريخ {scheduled_at_display}."
+        }
+    },
+    "session_scheduled_teacher": {
+        "type": "session_scheduled",
+        "title": {
+            "en": "New Session Scheduled",
+            "fr": "Nouvelle séance programmée",
+            "ar": "تمت جدولة حصة جديدة"
+        },
+        "message": {
+            "en": "A {session_type} session has been scheduled with student {student_name} on {scheduled_at_display}.",
+            "fr": "Une séance {session_type} a été programmée avec l'élève {student_name} le {scheduled_at_display}.",
+            "ar": "تمت جدولة حصة {session_type} مع الطالب {student_name} بتاريخ {scheduled_at_display}."
+        }
+    },
+    "session_series_scheduled_student": {
+        "type": "session_scheduled",
+        "title": {
+            "en": "Sessions Scheduled",
+            "fr": "Séances programmées",
+            "ar": "تمت جدولة الحصص"
+        },
+        "message": {
+            "en": "{session_count} {session_type} sessions have been scheduled with teacher {teacher_name}, from {first_session_display} to {last_session_display}.",
+            "fr": "{session_count} séances {session_type} ont été programmées avec le moniteur {teacher_name}, du {first_session_display} au {last_session_display}.",
+            "ar": "تمت جدولة {session_count} حصص {session_type} مع المدرب {teacher_name}، من {first_session_display} إلى {last_session_display}."
+        }
+    },
+    "session_series_scheduled_teacher": {
+        "type": "session_scheduled",
+        "title": {
+            "en": "Sessions Scheduled",
+            "fr": "Séances programmées",
+            "ar": "تمت جدولة الحصص"
+        },
+        "message": {
+            "en": "{session_count} {session_type} sessions have been scheduled with student {student_name}, from {first_session_display} to {last_session_display}.",
+            "fr": "{session_count} séances {session_type} ont été programmées avec l'élève {student_name}, du {first_session_display} au {last_session_display}.",
+            "ar": "تمت جدولة {session_count} حصص {session_type} مع الطالب {student_name}، من {first_session_display} إلى {last_session_display}."
+        }
+    },
+    "timetable_published_student": {
+        "type": "session_scheduled",
+        "title": {
+            "en": "Your Weekly Timetable",
+            "fr": "Votre emploi du temps de la semaine",
+            "ar": "جدولك الأسبوعي"
+        },
+        "message": {
+            "en": "{session_count} sessions have been scheduled for the week of {week_start_display}, starting {first_session_display}.",
+            "fr": "{session_count} séances ont été programmées pour la semaine du {week_start_display}, à partir du {first_session_display}.",
+            "ar": "تمت جدولة {session_count} حصص لأسبوع {week_start_display}، ابتداءً من {first_session_display}."
+        }
+    },
+    "timetable_published_teacher": {
+        "type": "session_scheduled",
+        "title": {
+            "en": "Your Weekly Timetable",
+            "fr": "Votre emploi du temps de la semaine",
+            "ar": "جدولك الأسبوعي"
+        },
+        "message": {
+            "en": "{session_count} sessions with {student_count} students have been scheduled for the week of {week_start_display}.",
+            "fr": "{session_count} séances avec {student_count} élèves ont été programmées pour la semaine du {week_start_display}.",
+            "ar": "تمت جدولة {session_count} حصص مع {student_count} طلاب لأسبوع {week_start_display}."
+        }
+    },
+    "exam_waitlist_promoted": {
+        "type": "exam_scheduled",
+        "priority": NotificationPriority.HIGH,
+        "channels": [NotificationChannel.EMAIL, NotificationChannel.IN_APP],
+        "title": {
+            "en": "Exam Seat Available",
+            "fr": "Place d'examen disponible",
+            "ar": "مقعد امتحان متاح"
+        },
+        "message": {
+            "en": "A seat opened up: your {exam_type} exam is booked for {scheduled_at_display} at {location}.",
+            "fr": "Une place s'est libérée : votre examen {exam_type} est réservé pour le {scheduled_at_display} à {location}.",
+            "ar": "توفر مقعد: تم حجز امتحان {exam_type} الخاص بك بتاريخ {scheduled_at_display} في {location}."
+        }
+    },
+    "session_reminder": {
+        "type": "session_reminder",
+        "priority": NotificationPriority.HIGH,
+        "channels": [NotificationChannel.EMAIL, NotificationChannel.IN_APP],
+        "title": {
+            "en": "Session Reminder",
+            "fr": "Rappel de séance",
+            "ar": "تذكير بالحصة"
+        },
+        "message": {
+            "en": "You have a {session_type} session scheduled for tomorrow at {session_time}",
+            "fr": "Vous avez une séance {session_type} prévue demain à {session_time}",
+            "ar": "لديك حصة {session_type} مجدولة غدًا على الساعة {session_time}"
+        }
+    }
+}
+
+class _TemplateParams(dict):
+    """Leaves unknown placeholders visible instead of failing the whole read"""
+    def __missing__(self, key):
+        return "{" + key + "}"
+
+# Dates are stored as datetime params and rendered in the reader's locale: a
+# param `X` fills `{X_display}` with date and time, a param `X_date` fills
+# `{X_display}` with the date only.
+MONTH_NAMES = {
+    "en": ["January", "February", "March", "April", "May", "June", "July", "August", "September", "October", "November", "December"],
+    "fr": ["janvier", "février", "mars", "avril", "mai", "juin", "juillet", "août", "septembre", "octobre", "novembre", "décembre"],
+    "ar": ["جانفي", "فيفري", "مارس", "أفريل", "ماي", "جوان", "جويلية", "أوت", "سبتمبر", "أكتوبر", "نوفمبر", "ديسمبر"]
+}
+DATE_FORMATS = {
+    "en": ("{month} {day}, {year}", "{date} at {time}"),
+    "fr": ("{day} {month} {year}", "{date} à {time}"),
+    "ar": ("{day} {month} {year}", "{date} على الساعة {time}")
+}
+
+def format_datetime(value: datetime, locale: str, with_time: bool = True) -> str:
+    """A date, optionally with its time, spelled out in one of SUPPORTED_LOCALES"""
+    date_format, datetime_format = DATE_FORMATS.get(locale, DATE_FORMATS[DEFAULT_LOCALE])
+    month = MONTH_NAMES.get(locale, MONTH_NAMES[DEFAULT_LOCALE])[value.month - 1]
+    text = date_format.format(day=value.day, month=month, year=value.year)
+    if with_time:
+        text = datetime_format.format(date=text, time=value.strftime('%H:%M'))
+    return text
+
+def localized_params(params: Dict, locale: str) -> Dict:
+    """Template params with a `_display` string added for every datetime param"""
+    localized = dict(params)
+    for key, value in params.items():
+        if isinstance(value, datetime):
+            date_only = key.endswith("_date")
+            display_key = f"{key[:-len('_date')] if date_only else key}_display"
+            localized[display_key] = format_datetime(value, locale, with_time=not date_only)
+    return localized
+
+# Archived notifications are compressed JSON; datetimes carry a type marker so
+# template params come back as datetimes and still render in the reader's locale
+ARCHIVE_ENCODING = "json-typed"
+
+def archive_default(value):
+    """json.dumps hook for archive payloads"""
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    return str(value)
+
+def archive_object_hook(obj: Dict):
+    """json.loads hook reversing `archive_default`"""
+    if len(obj) == 1 and "$date" in obj:
+        return datetime.fromisoformat(obj["$date"])
+    return obj
+
+def encode_archive(notifications: list) -> bytes:
+    payload = json.dumps(
+        [{key: value for key, value in notification.items() if key != "_id"} for notification in notifications],
+        separators=(",", ":"),
+        default=archive_default
+    )
+    return zlib.compress(payload.encode(), 9)
+
+def decode_archive(payload: bytes, encoding: Optional[str] = None) -> list:
+    notifications = json.loads(zlib.decompress(payload), object_hook=archive_object_hook)
+    if encoding != ARCHIVE_ENCODING:
+        # Older archives stored datetimes as plain ISO strings
+        for notification in notifications:
+            metadata = notification.get("metadata") or {}
+            for key, value in metadata.items():
+                if isinstance(value, str) and len(value) >= 19 and value[10:11] == "T":
+                    try:
+                        metadata[key] = datetime.fromisoformat(value)
+                    except ValueError:
+                        pass
+    return notifications
+
+def resolve_locale(locale: Optional[str]) -> str:
+    """Map a language tag such as 'fr-FR' onto a supported locale"""
+    if locale:
+        language = locale.split(",")[0].split("-")[0].strip().lower()
+        if language in SUPPORTED_LOCALES:
+            return language
+    return DEFAULT_LOCALE
+
+@lru_cache(maxsize=None)
+def get_template_strings(template_id: str, locale: str) -> tuple:
+    """(title, message) format strings for a template, falling back to the default locale"""
+    template = NOTIFICATION_TEMPLATES[template_id]
+    return (
+        template["title"].get(locale) or template["title"][DEFAULT_LOCALE],
+        template["message"].get(locale) or template["message"][DEFAULT_LOCALE]
+    )
+
+def render_notification(notification: dict, locale: Optional[str] = None) -> dict:
+    """Fill in title and message of a template-stored notification (in place)"""
+    template_id = notification.get("template_id")
+    if template_id in NOTIFICATION_TEMPLATES:
+        locale = resolve_locale(locale)
+        title, message = get_template_strings(template_id, locale)
+        params = _TemplateParams(localized_params(notification.get("metadata") or {}, locale))
+        notification["title"] = title.format_map(params)
+        notification["message"] = message.format_map(params)
+    return notification
+
 class EnhancedNotificationService:
     def __init__(self, db_client):
         self.db = db_client.driving_school_platform
@@ -35,6 +586,240 @@ class EnhancedNotificationService:
         self.smtp_username = os.environ.get('SMTP_USERNAME')
         self.smtp_password = os.environ.get('SMTP_PASSWORD')
         self.from_email = os.environ.get('FROM_EMAIL', self.smtp_username)
+        self.frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
+        
+        # Digest mode: emails within the window are coalesced into one message per user (0 disables)
+        self.digest_window_minutes = int(os.environ.get('NOTIFICATION_DIGEST_WINDOW_MINUTES', '0'))
+        self.digest_batch_size = int(os.environ.get('NOTIFICATION_DIGEST_BATCH_SIZE', '100'))
+        
+        # Retention policy: read notifications older than this are archived
+        self.retention_days = int(os.environ.get('NOTIFICATION_RETENTION_DAYS', '90'))
+        self.archive_batch_size = int(os.environ.get('NOTIFICATION_ARCHIVE_BATCH_SIZE', '1000'))
+        
+        # Outbox retries: failed deliveries back off exponentially until the attempt limit
+        self.outbox_max_attempts = int(os.environ.get('NOTIFICATION_OUTBOX_MAX_ATTEMPTS', '5'))
+        self.outbox_retry_seconds = int(os.environ.get('NOTIFICATION_OUTBOX_RETRY_SECONDS', '30'))
+
+    async def ensure_indexes(self):
+        """Create the indexes used by notification reads, expiry and retention"""
+        # TTL index: MongoDB removes notifications once expires_at has passed.
+        # Documents without an expires_at never expire.
+        await self.db.enhanced_notifications.create_index(
+            [("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"
+        )
+        await self.db.enhanced_notifications.create_index([("id", ASCENDING)], unique=True)
+        await self.db.enhanced_notifications.create_index(
+            [("user_id", ASCENDING), ("is_read", ASCENDING), ("created_at", DESCENDING)]
+        )
+        await self.db.notifications.create_index([("user_id", ASCENDING), ("created_at", DESCENDING)])
+        
+        # Retention scans
+        for collection_name in ("enhanced_notifications", "notifications"):
+            await self.db[collection_name].create_index([("is_read", ASCENDING), ("created_at", ASCENDING)])
+        await self.db.notifications_archive.create_index(
+            [("source", ASCENDING), ("month", ASCENDING), ("user_ids", ASCENDING)]
+        )
+        
+        # At most one open digest per user; flush scans by status and due time
+        await self.db.notification_digests.create_index(
+            [("user_id", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"status": "open"},
+            name="open_digest_per_user"
+        )
+        await self.db.notification_digests.create_index([("status", ASCENDING), ("flush_after", ASCENDING)])
+        await self.db.notification_outbox.create_index([("status", ASCENDING), ("created_at", ASCENDING)])
+        await self.db.notification_outbox.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+
+    def _build_templated_notification(self, user_id: str, template_id: str, params: Dict, now: datetime) -> dict:
+        """Build a compact notification document: template id plus params, no rendered text"""
+        template = NOTIFICATION_TEMPLATES[template_id]
+        return {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "type": template["type"],
+            "template_id": template_id,
+            "priority": template.get("priority", NotificationPriority.MEDIUM),
+            "metadata": params or {},
+            "is_read": False,
+            # In-app delivery is the insert itself; other channels go through the outbox
+            "is_delivered": self._notification_channels(template) == [NotificationChannel.IN_APP],
+            "created_at": now
+        }
+
+    def _notification_channels(self, notification: dict) -> list:
+        """Channels stored on the notification, or those of its template"""
+        if notification.get("channels"):
+            return notification["channels"]
+        template = NOTIFICATION_TEMPLATES.get(notification.get("template_id"), {})
+        return template.get("channels", [NotificationChannel.IN_APP])
+
+    def render_notifications(self, notifications: list, locale: Optional[str] = None) -> list:
+        """Render title and message of template-stored notifications for a locale"""
+        for notification in notifications:
+            render_notification(notification, locale)
+        return notifications
+
+    def present_notifications(self, notifications: list, user: dict, locale: Optional[str] = None) -> list:
+        """Apply the user's read watermark and render in the requested or preferred language"""
+        self.apply_read_watermark(notifications, user.get("notifications_read_up_to"))
+        return self.render_notifications(notifications, locale or user.get("language"))
+
+    async def notify_many(self, recipients: List[str], template_id: str, params: Optional[Dict] = None) -> List[str]:
+        """Send the same templated notification to many users with one insert and one outbox entry"""
+        return await self.notify_batch([(user_id, template_id, params) for user_id in recipients])
+
+    async def notify_batch(self, notifications: List[tuple]) -> List[str]:
+        """Create (user_id, template_id, params) notifications with one insert and one outbox entry"""
+        if not notifications:
+            return []
+        
+        now = datetime.utcnow()
+        docs = [
+            self._build_templated_notification(user_id, template_id, params, now)
+            for user_id, template_id, params in notifications
+        ]
+        await self.db.enhanced_notifications.insert_many(docs, ordered=False)
+        
+        pending_ids = [doc["id"] for doc in docs if not doc["is_delivered"]]
+        if pending_ids:
+            await self.db.notification_outbox.insert_one({
+                "id": str(uuid.uuid4()),
+                "notification_ids": pending_ids,
+                "status": "pending",
+                "attempts": 0,
+                "created_at": now,
+                "next_attempt_at": now
+            })
+        
+        return [doc["id"] for doc in docs]
+
+    async def process_outbox(self) -> int:
+        """Deliver queued notifications through their external channels"""
+        processed = 0
+        while True:
+            now = datetime.utcnow()
+            entry = await self.db.notification_outbox.find_one_and_update(
+                {"$or": [
+                    # Entries queued before next_attempt_at existed have none and are due
+                    {"status": "pending", "next_attempt_at": {"$not": {"$gt": now}}},
+                    # Entries claimed by a worker that died mid-delivery
+                    {"status": "processing", "claimed_at": {"$lt": now - timedelta(minutes=15)}}
+                ]},
+                {"$set": {"status": "processing", "claimed_at": now}, "$inc": {"attempts": 1}},
+                sort=[("created_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER
+            )
+            if not entry:
+                return processed
+            
+            try:
+                processed += await self._deliver_outbox_entry(entry)
+                await self.db.notification_outbox.delete_one({"_id": entry["_id"]})
+            except Exception as e:
+                logger.error(f"Notification outbox entry {entry['id']} failed: {str(e)}")
+                retry = entry["attempts"] < self.outbox_max_attempts
+                await self.db.notification_outbox.update_one(
+                    {"_id": entry["_id"]},
+                    {"$set": {
+                        "status": "pending" if retry else "failed",
+                        "error": str(e),
+                        "next_attempt_at": datetime.utcnow() + timedelta(
+                            seconds=self.outbox_retry_seconds * 2 ** (entry["attempts"] - 1)
+                        )
+                    }}
+                )
+
+    async def _deliver_outbox_entry(self, entry: dict) -> int:
+        """Deliver every notification of one outbox entry, writing statuses in one bulk write"""
+        # A retried entry skips notifications an earlier attempt already delivered
+        notifications = await self.db.enhanced_notifications.find(
+            {"id": {"$in": entry["notification_ids"]}, "is_delivered": {"$ne": True}}
+        ).to_list(length=None)
+        users = await self.db.users.find(
+            {"id": {"$in": list({n["user_id"] for n in notifications})}}
+        ).to_list(length=None)
+        users_by_id = {user["id"]: user for user in users}
+        
+        updates = []
+        failed = 0
+        for notification in notifications:
+            user = users_by_id.get(notification["user_id"])
+            if not user:
+                logger.error(f"User not found for notification {notification['id']}")
+                continue
+            # Channels that succeeded on an earlier attempt are not sent again
+            previous_status = notification.get("delivery_status") or {}
+            done = {channel for channel, status in previous_status.items() if status.get("success") or status.get("queued")}
+            delivery_status = {
+                **previous_status,
+                **{_channel_value(channel): status for channel, status in (await self._deliver_to_user(user, notification, skip_channels=done)).items()}
+            }
+            undelivered = [
+                channel for channel, status in delivery_status.items()
+                if channel != NotificationChannel.IN_APP.value and not (status.get("success") or status.get("queued"))
+            ]
+            failed += bool(undelivered)
+            updates.append(UpdateOne(
+                {"id": notification["id"]},
+                {"$set": {
+                    "is_delivered": not undelivered,
+                    "delivery_status": delivery_status,
+                    "updated_at": datetime.utcnow()
+                }}
+            ))
+        
+        if updates:
+            await self.db.enhanced_notifications.bulk_write(updates, ordered=False)
+        if failed:
+            # The entry is retried with backoff; delivered notifications are skipped then
+            raise DeliveryFailedError(f"{failed} of {len(updates)} notifications were not delivered")
+        return len(updates)
+
+    async def migrate_legacy_notifications(self) -> int:
+        """Move documents from the legacy `notifications` collection into `enhanced_notifications`"""
+        cursor = self.db.notifications.find({}).batch_size(self.archive_batch_size)
+        migrated = 0
+        batch = []
+        async for notification in cursor:
+            batch.append(notification)
+            if len(batch) >= self.archive_batch_size:
+                migrated += await self._migrate_legacy_batch(batch)
+                batch = []
+        if batch:
+            migrated += await self._migrate_legacy_batch(batch)
+        
+        if migrated:
+            logger.info(f"Migrated {migrated} legacy notifications")
+        return migrated
+
+    async def _migrate_legacy_batch(self, notifications: list) -> int:
+        docs = []
+        for notification in notifications:
+            created_at = notification.get("created_at") or datetime.utcnow()
+            doc = {key: value for key, value in notification.items() if key != "_id"}
+            doc.setdefault("id", str(uuid.uuid4()))
+            doc.setdefault("metadata", {})
+            doc.setdefault("priority", NotificationPriority.MEDIUM)
+            doc.setdefault("channels", [NotificationChannel.IN_APP])
+            doc.setdefault("is_read", False)
+            doc.setdefault("is_delivered", True)
+            doc.setdefault("delivery_status", {})
+            doc.setdefault("scheduled_at", created_at)
+            doc.setdefault("expires_at", None)
+            doc.setdefault("created_at", created_at)
+            doc.setdefault("updated_at", created_at)
+            docs.append(doc)
+        
+        try:
+            await self.db.enhanced_notifications.insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Duplicate ids were copied by an earlier, interrupted run
+            if any(error["code"] != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+        
+        await self.db.notifications.delete_many({"_id": {"$in": [n["_id"] for n in notifications]}})
+        return len(docs)
 
     async def create_notification(
         self,
@@ -50,7 +835,7 @@ class EnhancedNotificationService:
     ) -> str:
         """Create an enhanced notification with multiple delivery channels"""
         
-        notification_id = str(__import__('uuid').uuid4())
+        notification_id = str(uuid.uuid4())
         notification_doc = {
             "id": notification_id,
             "user_id": user_id,
@@ -79,20 +864,43 @@ class EnhancedNotificationService:
 
     async def _deliver_notification(self, notification: dict):
         """Deliver notification through specified channels"""
-        delivery_status = {}
-        
         # Get user details
         user = await self.db.users.find_one({"id": notification["user_id"]})
         if not user:
             logger.error(f"User not found for notification {notification['id']}")
             return
         
+        delivery_status = await self._deliver_to_user(user, notification)
+        
+        # Update notification with delivery status
+        await self.db.enhanced_notifications.update_one(
+            {"id": notification["id"]},
+            {
+                "$set": {
+                    "is_delivered": any(status.get("success", False) for status in delivery_status.values()),
+                    "delivery_status": delivery_status,
+                    "updated_at": datetime.utcnow()
+                }
+            }
+        )
+
+    async def _deliver_to_user(self, user: dict, notification: dict, skip_channels: set = frozenset()) -> dict:
+        """Deliver a notification to a user through each of its channels, except `skip_channels`"""
+        delivery_status = {}
+        notification = render_notification(dict(notification), user.get("language"))
+        
         # Deliver through each channel
-        for channel in notification["channels"]:
+        for channel in self._notification_channels(notification):
+            if _channel_value(channel) in skip_channels:
+                continue
             try:
                 if channel == NotificationChannel.EMAIL and user.get("email"):
-                    success = await self._send_email(user, notification)
-                    delivery_status[channel] = {"success": success, "delivered_at": datetime.utcnow()}
+                    if self._use_digest(notification):
+                        digest_id = await self._queue_for_digest(notification)
+                        delivery_status[channel] = {"queued": True, "digest_id": digest_id, "queued_at": datetime.utcnow()}
+                    else:
+                        success = await self._send_email(user, notification)
+                        delivery_status[channel] = {"success": success, "delivered_at": datetime.utcnow()}
                 
                 elif channel == NotificationChannel.SMS and user.get("phone"):
                     success = await self._send_sms(user, notification)
@@ -110,17 +918,7 @@ class EnhancedNotificationService:
                 logger.error(f"Failed to deliver notification via {channel}: {str(e)}")
                 delivery_status[channel] = {"success": False, "error": str(e)}
         
-        # Update notification with delivery status
-        await self.db.enhanced_notifications.update_one(
-            {"id": notification["id"]},
-            {
-                "$set": {
-                    "is_delivered": any(status.get("success", False) for status in delivery_status.values()),
-                    "delivery_status": delivery_status,
-                    "updated_at": datetime.utcnow()
-                }
-            }
-        )
+        return delivery_status
 
     async def _send_email(self, user: dict, notification: dict) -> bool:
         """Send email notification"""
@@ -129,22 +927,12 @@ class EnhancedNotificationService:
             return False
         
         try:
-            msg = MIMEMultipart()
-            msg['From'] = self.from_email
-            msg['To'] = user["email"]
-            msg['Subject'] = f"🚗 {notification['title']} - Driving School Platform"
-            
-            # Create HTML email body
-            html_body = self._create_email_template(user, notification)
-            msg.attach(MIMEText(html_body, 'html'))
-            
-            # Connect and send email
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port)
-            server.starttls()
-            server.login(self.smtp_username, self.smtp_password)
-            text = msg.as_string()
-            server.sendmail(self.from_email, user["email"], text)
-            server.quit()
+            msg = self._build_email_message(
+                user["email"],
+                f"🚗 {notification['title']} - Driving School Platform",
+                self._create_email_template(user, notification)
+            )
+            await asyncio.to_thread(self._send_messages, [msg])
             
             logger.info(f"Email sent successfully to {user['email']}")
             return True
@@ -153,84 +941,209 @@ class EnhancedNotificationService:
             logger.error(f"Failed to send email: {str(e)}")
             return False
 
+    def _build_email_message(self, to_email: str, subject: str, html_body: str) -> MIMEMultipart:
+        """Build a MIME message with an HTML body"""
+        msg = MIMEMultipart()
+        msg['From'] = self.from_email
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        msg.attach(MIMEText(html_body, 'html'))
+        return msg
+
+    def _send_messages(self, messages: List[MIMEMultipart]) -> List[bool]:
+        """Send messages over a single SMTP connection (blocking, run in a thread)"""
+        results = []
+        server = smtplib.SMTP(self.smtp_server, self.smtp_port)
+        try:
+            server.starttls()
+            server.login(self.smtp_username, self.smtp_password)
+            for msg in messages:
+                try:
+                    server.sendmail(self.from_email, msg['To'], msg.as_string())
+                    results.append(True)
+                except smtplib.SMTPException as e:
+                    logger.error(f"Failed to send email to {msg['To']}: {str(e)}")
+                    results.append(False)
+        finally:
+            server.quit()
+        return results
+
     def _create_email_template(self, user: dict, notification: dict) -> str:
-        """Create HTML email template"""
-        priority_colors = {
-            "low": "#28a745",
-            "medium": "#ffc107", 
-            "high": "#fd7e14",
-            "urgent": "#dc3545"
-        }
-        
-        priority_color = priority_colors.get(notification["priority"], "#007bff")
-        
-        template = f"""
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <meta charset="utf-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-            <title>{notification['title']}</title>
-        </head>
-        <body style="font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f4f4f4;">
-            <div style="max-width: 600px; margin: 0 auto; background-color: white; border-radius: 8px; overflow: hidden; box-shadow: 0 2px 10px rgba(0,0,0,0.1);">
-                
-                <!-- Header -->
-                <div style="background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 30px; text-align: center;">
-                    <h1 style="margin: 0; font-size: 28px;">🚗 Driving School Platform</h1>
-                    <p style="margin: 10px 0 0 0; opacity: 0.9;">مدرسة تعليم القيادة الجزائرية</p>
-                </div>
-                
-                <!-- Priority Badge -->
-                <div style="padding: 20px; border-left: 4px solid {priority_color}; background-color: #f8f9fa;">
-                    <div style="display: inline-block; background-color: {priority_color}; color: white; padding: 4px 12px; border-radius: 12px; font-size: 12px; font-weight: bold; text-transform: uppercase;">
-                        {notification['priority']} Priority
-                    </div>
-                </div>
-                
-                <!-- Content -->
-                <div style="padding: 30px;">
-                    <h2 style="color: #333; margin-top: 0;">{notification['title']}</h2>
-                    <p style="color: #666; line-height: 1.6; font-size: 16px;">{notification['message']}</p>
-                    
-                    <!-- Metadata -->
-                    {self._format_metadata_for_email(notification.get('metadata', {}))}
-                </div>
-                
-                <!-- CTA Button -->
-                <div style="padding: 0 30px 30px;">
-                    <a href="{os.environ.get('FRONTEND_URL', 'http://localhost:3000')}/dashboard" 
-                       style="display: inline-block; background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 12px 30px; text-decoration: none; border-radius: 25px; font-weight: bold;">
-                        Open Dashboard
-                    </a>
-                </div>
-                
-                <!-- Footer -->
-                <div style="background-color: #f8f9fa; padding: 20px; text-align: center; color: #666; font-size: 14px;">
-                    <p style="margin: 0;">This is an automated message from the Driving School Platform</p>
-                    <p style="margin: 5px 0 0 0;">🇩🇿 Algeria Driving Education System</p>
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        return template
+        """Create HTML email for a single notification"""
+        priority = _priority_value(notification["priority"])
+        content = _NOTIFICATION_CONTENT_TEMPLATE.substitute(
+            priority_badge=_priority_badge(priority),
+            title=notification['title'],
+            message=notification['message'],
+            metadata=self._format_metadata_for_email(notification.get('metadata', {}))
+        )
+        return _EMAIL_LAYOUT_TEMPLATE.substitute(
+            title=notification['title'],
+            content=content,
+            frontend_url=self.frontend_url
+        )
+
+    def _create_digest_email_template(self, user: dict, items: List[dict]) -> str:
+        """Create one HTML email summarising several notifications"""
+        rendered_items = "".join(
+            _DIGEST_ITEM_TEMPLATE.substitute(
+                priority_color=_priority_color(_priority_value(item["priority"])),
+                priority=_priority_value(item["priority"]),
+                title=item["title"],
+                message=item["message"],
+                metadata=self._format_metadata_for_email(item.get("metadata", {}))
+            )
+            for item in items
+        )
+        title = f"You have {len(items)} new notifications"
+        content = _DIGEST_CONTENT_TEMPLATE.substitute(title=title, items=rendered_items)
+        return _EMAIL_LAYOUT_TEMPLATE.substitute(
+            title=title,
+            content=content,
+            frontend_url=self.frontend_url
+        )
 
     def _format_metadata_for_email(self, metadata: dict) -> str:
         """Format metadata for email display"""
         if not metadata:
             return ""
         
-        html = "<div style='background-color: #f8f9fa; padding: 15px; border-radius: 6px; margin-top: 20px;'>"
-        html += "<h4 style='margin: 0 0 10px 0; color: #495057;'>Additional Information:</h4>"
+        rows = "".join(
+            _METADATA_ROW_TEMPLATE.substitute(key=_format_metadata_key(key), value=value)
+            for key, value in metadata.items()
+            if key not in ['internal_id', 'system_data']  # Skip internal keys
+        )
+        return _METADATA_BLOCK_TEMPLATE.substitute(rows=rows)
+
+    def _use_digest(self, notification: dict) -> bool:
+        """Urgent notifications always bypass the digest"""
+        return (
+            self.digest_window_minutes > 0
+            and _priority_value(notification["priority"]) != NotificationPriority.URGENT.value
+        )
+
+    async def _queue_for_digest(self, notification: dict) -> str:
+        """Append a notification to the user's open digest, opening one if needed"""
+        now = datetime.utcnow()
+        item = {
+            "notification_id": notification["id"],
+            "title": notification["title"],
+            "message": notification["message"],
+            "priority": _priority_value(notification["priority"]),
+            "metadata": notification.get("metadata", {}),
+            "created_at": notification["created_at"]
+        }
+        update = {
+            "$push": {"items": item},
+            "$setOnInsert": {
+                "id": str(uuid.uuid4()),
+                "opened_at": now,
+                "flush_after": now + timedelta(minutes=self.digest_window_minutes)
+            }
+        }
         
-        for key, value in metadata.items():
-            if key not in ['internal_id', 'system_data']:  # Skip internal keys
-                formatted_key = key.replace('_', ' ').title()
-                html += f"<p style='margin: 5px 0; color: #6c757d;'><strong>{formatted_key}:</strong> {value}</p>"
+        for attempt in range(2):
+            try:
+                digest = await self.db.notification_digests.find_one_and_update(
+                    {"user_id": notification["user_id"], "status": "open"},
+                    update,
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                    projection={"id": 1}
+                )
+                return digest["id"]
+            except DuplicateKeyError:
+                # Another request opened the digest concurrently; retry as a plain append
+                if attempt:
+                    raise
+
+    async def flush_digests(self) -> int:
+        """Send every digest whose window has closed, one email per user over a single SMTP connection"""
+        sent = 0
+        while True:
+            digests = []
+            for _ in range(self.digest_batch_size):
+                # Claim digests one by one so concurrent flushers never send the same digest twice
+                now = datetime.utcnow()
+                digest = await self.db.notification_digests.find_one_and_update(
+                    {"$or": [
+                        {"status": "open", "flush_after": {"$lte": now}},
+                        # Reclaim digests left behind by a flusher that died mid-send
+                        {"status": "sending", "claimed_at": {"$lt": now - timedelta(minutes=15)}}
+                    ]},
+                    {"$set": {"status": "sending", "claimed_at": now}},
+                    sort=[("flush_after", ASCENDING)],
+                    return_document=ReturnDocument.AFTER
+                )
+                if not digest:
+                    break
+                digests.append(digest)
+            
+            if not digests:
+                return sent
+            sent += await self._send_digests(digests)
+
+    async def _send_digests(self, digests: List[dict]) -> int:
+        """Render and send a batch of claimed digests, then record delivery status"""
+        users = await self.db.users.find(
+            {"id": {"$in": [d["user_id"] for d in digests]}},
+            {"id": 1, "email": 1, "full_name": 1}
+        ).to_list(length=None)
+        users_by_id = {user["id"]: user for user in users}
+        
+        deliverable = []
+        messages = []
+        for digest in digests:
+            user = users_by_id.get(digest["user_id"])
+            if not user or not user.get("email"):
+                continue
+            items = digest["items"]
+            if len(items) == 1:
+                subject = f"🚗 {items[0]['title']} - Driving School Platform"
+                html_body = self._create_email_template(user, items[0])
+            else:
+                subject = f"🚗 {len(items)} new notifications - Driving School Platform"
+                html_body = self._create_digest_email_template(user, items)
+            deliverable.append(digest)
+            messages.append(self._build_email_message(user["email"], subject, html_body))
+        
+        results = [False] * len(messages)
+        if messages:
+            if not self.smtp_username or not self.smtp_password:
+                logger.warning("SMTP credentials not configured")
+            else:
+                try:
+                    results = await asyncio.to_thread(self._send_messages, messages)
+                except Exception as e:
+                    logger.error(f"Failed to send digest emails: {str(e)}")
         
-        html += "</div>"
-        return html
+        now = datetime.utcnow()
+        status_by_digest = {digest["id"]: success for digest, success in zip(deliverable, results)}
+        digest_updates = []
+        notification_updates = []
+        for digest in digests:
+            success = status_by_digest.get(digest["id"], False)
+            digest_updates.append(UpdateOne(
+                {"_id": digest["_id"]},
+                {"$set": {"status": "sent" if success else "failed", "sent_at": now}}
+            ))
+            notification_ids = [item["notification_id"] for item in digest["items"]]
+            notification_updates.append(UpdateMany(
+                {"id": {"$in": notification_ids}},
+                {"$set": {
+                    f"delivery_status.{NotificationChannel.EMAIL.value}": {
+                        "success": success, "digest_id": digest["id"], "delivered_at": now
+                    },
+                    "updated_at": now
+                }}
+            ))
+        
+        await self.db.notification_digests.bulk_write(digest_updates, ordered=False)
+        await self.db.enhanced_notifications.bulk_write(notification_updates, ordered=False)
+        
+        sent = sum(1 for success in results if success)
+        logger.info(f"Sent {sent} digest emails covering {sum(len(d['items']) for d in digests)} notifications")
+        return sent
 
     async def _send_sms(self, user: dict, notification: dict) -> bool:
         """Send SMS notification (placeholder for SMS service integration)"""
@@ -258,6 +1171,7 @@ class EnhancedNotificationService:
             "status": "scheduled"
         })
         
+        reminders = []
         async for session in sessions_cursor:
             # Check if reminder already sent
             existing_reminder = await self.db.enhanced_notifications.find_one({
@@ -267,15 +1181,11 @@ class EnhancedNotificationService:
             })
             
             if not existing_reminder:
-                await self.create_notification(
-                    user_id=session["student_id"],
-                    notification_type="session_reminder",
-                    title="Session Reminder",
-                    message=f"You have a {session['session_type']} session scheduled for tomorrow at {session['scheduled_at'].strftime('%H:%M')}",
-                    priority=NotificationPriority.HIGH,
-                    channels=[NotificationChannel.EMAIL, NotificationChannel.IN_APP],
-                    metadata={"session_id": session["id"], "session_type": session["session_type"]}
-                )
+                reminders.append((session["student_id"], "session_reminder", {
+                    "session_id": session["id"],
+                    "session_type": session["session_type"],
+                    "session_time": session["scheduled_at"].strftime('%H:%M')
+                }))
         
         # Payment reminders (for pending payments older than 3 days)
         three_days_ago = now - timedelta(days=3)
@@ -295,15 +1205,13 @@ class EnhancedNotificationService:
             
             if not recent_reminder:
                 school = await self.db.driving_schools.find_one({"id": enrollment["driving_school_id"]})
-                await self.create_notification(
-                    user_id=enrollment["student_id"],
-                    notification_type="payment_reminder",
-                    title="Payment Reminder",
-                    message=f"Your enrollment payment for {school['name'] if school else 'driving school'} is still pending. Please complete your payment to continue.",
-                    priority=NotificationPriority.MEDIUM,
-                    channels=[NotificationChannel.EMAIL, NotificationChannel.IN_APP],
-                    metadata={"enrollment_id": enrollment["id"], "amount": enrollment["amount"]}
-                )
+                reminders.append((enrollment["student_id"], "payment_reminder", {
+                    "enrollment_id": enrollment["id"],
+                    "amount": enrollment["amount"],
+                    "school_name": school['name'] if school else 'driving school'
+                }))
+        
+        await self.notify_batch(reminders)
 
     async def get_user_notifications(
         self,
@@ -311,38 +1219,26 @@ class EnhancedNotificationService:
         limit: int = 50,
         skip: int = 0,
         only_unread: bool = False,
-        priority_filter: Optional[NotificationPriority] = None
+        priority_filter: Optional[NotificationPriority] = None,
+        locale: Optional[str] = None
     ) -> dict:
         """Get enhanced notifications for a user"""
-        query = {"user_id": user_id}
-        
-        if only_unread:
-            query["is_read"] = False
+        watermark = await self.get_read_watermark(user_id)
+        query = self._unread_query(user_id, watermark) if only_unread else {"user_id": user_id}
             
         if priority_filter:
             query["priority"] = priority_filter
         
-        # Filter out expired notifications
-        now = datetime.utcnow()
-        query["$or"] = [
-            {"expires_at": None},
-            {"expires_at": {"$gte": now}}
-        ]
-        
+        # Expired notifications are removed by the expires_at TTL index
         notifications_cursor = self.db.enhanced_notifications.find(query).sort("created_at", -1).skip(skip).limit(limit)
         notifications = await notifications_cursor.to_list(length=limit)
         
-        total_unread = await self.db.enhanced_notifications.count_documents({
-            "user_id": user_id,
-            "is_read": False,
-            "$or": [
-                {"expires_at": None},
-                {"expires_at": {"$gte": now}}
-            ]
-        })
+        total_unread = await self.count_unread(user_id, watermark)
         
         return {
-            "notifications": self._serialize_notifications(notifications),
+            "notifications": self._serialize_notifications(
+                self.render_notifications(self.apply_read_watermark(notifications, watermark), locale)
+            ),
             "total_unread": total_unread,
             "limit": limit,
             "skip": skip
@@ -363,22 +1259,89 @@ class EnhancedNotificationService:
             serialized.append(serialized_notification)
         return serialized
 
+    # Read state: a notification is read if its own is_read flag is set or if it was
+    # created at or before the user's `notifications_read_up_to` watermark.
+
+    async def get_read_watermark(self, user_id: str) -> Optional[datetime]:
+        """Get the user's read-up-to watermark"""
+        user = await self.db.users.find_one({"id": user_id}, {"notifications_read_up_to": 1})
+        return user.get("notifications_read_up_to") if user else None
+
+    def _unread_query(self, user_id: str, watermark: Optional[datetime]) -> dict:
+        query = {"user_id": user_id, "is_read": False}
+        if watermark:
+            query["created_at"] = {"$gt": watermark}
+        return query
+
+    async def count_unread(self, user_id: str, watermark: Optional[datetime]) -> int:
+        """Count unread notifications (served by the user_id/is_read/created_at index)"""
+        return await self.db.enhanced_notifications.count_documents(self._unread_query(user_id, watermark))
+
+    def apply_read_watermark(self, notifications: list, watermark: Optional[datetime]) -> list:
+        """Set is_read on notifications covered by the watermark"""
+        if watermark:
+            for notification in notifications:
+                if not notification.get("is_read") and notification.get("created_at") and notification["created_at"] <= watermark:
+                    notification["is_read"] = True
+        return notifications
+
     async def mark_as_read(self, notification_id: str, user_id: str) -> bool:
         """Mark notification as read"""
         result = await self.db.enhanced_notifications.update_one(
             {"id": notification_id, "user_id": user_id},
             {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
         )
-        return result.modified_count > 0
+        return result.matched_count > 0
 
-    async def mark_all_as_read(self, user_id: str) -> int:
-        """Mark all notifications as read for a user"""
+    async def mark_many_as_read(self, notification_ids: List[str], user_id: str) -> int:
+        """Mark a batch of notifications as read with a single write"""
+        if not notification_ids:
+            return 0
         result = await self.db.enhanced_notifications.update_many(
-            {"user_id": user_id, "is_read": False},
+            {"id": {"$in": notification_ids}, "user_id": user_id, "is_read": False},
             {"$set": {"is_read": True, "read_at": datetime.utcnow()}}
         )
         return result.modified_count
 
+    async def mark_all_as_read(self, user_id: str) -> datetime:
+        """Mark all notifications as read for a user by advancing the watermark"""
+        now = datetime.utcnow()
+        await self.db.users.update_one(
+            {"id": user_id},
+            {"$max": {"notifications_read_up_to": now}}
+        )
+        return now
+
+    async def materialize_read_watermarks(self) -> int:
+        """Copy watermarks onto the per-item flags of notifications about to reach retention.
+
+        Retention only archives notifications flagged is_read, so this keeps
+        watermark-read notifications eligible without touching recent ones.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        users = self.db.users.find(
+            {"notifications_read_up_to": {"$exists": True}},
+            {"id": 1, "notifications_read_up_to": 1}
+        ).batch_size(self.archive_batch_size)
+        
+        updated = 0
+        updates = []
+        async for user in users:
+            updates.append(UpdateMany(
+                {
+                    "user_id": user["id"],
+                    "is_read": False,
+                    "created_at": {"$lte": min(user["notifications_read_up_to"], cutoff)}
+                },
+                {"$set": {"is_read": True, "read_at": user["notifications_read_up_to"]}}
+            ))
+            if len(updates) >= self.archive_batch_size:
+                updated += (await self.db.enhanced_notifications.bulk_write(updates, ordered=False)).modified_count
+                updates = []
+        if updates:
+            updated += (await self.db.enhanced_notifications.bulk_write(updates, ordered=False)).modified_count
+        return updated
+
     async def delete_notification(self, notification_id: str, user_id: str) -> bool:
         """Delete a notification"""
         result = await self.db.enhanced_notifications.delete_one({
@@ -389,42 +1352,112 @@ class EnhancedNotificationService:
 
     async def get_notification_stats(self, user_id: str) -> dict:
         """Get notification statistics for a user"""
-        now = datetime.utcnow()
-        
-        total_notifications = await self.db.enhanced_notifications.count_documents({
-            "user_id": user_id,
-            "$or": [
-                {"expires_at": None},
-                {"expires_at": {"$gte": now}}
-            ]
-        })
+        watermark = await self.get_read_watermark(user_id)
+        is_read = {"$or": ["$is_read", {"$lte": ["$created_at", watermark]}]} if watermark else "$is_read"
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {
+                "$group": {
+                    "_id": {"is_read": is_read, "priority": "$priority"},
+                    "count": {"$sum": 1}
+                }
+            }
+        ]
+        results = await self.db.enhanced_notifications.aggregate(pipeline).to_list(length=None)
         
-        unread_notifications = await self.db.enhanced_notifications.count_documents({
-            "user_id": user_id,
-            "is_read": False,
-            "$or": [
-                {"expires_at": None},
-                {"expires_at": {"$gte": now}}
-            ]
-        })
+        total_notifications = 0
+        unread_notifications = 0
+        priority_counts = {priority: 0 for priority in NotificationPriority}
         
-        # Count by priority
-        priority_counts = {}
-        for priority in NotificationPriority:
-            count = await self.db.enhanced_notifications.count_documents({
-                "user_id": user_id,
-                "priority": priority,
-                "is_read": False,
-                "$or": [
-                    {"expires_at": None},
-                    {"expires_at": {"$gte": now}}
-                ]
-            })
-            priority_counts[priority] = count
+        for result in results:
+            total_notifications += result["count"]
+            if not result["_id"].get("is_read"):
+                unread_notifications += result["count"]
+                priority = result["_id"].get("priority")
+                if priority in priority_counts:
+                    priority_counts[priority] += result["count"]
         
         return {
             "total_notifications": total_notifications,
             "unread_notifications": unread_notifications,
             "unread_by_priority": priority_counts,
             "read_percentage": round((total_notifications - unread_notifications) / total_notifications * 100, 1) if total_notifications > 0 else 0
-        }
\ No newline at end of file
+        }
+
+    async def archive_read_notifications(self, collection_name: str = "enhanced_notifications") -> int:
+        """Move read notifications older than the retention window into compressed monthly archives"""
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        
+        cursor = self.db[collection_name].find({
+            "is_read": True,
+            "created_at": {"$lt": cutoff}
+        }).sort("created_at", 1).batch_size(self.archive_batch_size)
+        
+        archived = 0
+        batch = []
+        async for notification in cursor:
+            batch.append(notification)
+            if len(batch) >= self.archive_batch_size:
+                archived += await self._archive_batch(collection_name, batch)
+                batch = []
+        
+        if batch:
+            archived += await self._archive_batch(collection_name, batch)
+        
+        if archived:
+            logger.info(f"Archived {archived} read notifications from {collection_name}")
+        return archived
+
+    async def _archive_batch(self, collection_name: str, notifications: list) -> int:
+        """Write one compressed archive chunk per month, then delete the originals"""
+        by_month = {}
+        for notification in notifications:
+            month = notification["created_at"].strftime("%Y-%m")
+            by_month.setdefault(month, []).append(notification)
+        
+        archive_docs = []
+        for month, month_notifications in by_month.items():
+            archive_docs.append({
+                "id": str(uuid.uuid4()),
+                "source": collection_name,
+                "month": month,
+                "count": len(month_notifications),
+                "user_ids": sorted({n["user_id"] for n in month_notifications}),
+                "encoding": ARCHIVE_ENCODING,
+                "payload": Binary(encode_archive(month_notifications)),
+                "archived_at": datetime.utcnow()
+            })
+        
+        await self.db.notifications_archive.insert_many(archive_docs)
+        result = await self.db[collection_name].delete_many({
+            "_id": {"$in": [n["_id"] for n in notifications]}
+        })
+        return result.deleted_count
+
+    async def get_archived_notifications(
+        self,
+        user_id: str,
+        month: str,
+        collection_name: str = "enhanced_notifications",
+        locale: Optional[str] = None
+    ) -> list:
+        """Read a user's archived notifications for a month (YYYY-MM)"""
+        archives = self.db.notifications_archive.find({
+            "source": collection_name,
+            "month": month,
+            "user_ids": user_id
+        })
+        
+        notifications = []
+        async for archive in archives:
+            chunk = decode_archive(archive["payload"], archive.get("encoding"))
+            notifications.extend(n for n in chunk if n.get("user_id") == user_id)
+        return self._serialize_notifications(self.render_notifications(notifications, locale))
+
+    async def run_retention(self) -> Dict[str, int]:
+        """Apply the retention policy to both notification collections"""
+        await self.materialize_read_watermarks()
+        return {
+            collection_name: await self.archive_read_notifications(collection_name)
+            for collection_name in ("enhanced_notifications", "notifications")
+        }
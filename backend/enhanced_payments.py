@@ -3,13 +3,15 @@ import os
 import json
 import hmac
 import hashlib
-import requests
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List
 from enum import Enum
 import uuid
 import logging
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from external_integrations import BaridiMobClient
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +37,26 @@ class RefundStatus(str, Enum):
     COMPLETED = "completed"
     DENIED = "denied"
 
+class WebhookEventStatus(str, Enum):
+    PENDING = "pending"
+    PROCESSING = "processing"
+    PROCESSED = "processed"
+    FAILED = "failed"
+
+# Statuses a payment may move from when entering a given status. Anything else
+# (including re-applying the current status) is a no-op, which makes redelivered
+# or out-of-order gateway events harmless.
+ALLOWED_STATUS_TRANSITIONS = {
+    PaymentStatus.PROCESSING: [PaymentStatus.PENDING],
+    PaymentStatus.COMPLETED: [PaymentStatus.PENDING, PaymentStatus.PROCESSING, PaymentStatus.FAILED, PaymentStatus.EXPIRED],
+    PaymentStatus.FAILED: [PaymentStatus.PENDING, PaymentStatus.PROCESSING],
+    PaymentStatus.EXPIRED: [PaymentStatus.PENDING, PaymentStatus.PROCESSING],
+    PaymentStatus.REFUNDED: [PaymentStatus.COMPLETED]
+}
+
+def _status_value(status) -> str:
+    return getattr(status, "value", status)
+
 class EnhancedPaymentService:
     def __init__(self, db_client):
         self.db = db_client.driving_school_platform
@@ -44,6 +66,7 @@ class EnhancedPaymentService:
         self.baridimob_secret = os.environ.get('BARIDIMOB_SECRET')
         self.baridimob_merchant_id = os.environ.get('BARIDIMOB_MERCHANT_ID')
         self.baridimob_base_url = os.environ.get('BARIDIMOB_BASE_URL', 'https://api.baridimob.dz')
+        self.baridimob_client = BaridiMobClient(self.baridimob_api_key, self.baridimob_base_url)
         
         # CCP Configuration  
         self.ccp_api_key = os.environ.get('CCP_API_KEY')
@@ -52,6 +75,42 @@ class EnhancedPaymentService:
         # General Configuration
         self.payment_timeout_minutes = int(os.environ.get('PAYMENT_TIMEOUT_MINUTES', '30'))
         self.webhook_secret = os.environ.get('PAYMENT_WEBHOOK_SECRET', 'default-webhook-secret')
+        
+        # Webhook inbox processing
+        self.webhook_max_attempts = int(os.environ.get('PAYMENT_WEBHOOK_MAX_ATTEMPTS', '5'))
+        self.webhook_retry_seconds = int(os.environ.get('PAYMENT_WEBHOOK_RETRY_SECONDS', '30'))
+        
+        # Expired payment sweeper
+        self.sweep_batch_size = int(os.environ.get('PAYMENT_SWEEP_BATCH_SIZE', '500'))
+        
+        self._notification_service = None
+
+    @property
+    def notification_service(self):
+        """Notification service sharing this service's Mongo client"""
+        if self._notification_service is None:
+            from enhanced_notifications import EnhancedNotificationService
+            self._notification_service = EnhancedNotificationService(self.db.client)
+        return self._notification_service
+
+    async def ensure_indexes(self):
+        """Create the indexes used by payment lookups and the webhook inbox"""
+        await self.db.enhanced_payments.create_index([("id", ASCENDING)], unique=True)
+        await self.db.enhanced_payments.create_index([("status", ASCENDING), ("expires_at", ASCENDING)])
+        await self.db.payment_daily_rollups.create_index([("school_id", ASCENDING), ("date", ASCENDING)])
+        await self.db.payment_daily_rollups.create_index([("date", ASCENDING)])
+        # Gateway retries of the same status event collapse onto one inbox event,
+        # while later status events of the same transaction are still recorded
+        if "provider_transaction_unique" in await self.db.payment_webhook_inbox.index_information():
+            await self.db.payment_webhook_inbox.drop_index("provider_transaction_unique")
+        await self.db.payment_webhook_inbox.create_index(
+            [("provider", ASCENDING), ("transaction_id", ASCENDING), ("gateway_status", ASCENDING)],
+            unique=True,
+            name="provider_transaction_status_unique"
+        )
+        await self.db.payment_webhook_inbox.create_index(
+            [("status", ASCENDING), ("next_attempt_at", ASCENDING)]
+        )
 
     async def create_payment_intent(
         self,
@@ -92,7 +151,9 @@ class EnhancedPaymentService:
             "updated_at": datetime.utcnow(),
             "payment_attempts": [],
             "refund_status": RefundStatus.NOT_REQUESTED,
-            "payment_gateway_data": {}
+            "payment_gateway_data": {},
+            # Counted in payment_daily_rollups from creation onwards
+            "rollup_counted": True
         }
         
         # Process based on payment method
@@ -117,6 +178,10 @@ class EnhancedPaymentService:
         # Save payment intent
         await self.db.enhanced_payments.insert_one(payment_doc)
         
+        rollups = {}
+        self._add_to_rollups(rollups, payment_doc, payment_doc["status"], 1)
+        await self._apply_rollups(rollups)
+        
         # Update enrollment payment status
         await self.db.enrollments.update_one(
             {"id": enrollment_id},
@@ -154,29 +219,13 @@ class EnhancedPaymentService:
                 "webhook_url": f"{os.environ.get('BACKEND_URL', 'http://localhost:8001')}/api/payments/webhook/baridimob"
             }
             
-            headers = {
-                "Authorization": f"Bearer {self.baridimob_api_key}",
-                "Content-Type": "application/json"
+            data = await self.baridimob_client.create_payment(payload)
+            return {
+                "payment_id": data.get("payment_id"),
+                "payment_url": data.get("payment_url"),
+                "reference": data.get("reference"),
+                "expires_at": data.get("expires_at")
             }
-            
-            response = requests.post(
-                f"{self.baridimob_base_url}/v1/payments",
-                json=payload,
-                headers=headers,
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                data = response.json()
-                return {
-                    "payment_id": data.get("payment_id"),
-                    "payment_url": data.get("payment_url"),
-                    "reference": data.get("reference"),
-                    "expires_at": data.get("expires_at")
-                }
-            else:
-                logger.error(f"BaridiMob payment creation failed: {response.text}")
-                raise Exception("Failed to create BaridiMob payment")
                 
         except Exception as e:
             logger.error(f"BaridiMob API error: {str(e)}")
@@ -214,18 +263,92 @@ class EnhancedPaymentService:
         }
 
     async def process_webhook(self, provider: str, payload: dict, signature: str) -> Dict:
-        """Process payment webhook from providers"""
+        """Verify and durably record a payment webhook; the state change is applied by the inbox worker"""
         
         # Verify webhook signature
         if not self._verify_webhook_signature(provider, payload, signature):
             raise ValueError("Invalid webhook signature")
         
-        if provider == "baridimob":
-            return await self._process_baridimob_webhook(payload)
-        elif provider == "ccp":
-            return await self._process_ccp_webhook(payload)
-        else:
+        if provider not in ("baridimob", "ccp"):
             raise ValueError(f"Unsupported payment provider: {provider}")
+        
+        payment_id = payload.get("order_id")
+        if not payment_id:
+            raise ValueError("Missing payment ID in webhook")
+        
+        # One inbox event per (transaction, status): a "pending" event must not
+        # swallow the "completed" or "failed" one that follows. Providers that
+        # omit a transaction id are keyed by the payment instead.
+        transaction_id = payload.get("transaction_id") or payment_id
+        gateway_status = str(payload.get("status"))
+        now = datetime.utcnow()
+        event_id = str(uuid.uuid4())
+        
+        try:
+            await self.db.payment_webhook_inbox.insert_one({
+                "id": event_id,
+                "provider": provider,
+                "transaction_id": transaction_id,
+                "gateway_status": gateway_status,
+                "payment_id": payment_id,
+                "payload": payload,
+                "status": WebhookEventStatus.PENDING,
+                "attempts": 0,
+                "received_at": now,
+                "next_attempt_at": now
+            })
+        except DuplicateKeyError:
+            return {"status": "duplicate", "payment_id": payment_id}
+        
+        return {"status": "accepted", "event_id": event_id, "payment_id": payment_id}
+
+    async def process_webhook_inbox(self) -> int:
+        """Apply pending webhook events; safe to run concurrently on several workers"""
+        processed = 0
+        while True:
+            now = datetime.utcnow()
+            event = await self.db.payment_webhook_inbox.find_one_and_update(
+                {"$or": [
+                    {"status": WebhookEventStatus.PENDING, "next_attempt_at": {"$lte": now}},
+                    # Events claimed by a worker that died mid-processing
+                    {"status": WebhookEventStatus.PROCESSING, "claimed_at": {"$lt": now - timedelta(minutes=10)}}
+                ]},
+                {"$set": {"status": WebhookEventStatus.PROCESSING, "claimed_at": now}, "$inc": {"attempts": 1}},
+                sort=[("next_attempt_at", ASCENDING)],
+                return_document=ReturnDocument.AFTER
+            )
+            if not event:
+                return processed
+            
+            try:
+                if event["provider"] == "baridimob":
+                    result = await self._process_baridimob_webhook(event["payload"])
+                else:
+                    result = await self._process_ccp_webhook(event["payload"])
+                
+                await self.db.payment_webhook_inbox.update_one(
+                    {"_id": event["_id"]},
+                    {"$set": {
+                        "status": WebhookEventStatus.PROCESSED,
+                        "result": result,
+                        "processed_at": datetime.utcnow()
+                    }}
+                )
+                processed += 1
+            
+            except Exception as e:
+                logger.error(f"Payment webhook {event['id']} failed: {str(e)}")
+                retry = event["attempts"] < self.webhook_max_attempts
+                await self.db.payment_webhook_inbox.update_one(
+                    {"_id": event["_id"]},
+                    {"$set": {
+                        "status": WebhookEventStatus.PENDING if retry else WebhookEventStatus.FAILED,
+                        "error": str(e),
+                        "next_attempt_at": datetime.utcnow() + timedelta(
+                            seconds=self.webhook_retry_seconds * 2 ** (event["attempts"] - 1)
+                        )
+                    }}
+                )
 
     def _verify_webhook_signature(self, provider: str, payload: dict, signature: str) -> bool:
         """Verify webhook signature"""
@@ -247,10 +370,6 @@ class EnhancedPaymentService:
         if not payment_id:
             raise ValueError("Missing payment ID in webhook")
         
-        payment = await self.db.enhanced_payments.find_one({"id": payment_id})
-        if not payment:
-            raise ValueError("Payment not found")
-        
         # Map BaridiMob status to our status
         status_mapping = {
             "completed": PaymentStatus.COMPLETED,
@@ -262,17 +381,26 @@ class EnhancedPaymentService:
         new_status = status_mapping.get(status, PaymentStatus.PENDING)
         
         # Update payment
-        await self._update_payment_status(payment_id, new_status, {
+        applied = await self._update_payment_status(payment_id, new_status, {
             "gateway_transaction_id": payload.get("transaction_id"),
             "gateway_reference": payload.get("reference"),
             "gateway_fee": payload.get("fee", 0),
             "processed_at": datetime.utcnow()
         })
         
-        return {"status": "processed", "payment_id": payment_id}
+        return {"status": "processed" if applied else "ignored", "payment_id": payment_id}
 
-    async def _update_payment_status(self, payment_id: str, status: PaymentStatus, metadata: Dict = None):
-        """Update payment status and handle side effects"""
+    async def _process_ccp_webhook(self, payload: dict) -> Dict:
+        """Process CCP webhook (same order_id/status/transaction_id payload as BaridiMob)"""
+        return await self._process_baridimob_webhook(payload)
+
+    async def _update_payment_status(self, payment_id: str, status: PaymentStatus, metadata: Dict = None) -> bool:
+        """Update payment status and handle side effects.
+
+        The transition is applied atomically and only from an allowed previous
+        status, so side effects run at most once per transition. Returns False
+        when the payment does not exist or the transition was not applicable.
+        """
         
         update_data = {
             "status": status,
@@ -283,15 +411,23 @@ class EnhancedPaymentService:
             update_data["gateway_metadata"] = metadata
         
         # Update payment
-        await self.db.enhanced_payments.update_one(
-            {"id": payment_id},
-            {"$set": update_data}
+        previous = await self.db.enhanced_payments.find_one_and_update(
+            {"id": payment_id, "status": {"$in": ALLOWED_STATUS_TRANSITIONS.get(status, [])}},
+            {"$set": update_data},
+            return_document=ReturnDocument.BEFORE
         )
-        
-        # Get payment details
-        payment = await self.db.enhanced_payments.find_one({"id": payment_id})
-        if not payment:
-            return
+        if not previous:
+            if not await self.db.enhanced_payments.find_one({"id": payment_id}, {"_id": 1}):
+                raise ValueError("Payment not found")
+            return False
+        payment = {**previous, **update_data}
+        
+        # Move the payment between status buckets of its daily rollup
+        if previous.get("rollup_counted"):
+            rollups = {}
+            self._add_to_rollups(rollups, previous, previous["status"], -1)
+            self._add_to_rollups(rollups, previous, status, 1)
+            await self._apply_rollups(rollups)
         
         # Update enrollment based on payment status
         if status == PaymentStatus.COMPLETED:
@@ -322,33 +458,15 @@ class EnhancedPaymentService:
                 "amount": payment["amount"],
                 "payment_method": payment["payment_method"]
             })
+        
+        return True
 
     async def _send_payment_notification(self, user_id: str, notification_type: str, metadata: Dict):
         """Send payment-related notifications"""
-        from enhanced_notifications import EnhancedNotificationService, NotificationPriority, NotificationChannel
-        
-        notification_service = EnhancedNotificationService(self.db._client)
-        
         if notification_type == "payment_completed":
-            await notification_service.create_notification(
-                user_id=user_id,
-                notification_type="payment_completed",
-                title="Payment Successful! 💳",
-                message=f"Your payment of {metadata['amount']} DZD has been processed successfully. You can now upload your documents to complete enrollment.",
-                priority=NotificationPriority.HIGH,
-                channels=[NotificationChannel.EMAIL, NotificationChannel.IN_APP],
-                metadata=metadata
-            )
+            await self.notification_service.notify_many([user_id], "payment_succeeded", metadata)
         elif notification_type == "payment_failed":
-            await notification_service.create_notification(
-                user_id=user_id,
-                notification_type="payment_failed",
-                title="Payment Failed ❌",
-                message=f"Your payment of {metadata['amount']} DZD could not be processed. Please try again or contact support.",
-                priority=NotificationPriority.HIGH,
-                channels=[NotificationChannel.EMAIL, NotificationChannel.IN_APP],
-                metadata=metadata
-            )
+            await self.notification_service.notify_many([user_id], "payment_failed", metadata)
 
     async def get_payment_details(self, payment_id: str, user_id: str = None) -> Dict:
         """Get payment details"""
@@ -414,33 +532,42 @@ class EnhancedPaymentService:
         return {"refund_id": refund_id, "status": "requested"}
 
     async def get_payment_statistics(self, school_id: str = None, date_from: datetime = None, date_to: datetime = None) -> Dict:
-        """Get payment statistics"""
-        query = {}
-        
-        if school_id:
-            query["school_id"] = school_id
-        
-        if date_from or date_to:
-            date_query = {}
-            if date_from:
-                date_query["$gte"] = date_from
-            if date_to:
-                date_query["$lte"] = date_to
-            query["created_at"] = date_query
-        
-        # Aggregate statistics
-        pipeline = [
-            {"$match": query},
-            {
-                "$group": {
-                    "_id": "$status",
-                    "count": {"$sum": 1},
-                    "total_amount": {"$sum": "$amount"}
-                }
-            }
-        ]
-        
-        results = await self.db.enhanced_payments.aggregate(pipeline).to_list(length=None)
+        """Get payment statistics.
+
+        Whole days are read from payment_daily_rollups; only the partial days at
+        the edges of the range are aggregated from the payments themselves.
+        """
+        totals = {}
+        
+        rollup_from = self._next_day_start(date_from) if date_from else None
+        rollup_to = self._day_start(date_to) if date_to else None
+        if date_to and date_to - rollup_to >= timedelta(days=1) - timedelta(microseconds=1):
+            rollup_to += timedelta(days=1)  # date_to is the last instant of its day
+        
+        if rollup_from and rollup_to and rollup_from >= rollup_to:
+            # Range lies within a single day
+            await self._add_raw_statistics(totals, school_id, date_from, date_to)
+        else:
+            rollup_query = {}
+            if school_id:
+                rollup_query["school_id"] = school_id
+            if rollup_from or rollup_to:
+                rollup_query["date"] = {}
+                if rollup_from:
+                    rollup_query["date"]["$gte"] = rollup_from
+                if rollup_to:
+                    rollup_query["date"]["$lt"] = rollup_to
+            
+            async for rollup in self.db.payment_daily_rollups.find(rollup_query, {"counts": 1, "amounts": 1}):
+                for status, count in rollup.get("counts", {}).items():
+                    bucket = totals.setdefault(status, {"count": 0, "total_amount": 0})
+                    bucket["count"] += count
+                    bucket["total_amount"] += rollup.get("amounts", {}).get(status, 0)
+            
+            if date_from and rollup_from != date_from:
+                await self._add_raw_statistics(totals, school_id, date_from, rollup_from, include_end=False)
+            if date_to and rollup_to <= date_to:
+                await self._add_raw_statistics(totals, school_id, rollup_to, date_to)
         
         stats = {
             "total_payments": 0,
@@ -454,8 +581,7 @@ class EnhancedPaymentService:
             "success_rate": 0
         }
         
-        for result in results:
-            status = result["_id"]
+        for status, result in totals.items():
             count = result["count"]
             amount = result["total_amount"]
             
@@ -477,6 +603,104 @@ class EnhancedPaymentService:
         
         return stats
 
+    async def _add_raw_statistics(
+        self,
+        totals: Dict,
+        school_id: Optional[str],
+        start: datetime,
+        end: datetime,
+        include_end: bool = True
+    ):
+        """Aggregate payments created in [start, end] (at most a day) into totals"""
+        query = {"created_at": {"$gte": start, "$lte" if include_end else "$lt": end}}
+        if school_id:
+            query["school_id"] = school_id
+        
+        pipeline = [
+            {"$match": query},
+            {
+                "$group": {
+                    "_id": "$status",
+                    "count": {"$sum": 1},
+                    "total_amount": {"$sum": "$amount"}
+                }
+            }
+        ]
+        async for result in self.db.enhanced_payments.aggregate(pipeline):
+            bucket = totals.setdefault(result["_id"], {"count": 0, "total_amount": 0})
+            bucket["count"] += result["count"]
+            bucket["total_amount"] += result["total_amount"]
+
+    @staticmethod
+    def _day_start(moment: datetime) -> datetime:
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _next_day_start(self, moment: datetime) -> datetime:
+        day_start = self._day_start(moment)
+        return day_start if day_start == moment else day_start + timedelta(days=1)
+
+    def _add_to_rollups(self, rollups: Dict, payment: dict, status, sign: int):
+        """Accumulate a +1/-1 count and amount change for the payment's school and creation day"""
+        day = self._day_start(payment["created_at"])
+        rollup_id = f"{payment['school_id']}:{day.strftime('%Y-%m-%d')}"
+        rollup = rollups.setdefault(rollup_id, {"school_id": payment["school_id"], "date": day, "inc": {}})
+        status = _status_value(status)
+        inc = rollup["inc"]
+        inc[f"counts.{status}"] = inc.get(f"counts.{status}", 0) + sign
+        inc[f"amounts.{status}"] = inc.get(f"amounts.{status}", 0) + sign * payment["amount"]
+
+    async def _apply_rollups(self, rollups: Dict):
+        """Write accumulated rollup changes with one bulk upsert"""
+        if not rollups:
+            return
+        now = datetime.utcnow()
+        await self.db.payment_daily_rollups.bulk_write([
+            UpdateOne(
+                {"_id": rollup_id},
+                {
+                    "$inc": rollup["inc"],
+                    "$set": {"updated_at": now},
+                    "$setOnInsert": {"school_id": rollup["school_id"], "date": rollup["date"]}
+                },
+                upsert=True
+            )
+            for rollup_id, rollup in rollups.items()
+        ], ordered=False)
+
+    async def backfill_payment_rollups(self) -> int:
+        """Count historical payments into the daily rollups in one streaming pass.
+
+        Each payment is claimed with an atomic `rollup_counted` flip, so the
+        backfill can run while live status updates are happening and can be
+        resumed after an interruption without double counting.
+        """
+        cursor = self.db.enhanced_payments.find(
+            {"rollup_counted": {"$ne": True}},
+            {"id": 1}
+        ).batch_size(self.sweep_batch_size)
+        
+        counted = 0
+        rollups = {}
+        async for candidate in cursor:
+            payment = await self.db.enhanced_payments.find_one_and_update(
+                {"id": candidate["id"], "rollup_counted": {"$ne": True}},
+                {"$set": {"rollup_counted": True}},
+                projection={"school_id": 1, "created_at": 1, "status": 1, "amount": 1},
+                return_document=ReturnDocument.AFTER
+            )
+            if not payment or not payment.get("created_at"):
+                continue
+            self._add_to_rollups(rollups, payment, payment["status"], 1)
+            counted += 1
+            if counted % self.sweep_batch_size == 0:
+                await self._apply_rollups(rollups)
+                rollups = {}
+        
+        await self._apply_rollups(rollups)
+        if counted:
+            logger.info(f"Backfilled {counted} payments into daily rollups")
+        return counted
+
     def _serialize_payment(self, payment: dict) -> dict:
         """Serialize payment for JSON response"""
         serialized = {}
@@ -489,24 +713,81 @@ class EnhancedPaymentService:
                 serialized[key] = value
         return serialized
 
-    async def cleanup_expired_payments(self):
-        """Clean up expired payments"""
+    async def cleanup_expired_payments(self) -> int:
+        """Expire pending/processing payments past their deadline, streaming in batches"""
         now = datetime.utcnow()
         
-        # Find expired pending payments
-        expired_payments = await self.db.enhanced_payments.find({
-            "status": {"$in": [PaymentStatus.PENDING, PaymentStatus.PROCESSING]},
-            "expires_at": {"$lt": now}
-        }).to_list(length=None)
+        cursor = self.db.enhanced_payments.find(
+            {
+                "status": {"$in": [PaymentStatus.PENDING, PaymentStatus.PROCESSING]},
+                "expires_at": {"$lt": now}
+            },
+            {
+                "id": 1, "user_id": 1, "enrollment_id": 1, "school_id": 1, "amount": 1,
+                "payment_method": 1, "status": 1, "created_at": 1, "rollup_counted": 1
+            }
+        ).batch_size(self.sweep_batch_size)
+        
+        expired = 0
+        batch = []
+        async for payment in cursor:
+            batch.append(payment)
+            if len(batch) >= self.sweep_batch_size:
+                expired += await self._expire_payment_batch(batch)
+                batch = []
+        if batch:
+            expired += await self._expire_payment_batch(batch)
+        
+        logger.info(f"Marked {expired} payments as expired")
+        return expired
+
+    async def _expire_payment_batch(self, payments: List[dict]) -> int:
+        """Expire one batch of payments and their enrollments with one bulk write each"""
+        now = datetime.utcnow()
         
-        for payment in expired_payments:
-            await self._update_payment_status(payment["id"], PaymentStatus.EXPIRED)
-            
-            # Update enrollment
-            await self.db.enrollments.update_one(
-                {"id": payment["enrollment_id"]},
+        # Conditional on the status that was read, so a payment changed by a
+        # webhook since then is left alone (and its rollup bucket stays exact)
+        result = await self.db.enhanced_payments.bulk_write([
+            UpdateOne(
+                {"id": payment["id"], "status": payment["status"]},
+                {"$set": {"status": PaymentStatus.EXPIRED, "updated_at": now}}
+            )
+            for payment in payments
+        ], ordered=False)
+        
+        if result.modified_count < len(payments):
+            expired_ids = {
+                payment["id"] async for payment in self.db.enhanced_payments.find(
+                    {"id": {"$in": [p["id"] for p in payments]}, "status": PaymentStatus.EXPIRED, "updated_at": now},
+                    {"id": 1}
+                )
+            }
+            payments = [payment for payment in payments if payment["id"] in expired_ids]
+        if not payments:
+            return 0
+        
+        rollups = {}
+        for payment in payments:
+            if payment.get("rollup_counted"):
+                self._add_to_rollups(rollups, payment, payment["status"], -1)
+                self._add_to_rollups(rollups, payment, PaymentStatus.EXPIRED, 1)
+        await self._apply_rollups(rollups)
+        
+        await self.db.enrollments.bulk_write([
+            UpdateOne(
+                {"id": payment["enrollment_id"], "payment_status": {"$ne": "completed"}},
                 {"$set": {"payment_status": "failed"}}
             )
+            for payment in payments
+        ], ordered=False)
+        
+        await self.notification_service.notify_batch([
+            (payment["user_id"], "payment_expired", {
+                "payment_id": payment["id"],
+                "amount": payment["amount"],
+                "payment_method": payment["payment_method"]
+            })
+            for payment in payments
+        ])
         
-        logger.info(f"Marked {len(expired_payments)} payments as expired")
-        return len(expired_payments)
\ No newline at end of file
+        return len(payments)
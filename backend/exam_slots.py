@@ -0,0 +1,232 @@
+# Exam Slot Booking for Driving School Platform
+import uuid
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+class ExamBookingError(Exception):
+    """The course already holds an exam booking or waitlist place"""
+
+class SlotOverlapError(Exception):
+    """The expert already has an exam or slot at that time"""
+
+class ExamSlotService:
+    """Bookable exam slots published by external experts.
+
+    A slot has a `capacity` and a `booked` counter. A seat is taken by one
+    conditional findOneAndUpdate that increments `booked` only while it is
+    below capacity and nobody is waiting, so concurrent bookings need no
+    read-then-write and no locks. When a slot is full students join its
+    waitlist; a cancelled seat goes to the first student waiting.
+    """
+
+    def __init__(self, db_client, expert_matcher, calendar_feeds=None):
+        self.db = db_client.driving_school_platform
+        self.expert_matcher = expert_matcher
+        self.calendar_feeds = calendar_feeds
+
+    async def ensure_indexes(self):
+        await self.db.exam_slots.create_index([("id", ASCENDING)], unique=True)
+        await self.db.exam_slots.create_index([("exam_types", ASCENDING), ("starts_at", ASCENDING)])
+        await self.db.exam_slots.create_index([("expert_id", ASCENDING), ("starts_at", ASCENDING)])
+        await self.db.exam_waitlist.create_index([("slot_id", ASCENDING), ("created_at", ASCENDING)])
+        await self.db.exam_waitlist.create_index([("slot_id", ASCENDING), ("course_id", ASCENDING)], unique=True)
+
+    async def create_slot(self, expert: Dict, starts_at: datetime, capacity: int, location: str, exam_types: List[str], duration_minutes: int = 90) -> Dict:
+        slot_id = str(uuid.uuid4())
+        # The slot takes the expert's time, so matched exams cannot be booked over it
+        if not await self.expert_matcher.hold(expert["id"], slot_id, starts_at, duration_minutes):
+            raise SlotOverlapError("You already have an exam or slot at this time")
+        slot = {
+            "id": slot_id,
+            "expert_id": expert["id"],
+            "exam_types": exam_types,
+            "states": [state.strip().lower() for state in expert.get("available_states") or []],
+            "starts_at": starts_at,
+            "duration_minutes": duration_minutes,
+            "location": location,
+            "capacity": capacity,
+            "booked": 0,
+            "waitlisted": 0,
+            "is_open": True,
+            "created_at": datetime.utcnow()
+        }
+        await self.db.exam_slots.insert_one(slot)
+        return slot
+
+    async def open_slots(self, exam_type: str, state: Optional[str], date_from: datetime, date_to: datetime, limit: int = 100) -> List[Dict]:
+        """Upcoming slots for an exam type, with seats left first"""
+        query = {
+            "exam_types": exam_type,
+            "is_open": True,
+            "starts_at": {"$gte": date_from, "$lt": date_to}
+        }
+        if state:
+            query["states"] = state.strip().lower()
+        return await self.db.exam_slots.find(query).sort("starts_at", ASCENDING).limit(limit).to_list(length=limit)
+
+    async def find_slot(self, exam_type: str, state: Optional[str], starts: List[datetime], include_full: bool = False) -> Optional[Dict]:
+        """Earliest open slot at one of the given start times, preferring slots with free seats"""
+        query = {"exam_types": exam_type, "is_open": True, "starts_at": {"$in": starts}}
+        if state:
+            query["states"] = state.strip().lower()
+        if not include_full:
+            query["$expr"] = {"$lt": ["$booked", "$capacity"]}
+            query["waitlisted"] = 0
+        slots = await self.db.exam_slots.find(query).sort("starts_at", ASCENDING).limit(1).to_list(length=1)
+        return slots[0] if slots else None
+
+    async def _take_seat(self, slot_id: str, waiting_turn: bool = False) -> Optional[Dict]:
+        """Increment `booked` if a seat is free; new bookings never jump an existing waitlist"""
+        query = {"id": slot_id, "is_open": True, "$expr": {"$lt": ["$booked", "$capacity"]}}
+        if not waiting_turn:
+            query["waitlisted"] = 0
+        return await self.db.exam_slots.find_one_and_update(
+            query,
+            {"$inc": {"booked": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def _create_exam(self, slot: Dict, student_id: str, course_id: str, exam_type: str) -> Dict:
+        exam = {
+            "id": str(uuid.uuid4()),
+            "course_id": course_id,
+            "student_id": student_id,
+            "external_expert_id": slot["expert_id"],
+            "exam_type": exam_type,
+            "slot_id": slot["id"],
+            "scheduled_at": slot["starts_at"],
+            "location": slot["location"],
+            "duration_minutes": slot["duration_minutes"],
+            "status": "available",
+            "score": None,
+            "notes": None,
+            "created_at": datetime.utcnow()
+        }
+        await self.db.exam_schedules.insert_one(exam)
+        # Slot bookings count towards the expert's workload like matched exams
+        await self.db.external_experts.update_one(
+            {"id": slot["expert_id"]},
+            {"$inc": {"active_exams": 1, "remaining_capacity": -1}}
+        )
+        await self.db.courses.update_one({"id": course_id}, {"$set": {"exam_booking_id": exam["id"]}})
+        if self.calendar_feeds:
+            await self.calendar_feeds.touch_exams([exam])
+        return exam
+
+    async def claim_course(self, course_id: str) -> str:
+        """Mark the course as booking an exam; raises ExamBookingError if it already holds one.
+
+        One booking per course: every booking path claims first, so parallel
+        requests cannot take two seats or two experts.
+        """
+        claim = f"pending:{uuid.uuid4()}"
+        claimed = await self.db.courses.update_one(
+            {"id": course_id, "exam_booking_id": None},
+            {"$set": {"exam_booking_id": claim}}
+        )
+        if claimed.modified_count == 0:
+            raise ExamBookingError("An exam is already booked or waitlisted for this course")
+        return claim
+
+    async def release_claim(self, course_id: str, claim: str):
+        await self.db.courses.update_one(
+            {"id": course_id, "exam_booking_id": claim},
+            {"$set": {"exam_booking_id": None}}
+        )
+
+    async def book(self, slot_id: str, student_id: str, course_id: str, exam_type: str) -> Tuple[str, Dict]:
+        """("booked", exam) when a seat was free, ("waitlisted", entry) otherwise"""
+        claim = await self.claim_course(course_id)
+        try:
+            return await self._book_claimed(slot_id, student_id, course_id, exam_type, claim)
+        except Exception:
+            await self.release_claim(course_id, claim)
+            raise
+
+    async def _book_claimed(self, slot_id: str, student_id: str, course_id: str, exam_type: str, claim: str) -> Tuple[str, Dict]:
+        slot = await self._take_seat(slot_id)
+        if slot:
+            try:
+                return "booked", await self._create_exam(slot, student_id, course_id, exam_type)
+            except Exception:
+                await self.db.exam_slots.update_one({"id": slot_id, "booked": {"$gt": 0}}, {"$inc": {"booked": -1}})
+                raise
+
+        entry = {
+            "id": str(uuid.uuid4()),
+            "slot_id": slot_id,
+            "student_id": student_id,
+            "course_id": course_id,
+            "exam_type": exam_type,
+            "created_at": datetime.utcnow()
+        }
+        try:
+            await self.db.exam_waitlist.insert_one(entry)
+        except DuplicateKeyError:
+            raise ExamBookingError("This course is already on the waitlist for this slot")
+        slot = await self.db.exam_slots.find_one_and_update(
+            {"id": slot_id},
+            {"$inc": {"waitlisted": 1}},
+            return_document=ReturnDocument.AFTER
+        )
+        # Unless a freed seat already turned the entry into an exam
+        await self.db.courses.update_one({"id": course_id, "exam_booking_id": claim}, {"$set": {"exam_booking_id": entry["id"]}})
+        entry["position"] = await self.db.exam_waitlist.count_documents({
+            "slot_id": slot_id,
+            "created_at": {"$lte": entry["created_at"]}
+        })
+        # A seat may have been freed while we were joining the waitlist
+        if slot and slot["booked"] < slot["capacity"]:
+            await self.promote(slot_id)
+        return "waitlisted", entry
+
+    async def promote(self, slot_id: str) -> List[Dict]:
+        """Hand free seats to the students waiting longest; returns the exams created"""
+        promoted = []
+        while True:
+            slot = await self._take_seat(slot_id, waiting_turn=True)
+            if not slot:
+                break
+            entry = await self.db.exam_waitlist.find_one_and_delete({"slot_id": slot_id}, sort=[("created_at", ASCENDING)])
+            if not entry:
+                await self.db.exam_slots.update_one({"id": slot_id, "booked": {"$gt": 0}}, {"$inc": {"booked": -1}})
+                break
+            await self.db.exam_slots.update_one({"id": slot_id, "waitlisted": {"$gt": 0}}, {"$inc": {"waitlisted": -1}})
+            promoted.append(await self._create_exam(slot, entry["student_id"], entry["course_id"], entry["exam_type"]))
+        return promoted
+
+    async def cancel(self, exam: Dict) -> List[Dict]:
+        """Cancel a slot exam, free its seat and promote the waitlist; returns promoted exams"""
+        cancelled = await self.db.exam_schedules.find_one_and_update(
+            {"id": exam["id"], "status": "available"},
+            {"$set": {"status": "cancelled", "cancelled_at": datetime.utcnow()}}
+        )
+        if not cancelled:
+            return []
+        await self.expert_matcher.release(exam["id"], conducted=False)
+        if self.calendar_feeds:
+            await self.calendar_feeds.touch_exams([cancelled])
+        await self.db.courses.update_one(
+            {"id": exam["course_id"], "exam_booking_id": exam["id"]},
+            {"$set": {"exam_booking_id": None}}
+        )
+        if not exam.get("slot_id"):
+            return []
+        await self.db.exam_slots.update_one({"id": exam["slot_id"], "booked": {"$gt": 0}}, {"$inc": {"booked": -1}})
+        return await self.promote(exam["slot_id"])
+
+    async def leave_waitlist(self, entry_id: str, student_id: str) -> bool:
+        entry = await self.db.exam_waitlist.find_one_and_delete({"id": entry_id, "student_id": student_id})
+        if not entry:
+            return False
+        await self.db.exam_slots.update_one({"id": entry["slot_id"], "waitlisted": {"$gt": 0}}, {"$inc": {"waitlisted": -1}})
+        await self.db.courses.update_one(
+            {"id": entry["course_id"], "exam_booking_id": entry_id},
+            {"$set": {"exam_booking_id": None}}
+        )
+        return True
@@ -0,0 +1,171 @@
+# External Expert Matching for Driving School Platform
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+logger = logging.getLogger(__name__)
+
+# Exams in these statuses no longer occupy an expert
+CLOSED_EXAM_STATUSES = ["passed", "failed", "cancelled"]
+
+def match_keys(specialization: List[str], available_states: List[str]) -> List[str]:
+    """Flattened (specialization, state) pairs, plus bare specializations for exams with no known state.
+
+    MongoDB cannot put two array fields in one compound index, so the pairs
+    live in a single multikey field instead.
+    """
+    specialization = [str(getattr(value, "value", value)) for value in specialization]
+    keys = [f"{exam_type}:{state.strip().lower()}" for exam_type in specialization for state in available_states]
+    return keys + specialization
+
+class ExpertMatcher:
+    """Assigns exams to the least-loaded eligible external expert.
+
+    Each expert carries `match_keys`, an `active_exams` workload counter,
+    `remaining_capacity` and `booked_intervals`, the times of their exams and
+    published slots. A reservation is one findOneAndUpdate over the
+    (match_keys, is_available, active_exams) index that picks the least-loaded
+    expert with capacity left and no overlapping interval, takes one unit of
+    capacity and pushes the exam's interval, so two concurrent bookings can
+    neither overfill an expert nor give them two exams at the same time.
+    """
+
+    def __init__(self, db_client):
+        self.db = db_client.driving_school_platform
+        self.default_capacity = int(os.environ.get('EXPERT_MAX_ACTIVE_EXAMS', '20'))
+        self.exam_duration_minutes = 90
+
+    async def ensure_indexes(self):
+        await self.db.external_experts.create_index([
+            ("match_keys", ASCENDING),
+            ("is_available", ASCENDING),
+            ("active_exams", ASCENDING)
+        ])
+        await self.db.exam_schedules.create_index([("scheduled_at", ASCENDING), ("external_expert_id", ASCENDING)])
+
+    def matching_fields(self, specialization: List[str], available_states: List[str]) -> Dict:
+        """Matching fields for a newly registered expert"""
+        return {
+            "match_keys": match_keys(specialization, available_states),
+            "active_exams": 0,
+            "max_active_exams": self.default_capacity,
+            "remaining_capacity": self.default_capacity
+        }
+
+    async def _busy_experts(self, scheduled_at: datetime) -> List[str]:
+        """Experts with an open exam or published slot overlapping this one.
+
+        Covers bookings made before `booked_intervals` existed; newer ones are
+        excluded atomically by `free_at`.
+        """
+        window = timedelta(minutes=self.exam_duration_minutes)
+        overlapping = {"$gt": scheduled_at - window, "$lt": scheduled_at + window}
+        examining = await self.db.exam_schedules.distinct("external_expert_id", {
+            "scheduled_at": overlapping,
+            "status": {"$nin": CLOSED_EXAM_STATUSES},
+            "expert_released": {"$ne": True}
+        })
+        publishing = await self.db.exam_slots.distinct("expert_id", {"starts_at": overlapping, "is_open": True})
+        return sorted(set(examining) | set(publishing))
+
+    @staticmethod
+    def free_at(starts_at: datetime, ends_at: datetime) -> Dict:
+        """Filter for experts with no booked interval overlapping [starts_at, ends_at)"""
+        return {"booked_intervals": {"$not": {"$elemMatch": {"starts_at": {"$lt": ends_at}, "ends_at": {"$gt": starts_at}}}}}
+
+    def interval(self, booking_id: str, starts_at: datetime, duration_minutes: Optional[int] = None) -> Dict:
+        return {
+            "id": booking_id,
+            "starts_at": starts_at,
+            "ends_at": starts_at + timedelta(minutes=duration_minutes or self.exam_duration_minutes)
+        }
+
+    async def reserve(self, exam_type: str, state: Optional[str], scheduled_at: datetime, exam_id: str) -> Optional[Dict]:
+        """Take one unit of capacity and the exam's time from the least-loaded eligible expert; None if nobody is free"""
+        exam_type = str(getattr(exam_type, "value", exam_type))
+        key = f"{exam_type}:{state.strip().lower()}" if state else exam_type
+        interval = self.interval(exam_id, scheduled_at)
+        return await self.db.external_experts.find_one_and_update(
+            {
+                "match_keys": key,
+                "is_available": True,
+                "remaining_capacity": {"$gt": 0},
+                "id": {"$nin": await self._busy_experts(scheduled_at)},
+                **self.free_at(interval["starts_at"], interval["ends_at"])
+            },
+            {"$inc": {"active_exams": 1, "remaining_capacity": -1}, "$push": {"booked_intervals": interval}},
+            sort=[("active_exams", ASCENDING)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def hold(self, expert_id: str, booking_id: str, starts_at: datetime, duration_minutes: int) -> bool:
+        """Book the expert's own time (a published slot); False if it overlaps another booking"""
+        interval = self.interval(booking_id, starts_at, duration_minutes)
+        if expert_id in await self._busy_experts(starts_at):
+            return False
+        result = await self.db.external_experts.update_one(
+            {"id": expert_id, **self.free_at(interval["starts_at"], interval["ends_at"])},
+            {"$push": {"booked_intervals": interval}}
+        )
+        return result.modified_count > 0
+
+    async def cancel_reservation(self, expert_id: str, exam_id: str):
+        """Give back capacity and time taken by `reserve` when the exam was not created after all"""
+        await self.db.external_experts.update_one(
+            {"id": expert_id, "active_exams": {"$gt": 0}},
+            {"$inc": {"active_exams": -1, "remaining_capacity": 1}, "$pull": {"booked_intervals": {"id": exam_id}}}
+        )
+
+    async def release(self, exam_id: str, conducted: bool = True):
+        """Free the expert of a finished exam, exactly once per exam"""
+        exam = await self.db.exam_schedules.find_one_and_update(
+            {"id": exam_id, "expert_released": {"$ne": True}},
+            {"$set": {"expert_released": True}}
+        )
+        if not exam:
+            return
+        update = {"$inc": {"active_exams": -1, "remaining_capacity": 1}, "$pull": {"booked_intervals": {"id": exam_id}}}
+        if conducted:
+            update["$inc"]["total_exams_conducted"] = 1
+        await self.db.external_experts.update_one(
+            {"id": exam["external_expert_id"], "active_exams": {"$gt": 0}},
+            update
+        )
+
+    async def backfill(self):
+        """Add matching fields and workload counters to experts registered before they existed"""
+        experts = await self.db.external_experts.find(
+            {"match_keys": {"$exists": False}},
+            {"id": 1, "specialization": 1, "available_states": 1, "max_active_exams": 1}
+        ).to_list(length=None)
+        if not experts:
+            return 0
+        open_counts = {
+            row["_id"]: row["count"]
+            async for row in self.db.exam_schedules.aggregate([
+                {"$match": {
+                    "external_expert_id": {"$in": [expert["id"] for expert in experts]},
+                    "status": {"$nin": CLOSED_EXAM_STATUSES},
+                    "expert_released": {"$ne": True}
+                }},
+                {"$group": {"_id": "$external_expert_id", "count": {"$sum": 1}}}
+            ])
+        }
+        updates = []
+        for expert in experts:
+            capacity = expert.get("max_active_exams") or self.default_capacity
+            active = open_counts.get(expert["id"], 0)
+            updates.append(UpdateOne(
+                {"id": expert["id"], "match_keys": {"$exists": False}},
+                {"$set": {
+                    "match_keys": match_keys(expert.get("specialization") or [], expert.get("available_states") or []),
+                    "active_exams": active,
+                    "max_active_exams": capacity,
+                    "remaining_capacity": max(capacity - active, 0)
+                }}
+            ))
+        result = await self.db.external_experts.bulk_write(updates, ordered=False)
+        logger.info(f"Backfilled matching fields for {result.modified_count} external experts")
+        return result.modified_count
@@ -0,0 +1,12 @@
+from .http_client import (
+    CircuitOpenError,
+    IntegrationClient,
+    IntegrationError,
+    ProviderConfig,
+    close_integration_clients,
+    get_integration_client,
+    register_integration
+)
+from .daily import DailyClient
+from .cloudinary_client import CloudinaryClient
+from .baridimob import BaridiMobClient
@@ -0,0 +1,34 @@
+# BaridiMob Payment Gateway Integration for Driving School Platform
+import os
+from typing import Optional
+from .http_client import IntegrationClient, IntegrationError, get_integration_client
+
+BARIDIMOB_BASE_URL = os.environ.get('BARIDIMOB_BASE_URL', 'https://api.baridimob.dz')
+
+class BaridiMobClient:
+    """BaridiMob payments API over the shared integration client"""
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None):
+        self.api_key = api_key if api_key is not None else os.environ.get('BARIDIMOB_API_KEY')
+        self.base_url = base_url or BARIDIMOB_BASE_URL
+        self.http  # register the provider with this client's settings
+
+    @property
+    def http(self) -> IntegrationClient:
+        # Looked up per call, so re-registering the provider (e.g. stand-ins) reroutes existing clients
+        return get_integration_client(
+            "baridimob",
+            self.base_url,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            },
+            read_timeout=30.0
+        )
+
+    async def create_payment(self, payload: dict) -> dict:
+        """Create a payment; only retried when the connection was never established"""
+        response = await self.http.request("POST", "/v1/payments", json=payload)
+        if response.status_code != 200:
+            raise IntegrationError("baridimob", f"payment creation failed: {response.text}", response.status_code)
+        return response.json()
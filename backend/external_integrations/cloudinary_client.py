@@ -0,0 +1,88 @@
+# Cloudinary Upload Integration for Driving School Platform
+import os
+import time
+from typing import BinaryIO, Optional, Union
+import cloudinary.utils
+from .http_client import IntegrationClient, IntegrationError, get_integration_client
+
+CLOUDINARY_API_URL = os.environ.get('CLOUDINARY_API_URL', 'https://api.cloudinary.com/v1_1')
+
+class CloudinaryClient:
+    """Signed Cloudinary upload API over the shared integration client.
+
+    Uses the REST endpoint directly instead of `cloudinary.uploader`, whose
+    blocking HTTP calls would stall the event loop.
+    """
+
+    def __init__(
+        self,
+        cloud_name: Optional[str] = None,
+        api_key: Optional[str] = None,
+        api_secret: Optional[str] = None,
+        api_url: Optional[str] = None
+    ):
+        self.cloud_name = cloud_name or os.environ.get('CLOUDINARY_CLOUD_NAME')
+        self.api_key = api_key or os.environ.get('CLOUDINARY_API_KEY')
+        self.api_secret = api_secret or os.environ.get('CLOUDINARY_API_SECRET')
+        self.api_url = api_url or CLOUDINARY_API_URL
+        self.http  # register the provider with this client's settings
+
+    @property
+    def http(self) -> IntegrationClient:
+        # Looked up per call, so re-registering the provider (e.g. stand-ins) reroutes existing clients
+        return get_integration_client("cloudinary", self.api_url, read_timeout=60.0)
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.cloud_name and self.api_key and self.api_secret and self.cloud_name != 'your-cloud-name')
+
+    def upload_url(self, resource_type: str = "auto") -> str:
+        return f"{str(self.http.config.base_url).rstrip('/')}/{self.cloud_name}/{resource_type}/upload"
+
+    def signed_upload_params(self, folder: str, public_id: str) -> dict:
+        """Form fields for a signed direct (browser to Cloudinary) upload"""
+        params = {
+            "folder": folder,
+            "public_id": public_id,
+            "overwrite": "true",
+            "timestamp": str(int(time.time()))
+        }
+        params["signature"] = cloudinary.utils.api_sign_request(params, self.api_secret)
+        params["api_key"] = self.api_key
+        return params
+
+    async def upload(self, content: Union[bytes, BinaryIO], filename: str, folder: str, public_id: str, resource_type: str = "auto") -> dict:
+        """Upload bytes or a file object (streamed) and return Cloudinary's upload result"""
+        params = self.signed_upload_params(folder, public_id)
+
+        # A fixed public_id with overwrite makes the upload safe to retry
+        response = await self.http.request(
+            "POST",
+            f"/{self.cloud_name}/{resource_type}/upload",
+            idempotent=True,
+            data=params,
+            files={"file": (filename, content)}
+        )
+        if response.status_code != 200:
+            raise IntegrationError("cloudinary", f"upload failed: {response.text}", response.status_code)
+        return response.json()
+
+    async def resource(self, public_id: str, resource_type: str = "image") -> Optional[dict]:
+        """Admin API lookup of an uploaded resource, None if it does not exist"""
+        response = await self.http.request(
+            "GET",
+            f"/{self.cloud_name}/resources/{resource_type}/upload/{public_id}",
+            auth=(self.api_key, self.api_secret)
+        )
+        if response.status_code == 404:
+            return None
+        if response.status_code != 200:
+            raise IntegrationError("cloudinary", f"resource lookup failed: {response.text}", response.status_code)
+        return response.json()
+
+    async def destroy(self, public_id: str, resource_type: str = "image") -> bool:
+        params = {"public_id": public_id, "timestamp": str(int(time.time()))}
+        params["signature"] = cloudinary.utils.api_sign_request(params, self.api_secret)
+        params["api_key"] = self.api_key
+        response = await self.http.request("POST", f"/{self.cloud_name}/{resource_type}/destroy", idempotent=True, data=params)
+        return response.status_code == 200 and response.json().get("result") in ("ok", "not found")
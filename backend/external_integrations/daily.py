@@ -0,0 +1,60 @@
+# Daily.co Video Rooms Integration for Driving School Platform
+import os
+from datetime import datetime, timedelta
+from typing import Optional
+from .http_client import IntegrationClient, IntegrationError, get_integration_client
+
+DAILY_API_URL = os.environ.get('DAILY_API_URL', 'https://api.daily.co/v1')
+
+class DailyClient:
+    """Daily.co REST API over the shared integration client"""
+
+    def __init__(self, api_key: Optional[str] = None, api_url: Optional[str] = None):
+        self.api_key = api_key if api_key is not None else os.environ.get('DAILY_API_KEY')
+        self.api_url = api_url or DAILY_API_URL
+        self.http  # register the provider with this client's settings
+
+    @property
+    def http(self) -> IntegrationClient:
+        # Looked up per call, so re-registering the provider (e.g. stand-ins) reroutes existing clients
+        return get_integration_client(
+            "daily",
+            self.api_url,
+            headers={
+                "Authorization": f"Bearer {self.api_key}",
+                "Content-Type": "application/json"
+            }
+        )
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.api_key)
+
+    async def create_room(self, room_name: str, duration_hours: int = 24, max_participants: int = 10) -> dict:
+        """Create a room; raises IntegrationError if Daily rejects it"""
+        expiry_time = int((datetime.utcnow() + timedelta(hours=duration_hours)).timestamp())
+        room_config = {
+            "name": room_name,
+            "properties": {
+                "exp": expiry_time,
+                "eject_at_room_exp": True,
+                "enable_chat": True,
+                "start_audio_off": True,
+                "start_video_off": True,
+                "enable_screenshare": True,
+                "max_participants": max_participants
+            }
+        }
+
+        # Room names are unique, so a retried create cannot produce a second room;
+        # if the first attempt's response was lost, the retry finds the room already exists
+        response = await self.http.request("POST", "/rooms", idempotent=True, json=room_config)
+        if response.status_code != 200 and "already exists" in response.text:
+            response = await self.http.request("GET", f"/rooms/{room_name}")
+        if response.status_code != 200:
+            raise IntegrationError("daily", f"room creation failed: {response.text}", response.status_code)
+        return response.json()
+
+    async def delete_room(self, room_name: str) -> bool:
+        response = await self.http.request("DELETE", f"/rooms/{room_name}")
+        return response.status_code in [200, 204, 404]  # 404 means already deleted
@@ -0,0 +1,222 @@
+# Shared Async HTTP Client for External Integrations
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+import httpx
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+
+class IntegrationError(Exception):
+    """Raised when an outbound call fails after retries"""
+
+    def __init__(self, provider: str, message: str, status_code: Optional[int] = None):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+        self.status_code = status_code
+
+class CircuitOpenError(IntegrationError):
+    """Raised without calling the provider while its circuit is open"""
+
+@dataclass
+class ProviderConfig:
+    base_url: str
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    connect_timeout: float = 5.0
+    read_timeout: float = 15.0
+    max_retries: int = 2
+    retry_backoff: float = 0.2          # seconds, doubled per attempt, with jitter
+    retry_budget_ratio: float = 0.2     # retries allowed per request in the window
+    retry_budget_min: int = 5           # retries always allowed per window
+    retry_budget_window: float = 10.0   # seconds
+    failure_threshold: int = 5          # consecutive failures that open the circuit
+    reset_timeout: float = 30.0         # seconds before a half-open probe
+    headers: Dict[str, str] = field(default_factory=dict)
+    transport: Optional[httpx.AsyncBaseTransport] = None  # e.g. httpx.ASGITransport for stand-ins
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a single half-open probe"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+class RetryBudget:
+    """Caps retries to a fraction of recent requests so retries cannot amplify an outage"""
+
+    def __init__(self, ratio: float, minimum: int, window: float):
+        self.ratio = ratio
+        self.minimum = minimum
+        self.window = window
+        self.requests = deque()
+        self.retries = deque()
+
+    def _trim(self, now: float):
+        for events in (self.requests, self.retries):
+            while events and now - events[0] > self.window:
+                events.popleft()
+
+    def record_request(self):
+        now = time.monotonic()
+        self._trim(now)
+        self.requests.append(now)
+
+    def try_spend(self) -> bool:
+        now = time.monotonic()
+        self._trim(now)
+        if len(self.retries) < max(self.minimum, self.ratio * len(self.requests)):
+            self.retries.append(now)
+            return True
+        return False
+
+class IntegrationClient:
+    """Pooled async HTTP client for one provider"""
+
+    def __init__(self, name: str, config: ProviderConfig):
+        self.name = name
+        self.config = config
+        self.breaker = CircuitBreaker(config.failure_threshold, config.reset_timeout)
+        self.retry_budget = RetryBudget(config.retry_budget_ratio, config.retry_budget_min, config.retry_budget_window)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Created lazily so it binds to the running event loop
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.config.base_url,
+                headers=self.config.headers,
+                timeout=httpx.Timeout(self.config.read_timeout, connect=self.config.connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.config.max_connections,
+                    max_keepalive_connections=self.config.max_keepalive_connections
+                ),
+                transport=self.config.transport
+            )
+        return self._client
+
+    async def request(self, method: str, path: str, idempotent: Optional[bool] = None, **kwargs) -> httpx.Response:
+        """Send a request through the circuit breaker with budgeted retries.
+
+        Non-idempotent requests are only retried when the connection could not
+        be established, i.e. when the provider cannot have seen the request.
+        Responses with status < 500 (other than 429) are returned to the caller.
+        """
+        method = method.upper()
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+
+        self.retry_budget.record_request()
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(self.name, "circuit open, provider temporarily disabled")
+
+            response = None
+            try:
+                response = await self.client.request(method, path, **kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout) as e:
+                error = IntegrationError(self.name, f"connection failed: {str(e) or type(e).__name__}")
+                retryable = True
+            except httpx.HTTPError as e:
+                error = IntegrationError(self.name, f"request failed: {str(e) or type(e).__name__}")
+                retryable = idempotent
+            else:
+                if response.status_code < 500 and response.status_code != 429:
+                    self.breaker.record_success()
+                    return response
+                error = IntegrationError(self.name, f"HTTP {response.status_code}", response.status_code)
+                retryable = idempotent and response.status_code in RETRYABLE_STATUS_CODES
+            
+            self.breaker.record_failure()
+            if not retryable or attempt >= self.config.max_retries or not self.retry_budget.try_spend():
+                # Error responses are handed back to the caller; transport failures raise
+                if response is not None:
+                    return response
+                raise error
+
+            attempt += 1
+            delay = self.config.retry_backoff * (2 ** (attempt - 1))
+            await asyncio.sleep(delay * (0.5 + random.random()))
+            logger.warning(f"Retrying {self.name} {method} {path} (attempt {attempt + 1}): {error}")
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+_clients: Dict[str, IntegrationClient] = {}
+
+def _env_config(name: str, base_url: str, **overrides) -> ProviderConfig:
+    """Provider config with per-provider environment overrides, e.g. DAILY_HTTP_MAX_CONNECTIONS"""
+    prefix = f"{name.upper()}_HTTP_"
+    config = ProviderConfig(base_url=base_url, **overrides)
+    for field_name, cast in (
+        ("max_connections", int),
+        ("connect_timeout", float),
+        ("read_timeout", float),
+        ("max_retries", int),
+        ("failure_threshold", int),
+        ("reset_timeout", float)
+    ):
+        value = os.environ.get(prefix + field_name.upper())
+        if value:
+            setattr(config, field_name, cast(value))
+    return config
+
+def register_integration(name: str, config: ProviderConfig) -> IntegrationClient:
+    """Register (or replace) the client used for a provider"""
+    _clients[name] = IntegrationClient(name, config)
+    return _clients[name]
+
+def get_integration_client(name: str, base_url: Optional[str] = None, **overrides) -> IntegrationClient:
+    """Shared client for a provider, created on first use"""
+    if name not in _clients:
+        if base_url is None:
+            raise KeyError(f"Integration {name} is not registered")
+        register_integration(name, _env_config(name, base_url, **overrides))
+    return _clients[name]
+
+async def close_integration_clients():
+    """Close all pooled connections (application shutdown)"""
+    for integration in _clients.values():
+        await integration.close()
@@ -0,0 +1,176 @@
+# Local Stand-in Servers for External Integrations
+"""Minimal emulations of the Daily, Cloudinary and BaridiMob APIs.
+
+Use them in-process for tests:
+
+    from external_integrations.standins import use_standins
+    app = use_standins()
+
+or run them as a server and point DAILY_API_URL / CLOUDINARY_API_URL /
+BARIDIMOB_BASE_URL at it:
+
+    python -m external_integrations.standins --port 9010
+"""
+import uuid
+import argparse
+from datetime import datetime, timedelta
+from typing import Optional
+import httpx
+from fastapi import FastAPI, File, Form, HTTPException, Request, UploadFile
+from fastapi.responses import JSONResponse
+from .http_client import ProviderConfig, register_integration
+
+IMAGE_FORMATS = {"jpg", "jpeg", "png", "gif", "webp", "bmp", "svg", "heic"}
+VIDEO_FORMATS = {"mp4", "mov", "webm", "avi", "mkv"}
+
+def _upload_resource_type(resource_type: str, fmt: str) -> str:
+    """Cloudinary resolves `auto` uploads to image, video or raw from the file"""
+    if resource_type != "auto":
+        return resource_type
+    if fmt in IMAGE_FORMATS:
+        return "image"
+    if fmt in VIDEO_FORMATS:
+        return "video"
+    return "raw"
+
+def create_standin_app() -> FastAPI:
+    app = FastAPI(title="Integration stand-ins")
+    app.state.rooms = {}
+    # Keyed by (resource_type, public_id), as Cloudinary scopes public ids per type
+    app.state.uploads = {}
+    app.state.payments = {}
+    # Set to a status code (e.g. 503) to make every stand-in endpoint fail
+    app.state.fail_with = None
+
+    def check_failure():
+        if app.state.fail_with:
+            raise HTTPException(status_code=app.state.fail_with, detail="Stand-in failure")
+
+    @app.post("/daily/v1/rooms")
+    async def create_room(request: Request):
+        check_failure()
+        body = await request.json()
+        name = body.get("name") or uuid.uuid4().hex
+        if name in app.state.rooms:
+            # Daily rejects duplicate names rather than returning the existing room
+            return JSONResponse(status_code=400, content={
+                "error": "invalid-request-error",
+                "info": f"a room named {name} already exists"
+            })
+        room = {
+            "id": str(uuid.uuid4()),
+            "name": name,
+            "url": f"https://standin.daily.co/{name}",
+            "privacy": "public",
+            "config": body.get("properties", {}),
+            "created_at": datetime.utcnow().isoformat()
+        }
+        app.state.rooms[name] = room
+        return room
+
+    @app.get("/daily/v1/rooms/{name}")
+    async def get_room(name: str):
+        check_failure()
+        if name not in app.state.rooms:
+            return JSONResponse(status_code=404, content={"error": "not-found", "info": f"room {name} not found"})
+        return app.state.rooms[name]
+
+    @app.delete("/daily/v1/rooms/{name}")
+    async def delete_room(name: str):
+        check_failure()
+        if app.state.rooms.pop(name, None) is None:
+            return JSONResponse(status_code=404, content={"error": "not-found", "info": f"room {name} not found"})
+        return {"deleted": True, "name": name}
+
+    @app.post("/cloudinary/v1_1/{cloud_name}/{resource_type}/upload")
+    async def upload(
+        cloud_name: str,
+        resource_type: str,
+        file: UploadFile = File(...),
+        folder: str = Form(""),
+        public_id: Optional[str] = Form(None),
+        signature: str = Form(...),
+        api_key: str = Form(...)
+    ):
+        check_failure()
+        content = await file.read()
+        full_id = f"{folder}/{public_id or uuid.uuid4().hex}".strip("/")
+        fmt = file.filename.rsplit(".", 1)[-1].lower() if "." in file.filename else ""
+        resource_type = _upload_resource_type(resource_type, fmt)
+        result = {
+            "public_id": full_id,
+            "secure_url": f"https://res.standin.cloudinary.com/{cloud_name}/{resource_type}/upload/{full_id}",
+            "bytes": len(content),
+            "format": fmt,
+            "resource_type": resource_type,
+            "width": None,
+            "height": None
+        }
+        app.state.uploads[(resource_type, full_id)] = result
+        return result
+
+    @app.get("/cloudinary/v1_1/{cloud_name}/resources/{resource_type}/upload/{public_id:path}")
+    async def resource(cloud_name: str, resource_type: str, public_id: str, request: Request):
+        check_failure()
+        if not request.headers.get("authorization", "").startswith("Basic "):
+            return JSONResponse(status_code=401, content={"error": {"message": "Must supply api_key"}})
+        result = app.state.uploads.get((resource_type, public_id))
+        if result is None:
+            return JSONResponse(status_code=404, content={"error": {"message": f"Resource not found - {public_id}"}})
+        return result
+
+    @app.post("/cloudinary/v1_1/{cloud_name}/{resource_type}/destroy")
+    async def destroy(
+        cloud_name: str,
+        resource_type: str,
+        public_id: str = Form(...),
+        signature: str = Form(...),
+        api_key: str = Form(...)
+    ):
+        check_failure()
+        # Destroying a missing resource is not an error on Cloudinary either
+        if app.state.uploads.pop((resource_type, public_id), None) is None:
+            return {"result": "not found"}
+        return {"result": "ok"}
+
+    @app.post("/baridimob/v1/payments")
+    async def create_payment(request: Request):
+        check_failure()
+        body = await request.json()
+        payment_id = f"BMP{uuid.uuid4().hex[:12].upper()}"
+        payment = {
+            "payment_id": payment_id,
+            "payment_url": f"https://standin.baridimob.dz/pay/{payment_id}",
+            "reference": f"BM{str(body.get('order_id', ''))[:8].upper()}",
+            "expires_at": (datetime.utcnow() + timedelta(hours=1)).isoformat()
+        }
+        app.state.payments[payment_id] = {**payment, "request": body}
+        return payment
+
+    return app
+
+def use_standins(app: Optional[FastAPI] = None, **overrides) -> FastAPI:
+    """Route all registered providers to an in-process stand-in app"""
+    app = app or create_standin_app()
+    transport = httpx.ASGITransport(app=app)
+    for name, prefix in (("daily", "/daily/v1"), ("cloudinary", "/cloudinary/v1_1"), ("baridimob", "/baridimob")):
+        register_integration(name, ProviderConfig(
+            base_url=f"http://standins{prefix}",
+            transport=transport,
+            retry_backoff=0.0,
+            **overrides
+        ))
+    return app
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run the integration stand-in servers")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9010)
+    args = parser.parse_args()
+
+    print(f"DAILY_API_URL=http://{args.host}:{args.port}/daily/v1")
+    print(f"CLOUDINARY_API_URL=http://{args.host}:{args.port}/cloudinary/v1_1")
+    print(f"BARIDIMOB_BASE_URL=http://{args.host}:{args.port}/baridimob")
+    uvicorn.run(create_standin_app(), host=args.host, port=args.port)
@@ -0,0 +1,109 @@
+# Image Derivative Pipeline for Driving School Platform
+import os
+import shutil
+import asyncio
+import logging
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels for each named size
+DERIVATIVE_SIZES = {"thumb": 160, "small": 480, "medium": 1024}
+DERIVATIVE_FORMATS = {"webp": ("WEBP", {"quality": 80, "method": 4}), "jpeg": ("JPEG", {"quality": 85, "optimize": True, "progressive": True})}
+IMAGE_EXTENSIONS = {"jpg", "jpeg", "png", "webp", "gif", "bmp", "tif", "tiff"}
+
+def render_derivatives(source_path: str, output_dir: str, max_pixels: int) -> Dict[str, Dict[str, str]]:
+    """Write every size/format derivative of an image into `output_dir` (runs in a worker process)"""
+    from PIL import Image, ImageOps
+
+    # Refuse decompression bombs instead of only warning
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    warnings.simplefilter("error", Image.DecompressionBombWarning)
+
+    os.makedirs(output_dir, exist_ok=True)
+    written = {}
+    with Image.open(source_path) as original:
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "L"):
+            # JPEG has no alpha channel; flatten onto white
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            rgba = image.convert("RGBA")
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+
+        for size_name, edge in DERIVATIVE_SIZES.items():
+            resized = image.copy()
+            resized.thumbnail((edge, edge), Image.LANCZOS)
+            written[size_name] = {}
+            for extension, (pil_format, options) in DERIVATIVE_FORMATS.items():
+                target = os.path.join(output_dir, f"{size_name}.{extension}")
+                temp = f"{target}.{os.getpid()}.part"
+                resized.save(temp, pil_format, **options)
+                os.replace(temp, target)
+                written[size_name][extension] = target
+    return written
+
+class ImageDerivativeService:
+    """Generates resized WebP/JPEG derivatives in a process pool, cached on disk by content hash"""
+
+    def __init__(self, cache_dir: Path, url_prefix: str):
+        self.cache_dir = Path(cache_dir)
+        self.url_prefix = url_prefix.rstrip('/')
+        self.max_workers = int(os.environ.get('IMAGE_PROCESS_WORKERS', '2'))
+        self.max_pixels = int(os.environ.get('IMAGE_MAX_PIXELS', str(40_000_000)))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    @staticmethod
+    def is_image(filename: str, content_type: Optional[str] = None) -> bool:
+        if content_type and content_type.startswith("image/"):
+            return True
+        return '.' in filename and filename.rsplit('.', 1)[-1].lower() in IMAGE_EXTENSIONS
+
+    def _relative_dir(self, sha256: str) -> str:
+        return f"{sha256[:2]}/{sha256}"
+
+    def variants_for(self, sha256: str) -> Dict[str, Dict[str, str]]:
+        """Size-specific URLs of the derivatives of an image"""
+        base = f"{self.url_prefix}/{self._relative_dir(sha256)}"
+        return {
+            size_name: {extension: f"{base}/{size_name}.{extension}" for extension in DERIVATIVE_FORMATS}
+            for size_name in DERIVATIVE_SIZES
+        }
+
+    def _is_cached(self, output_dir: Path) -> bool:
+        return all(
+            (output_dir / f"{size_name}.{extension}").exists()
+            for size_name in DERIVATIVE_SIZES for extension in DERIVATIVE_FORMATS
+        )
+
+    async def generate(self, source_path: Path, sha256: str) -> Optional[Dict[str, Dict[str, str]]]:
+        """Render (or reuse) the derivatives of an image; None if the file is not a readable image"""
+        output_dir = self.cache_dir / self._relative_dir(sha256)
+        if self._is_cached(output_dir):
+            return self.variants_for(sha256)
+
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self.executor, render_derivatives, str(source_path), str(output_dir), self.max_pixels)
+        except Exception as e:
+            logger.warning(f"Image derivatives failed for {sha256}: {str(e)}")
+            return None
+        return self.variants_for(sha256)
+
+    async def discard(self, sha256: str):
+        """Remove the cached derivatives of a deleted blob"""
+        await asyncio.to_thread(shutil.rmtree, self.cache_dir / self._relative_dir(sha256), True)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
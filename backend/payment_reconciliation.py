@@ -0,0 +1,319 @@
+# Settlement File Reconciliation for Driving School Platform
+import os
+import io
+import re
+import csv
+import json
+import uuid
+import asyncio
+import logging
+import itertools
+import argparse
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, TextIO
+from enum import Enum
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ASCENDING
+
+logger = logging.getLogger(__name__)
+
+class ReconciliationCategory(str, Enum):
+    MATCHED = "matched"
+    MISSING = "missing"                  # settlement row with no matching payment
+    AMOUNT_MISMATCH = "amount_mismatch"  # payment found, settled amount differs
+
+# Column names used by the providers' settlement exports
+TRANSACTION_ID_COLUMNS = ("transaction_id", "gateway_transaction_id", "txn_id", "id_transaction")
+REFERENCE_COLUMNS = ("reference", "gateway_reference", "ref", "order_reference")
+AMOUNT_COLUMNS = ("amount", "settled_amount", "montant")
+
+_SEPARATORS = re.compile(r"[\s,\[\]]*")
+
+def _first_value(row: dict, columns: tuple) -> Optional[str]:
+    for column in columns:
+        value = row.get(column)
+        if value not in (None, ""):
+            return str(value).strip()
+    return None
+
+def _parse_amount(value) -> Optional[float]:
+    if value in (None, ""):
+        return None
+    try:
+        return float(str(value).replace(" ", "").replace(",", "."))
+    except ValueError:
+        return None
+
+def iter_csv_rows(stream: TextIO) -> Iterator[dict]:
+    """Stream rows of a CSV settlement file, normalising header names"""
+    reader = csv.DictReader(stream)
+    if reader.fieldnames:
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+    yield from reader
+
+def iter_json_rows(stream: TextIO, chunk_size: int = 65536) -> Iterator[dict]:
+    """Stream objects from a JSON array or a JSON Lines settlement file.
+
+    Objects are decoded one at a time from a sliding buffer, so the file is
+    never held in memory as a whole.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    eof = False
+
+    while True:
+        # Skip whitespace and the array punctuation between objects
+        position = _SEPARATORS.match(buffer, position).end()
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = stream.read(chunk_size), 0
+            eof = not buffer
+            continue
+
+        try:
+            row, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise ValueError("Malformed JSON settlement file")
+            chunk = stream.read(chunk_size)
+            eof = not chunk
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+
+        if isinstance(row, dict):
+            yield {str(key).strip().lower(): value for key, value in row.items()}
+
+def _next_rows(rows: Iterator[dict], size: int) -> List[dict]:
+    return list(itertools.islice(rows, size))
+
+def iter_settlement_rows(stream: TextIO, file_format: str) -> Iterator[dict]:
+    if file_format == "csv":
+        return iter_csv_rows(stream)
+    if file_format in ("json", "jsonl"):
+        return iter_json_rows(stream)
+    raise ValueError(f"Unsupported settlement file format: {file_format}")
+
+class CsvReportSink:
+    """Writes one CSV report per category into a directory"""
+
+    FIELDS = ["line", "transaction_id", "reference", "settled_amount", "payment_id", "payment_amount", "payment_status", "school_id"]
+
+    def __init__(self, output_dir: str):
+        os.makedirs(output_dir, exist_ok=True)
+        self.files = {}
+        self.writers = {}
+        for category in ReconciliationCategory:
+            handle = open(os.path.join(output_dir, f"{category.value}.csv"), "w", newline="")
+            self.files[category] = handle
+            self.writers[category] = csv.DictWriter(handle, fieldnames=self.FIELDS, extrasaction="ignore")
+            self.writers[category].writeheader()
+
+    async def write(self, items: List[dict]):
+        for item in items:
+            self.writers[item["category"]].writerow(item)
+
+    async def close(self):
+        for handle in self.files.values():
+            handle.close()
+
+class MongoReportSink:
+    """Stores report items in `payment_reconciliation_items` under a run id"""
+
+    def __init__(self, db, run_id: str):
+        self.db = db
+        self.run_id = run_id
+
+    async def write(self, items: List[dict]):
+        if items:
+            await self.db.payment_reconciliation_items.insert_many(
+                [{**item, "run_id": self.run_id} for item in items],
+                ordered=False
+            )
+
+    async def close(self):
+        pass
+
+class PaymentReconciliationService:
+    def __init__(self, db_client):
+        self.db = db_client.driving_school_platform
+        self.chunk_size = int(os.environ.get('RECONCILIATION_CHUNK_SIZE', '1000'))
+        self.amount_tolerance = float(os.environ.get('RECONCILIATION_AMOUNT_TOLERANCE', '0.01'))
+
+    async def ensure_indexes(self):
+        """Indexes backing the batched transaction id / reference lookups"""
+        await self.db.enhanced_payments.create_index(
+            [("gateway_metadata.gateway_transaction_id", ASCENDING)], sparse=True
+        )
+        await self.db.enhanced_payments.create_index(
+            [("gateway_metadata.gateway_reference", ASCENDING)], sparse=True
+        )
+        await self.db.enhanced_payments.create_index(
+            [("payment_gateway_data.reference", ASCENDING)], sparse=True
+        )
+        await self.db.payment_reconciliation_items.create_index(
+            [("run_id", ASCENDING), ("category", ASCENDING), ("line", ASCENDING)]
+        )
+
+    async def reconcile(
+        self,
+        provider: str,
+        rows: Iterator[dict],
+        sink,
+        school_id: Optional[str] = None,
+        run_id: Optional[str] = None,
+        created_by: Optional[str] = None
+    ) -> Dict:
+        """Match settlement rows against payments chunk by chunk and write the reports to `sink`"""
+        run_id = run_id or str(uuid.uuid4())
+        summary = {category.value: 0 for category in ReconciliationCategory}
+        summary.update({"rows": 0, "settled_amount": 0.0, "matched_amount": 0.0})
+        started_at = datetime.utcnow()
+
+        rows = iter(rows)
+        line = 0
+        try:
+            while True:
+                # Reading and parsing the file blocks, so each chunk is pulled in a worker thread
+                batch = await asyncio.to_thread(_next_rows, rows, self.chunk_size)
+                if not batch:
+                    break
+                chunk = list(enumerate(batch, start=line + 1))
+                line += len(batch)
+                await self._reconcile_chunk(provider, chunk, sink, summary, school_id)
+        finally:
+            await sink.close()
+
+        run = {
+            "id": run_id,
+            "provider": provider,
+            "school_id": school_id,
+            "summary": summary,
+            "created_by": created_by,
+            "started_at": started_at,
+            "completed_at": datetime.utcnow()
+        }
+        await self.db.payment_reconciliations.insert_one(dict(run))
+        return run
+
+    async def _reconcile_chunk(self, provider: str, chunk: list, sink, summary: Dict, school_id: Optional[str]):
+        transaction_ids = set()
+        references = set()
+        for _, row in chunk:
+            transaction_id = _first_value(row, TRANSACTION_ID_COLUMNS)
+            reference = _first_value(row, REFERENCE_COLUMNS)
+            if transaction_id:
+                transaction_ids.add(transaction_id)
+            if reference:
+                references.add(reference)
+
+        query = {
+            "payment_method": provider,
+            "$or": [
+                {"gateway_metadata.gateway_transaction_id": {"$in": list(transaction_ids)}},
+                {"gateway_metadata.gateway_reference": {"$in": list(references)}},
+                {"payment_gateway_data.reference": {"$in": list(references)}}
+            ]
+        }
+        if school_id:
+            query["school_id"] = school_id
+
+        by_transaction_id = {}
+        by_reference = {}
+        async for payment in self.db.enhanced_payments.find(query, {
+            "id": 1, "amount": 1, "status": 1, "school_id": 1,
+            "gateway_metadata.gateway_transaction_id": 1,
+            "gateway_metadata.gateway_reference": 1,
+            "payment_gateway_data.reference": 1
+        }):
+            gateway_metadata = payment.get("gateway_metadata") or {}
+            if gateway_metadata.get("gateway_transaction_id"):
+                by_transaction_id[gateway_metadata["gateway_transaction_id"]] = payment
+            for reference in (gateway_metadata.get("gateway_reference"), (payment.get("payment_gateway_data") or {}).get("reference")):
+                if reference:
+                    by_reference[reference] = payment
+
+        items = []
+        for line, row in chunk:
+            transaction_id = _first_value(row, TRANSACTION_ID_COLUMNS)
+            reference = _first_value(row, REFERENCE_COLUMNS)
+            settled_amount = _parse_amount(_first_value(row, AMOUNT_COLUMNS))
+            payment = by_transaction_id.get(transaction_id) or by_reference.get(reference)
+
+            item = {
+                "line": line,
+                "transaction_id": transaction_id,
+                "reference": reference,
+                "settled_amount": settled_amount
+            }
+            if not payment:
+                item["category"] = ReconciliationCategory.MISSING
+            else:
+                item.update({
+                    "payment_id": payment["id"],
+                    "payment_amount": payment["amount"],
+                    "payment_status": payment["status"],
+                    "school_id": payment.get("school_id")
+                })
+                if settled_amount is not None and abs(settled_amount - payment["amount"]) <= self.amount_tolerance:
+                    item["category"] = ReconciliationCategory.MATCHED
+                    summary["matched_amount"] += settled_amount
+                else:
+                    item["category"] = ReconciliationCategory.AMOUNT_MISMATCH
+
+            summary["rows"] += 1
+            summary[item["category"].value] += 1
+            summary["settled_amount"] += settled_amount or 0
+            items.append(item)
+
+        await sink.write(items)
+
+    async def get_report_items(
+        self,
+        run_id: str,
+        category: Optional[ReconciliationCategory] = None,
+        limit: int = 100,
+        skip: int = 0
+    ) -> List[dict]:
+        """Page through the stored report of a reconciliation run"""
+        query = {"run_id": run_id}
+        if category:
+            query["category"] = category
+        cursor = self.db.payment_reconciliation_items.find(query, {"_id": 0}).sort("line", 1).skip(skip).limit(limit)
+        return await cursor.to_list(length=limit)
+
+def detect_format(path: str) -> str:
+    extension = os.path.splitext(path)[1].lower().lstrip(".")
+    return "json" if extension in ("json", "jsonl", "ndjson") else "csv"
+
+async def run_reconciliation_command(provider: str, path: str, output_dir: str, school_id: Optional[str] = None):
+    """Reconcile a settlement file from disk and write CSV reports to output_dir"""
+    MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
+    client = AsyncIOMotorClient(MONGO_URL)
+
+    try:
+        service = PaymentReconciliationService(client)
+        await service.ensure_indexes()
+        with io.open(path, "r", encoding="utf-8-sig", newline="") as stream:
+            run = await service.reconcile(
+                provider,
+                iter_settlement_rows(stream, detect_format(path)),
+                CsvReportSink(output_dir),
+                school_id=school_id,
+                created_by="cli"
+            )
+        print(f"Reconciliation {run['id']} for {provider}: {json.dumps(run['summary'])}")
+        print(f"Reports written to {output_dir}")
+    finally:
+        client.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reconcile a payment provider settlement file against enhanced_payments")
+    parser.add_argument("--provider", required=True, choices=["baridimob", "ccp"])
+    parser.add_argument("--file", required=True, help="Settlement file (.csv, .json or .jsonl)")
+    parser.add_argument("--output-dir", default="reconciliation-reports")
+    parser.add_argument("--school-id", default=None)
+    args = parser.parse_args()
+
+    asyncio.run(run_reconciliation_command(args.provider, args.file, args.output_dir, args.school_id))
@@ -1,8 +1,9 @@
 import os
 import uuid
+import asyncio
 import logging
 import smtplib
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from typing import List, Optional, Dict
 from pathlib import Path
 from email.mime.text import MIMEText
@@ -11,19 +12,16 @@ from fastapi import FastAPI, HTTPException, status, Depends, UploadFile, File, F
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel, EmailStr
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
+from pydantic import BaseModel, EmailStr, Field
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
 from passlib.context import CryptContext
 import jwt
 from enum import Enum
-import requests
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
-import aiofiles
 import json
 import qrcode
-from io import BytesIO
+from io import BytesIO, TextIOWrapper
 import base64
 import sys
 import os
@@ -44,6 +42,26 @@ import plotly.graph_objects as go
 import plotly.express as px
 from plotly.utils import PlotlyJSONEncoder
 
+from enhanced_notifications import EnhancedNotificationService
+from enhanced_payments import EnhancedPaymentService
+from payment_reconciliation import (
+    MongoReportSink, PaymentReconciliationService, ReconciliationCategory, detect_format, iter_settlement_rows
+)
+from external_integrations import CloudinaryClient, DailyClient, close_integration_clients
+from video_room_pool import VideoRoomPool
+from upload_staging import MAX_UPLOAD_SIZE_MB, StagedUpload, UploadTooLargeError, stage_stream, stage_upload
+from blob_store import BlobStore
+from document_status import DocumentStatusService
+from session_scheduling import MAX_SESSION_MINUTES, SessionScheduler, SessionConflictError, SessionDurationError, CalendarBusyError, expand_weekly_series, to_naive_utc
+from timetable_solver import WeeklyTimetableSolver, StudentPlan, plannable_courses
+from teacher_availability import TeacherAvailabilityService, DEFAULT_WORKING_HOURS
+from expert_matching import ExpertMatcher
+from exam_slots import ExamSlotService, ExamBookingError, SlotOverlapError
+from calendar_feeds import CalendarFeedService
+from image_derivatives import DERIVATIVE_FORMATS, DERIVATIVE_SIZES, ImageDerivativeService
+from storage_backends import PRESIGN_EXPIRES_SECONDS, CloudinaryStorageBackend, LocalStorageBackend, StorageBackend, create_storage_backend
+from background_jobs import JobLease, background_jobs_enabled, start_background_job, start_one_off_job, stop_background_jobs
+
 # Initialize API Router
 api_router = APIRouter()
 
@@ -78,6 +96,11 @@ MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017')
 client = AsyncIOMotorClient(MONGO_URL)
 db = client.driving_school_platform
 
+# Service layer
+notification_service = EnhancedNotificationService(client)
+payment_service = EnhancedPaymentService(client)
+reconciliation_service = PaymentReconciliationService(client)
+
 # Security setup
 security = HTTPBearer()
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -87,13 +110,116 @@ ALGORITHM = "HS256"
 # Daily.co API setup
 DAILY_API_KEY = os.environ.get('DAILY_API_KEY')
 DAILY_API_URL = os.environ.get('DAILY_API_URL', 'https://api.daily.co/v1')
+daily_client = DailyClient(DAILY_API_KEY, DAILY_API_URL)
+video_room_pool = VideoRoomPool(client, daily_client)
+calendar_feed_service = CalendarFeedService(client)
+session_scheduler = SessionScheduler(client, calendar_feeds=calendar_feed_service)
+teacher_availability_service = TeacherAvailabilityService(client)
+expert_matcher = ExpertMatcher(client)
+exam_slot_service = ExamSlotService(client, expert_matcher, calendar_feeds=calendar_feed_service)
+
+# Cloudinary setup (all outbound calls go through the shared integration clients)
+cloudinary_client = CloudinaryClient()
+
+# Background maintenance
+NOTIFICATION_RETENTION_INTERVAL_MINUTES = int(os.environ.get('NOTIFICATION_RETENTION_INTERVAL_MINUTES', '60'))
+NOTIFICATION_DIGEST_FLUSH_INTERVAL_SECONDS = int(os.environ.get('NOTIFICATION_DIGEST_FLUSH_INTERVAL_SECONDS', '60'))
+NOTIFICATION_OUTBOX_INTERVAL_SECONDS = int(os.environ.get('NOTIFICATION_OUTBOX_INTERVAL_SECONDS', '5'))
+PAYMENT_WEBHOOK_INTERVAL_SECONDS = int(os.environ.get('PAYMENT_WEBHOOK_INTERVAL_SECONDS', '2'))
+PAYMENT_SWEEP_INTERVAL_MINUTES = int(os.environ.get('PAYMENT_SWEEP_INTERVAL_MINUTES', '5'))
+ROOM_POOL_REFILL_INTERVAL_SECONDS = int(os.environ.get('ROOM_POOL_REFILL_INTERVAL_SECONDS', '30'))
+ROOM_RECLAIM_INTERVAL_MINUTES = int(os.environ.get('ROOM_RECLAIM_INTERVAL_MINUTES', '10'))
+BLOB_GC_INTERVAL_MINUTES = int(os.environ.get('BLOB_GC_INTERVAL_MINUTES', '60'))
+
+@app.on_event("startup")
+async def startup_tasks():
+    await notification_service.ensure_indexes()
+    await payment_service.ensure_indexes()
+    await reconciliation_service.ensure_indexes()
+    await document_status_service.ensure_indexes()
+    await video_room_pool.ensure_indexes()
+    await blob_store.ensure_indexes()
+    await session_scheduler.ensure_indexes()
+    await expert_matcher.ensure_indexes()
+    await exam_slot_service.ensure_indexes()
+    await calendar_feed_service.ensure_indexes()
+    await db.pending_uploads.create_index([("expires_at", 1)], expireAfterSeconds=24 * 3600)
+    await db.documents.create_index([("storage_key", 1)], sparse=True)
+    
+    if background_jobs_enabled():
+        start_one_off_job(
+            "notification_legacy_migration",
+            notification_service.migrate_legacy_notifications,
+            lease=JobLease(db, "notification_legacy_migration", ttl_seconds=3600)
+        )
+        start_background_job(
+            "payment_webhook_inbox",
+            PAYMENT_WEBHOOK_INTERVAL_SECONDS,
+            payment_service.process_webhook_inbox
+        )
+        start_one_off_job(
+            "document_status_backfill",
+            document_status_service.backfill,
+            lease=JobLease(db, "document_status_backfill", ttl_seconds=3600)
+        )
+        start_one_off_job(
+            "expert_matching_backfill",
+            expert_matcher.backfill,
+            lease=JobLease(db, "expert_matching_backfill", ttl_seconds=3600)
+        )
+        start_one_off_job(
+            "payment_rollup_backfill",
+            payment_service.backfill_payment_rollups,
+            lease=JobLease(db, "payment_rollup_backfill", ttl_seconds=3600)
+        )
+        start_background_job(
+            "expired_payment_sweep",
+            PAYMENT_SWEEP_INTERVAL_MINUTES * 60,
+            payment_service.cleanup_expired_payments,
+            lease=JobLease(db, "expired_payment_sweep", ttl_seconds=PAYMENT_SWEEP_INTERVAL_MINUTES * 60)
+        )
+        start_background_job(
+            "notification_outbox",
+            NOTIFICATION_OUTBOX_INTERVAL_SECONDS,
+            notification_service.process_outbox
+        )
+        start_background_job(
+            "notification_retention",
+            NOTIFICATION_RETENTION_INTERVAL_MINUTES * 60,
+            notification_service.run_retention,
+            lease=JobLease(db, "notification_retention", ttl_seconds=NOTIFICATION_RETENTION_INTERVAL_MINUTES * 60)
+        )
+        if video_room_pool.enabled:
+            start_background_job(
+                "daily_room_pool_refill",
+                ROOM_POOL_REFILL_INTERVAL_SECONDS,
+                # refill takes the pool's own lease, shared with refills triggered by leasing
+                video_room_pool.refill
+            )
+        start_background_job(
+            "video_room_reclaim",
+            ROOM_RECLAIM_INTERVAL_MINUTES * 60,
+            video_room_pool.reclaim,
+            lease=JobLease(db, "video_room_reclaim", ttl_seconds=ROOM_RECLAIM_INTERVAL_MINUTES * 60)
+        )
+        start_background_job(
+            "blob_gc",
+            BLOB_GC_INTERVAL_MINUTES * 60,
+            blob_store.collect_garbage,
+            lease=JobLease(db, "blob_gc", ttl_seconds=BLOB_GC_INTERVAL_MINUTES * 60)
+        )
+        if notification_service.digest_window_minutes > 0:
+            start_background_job(
+                "notification_digest_flush",
+                NOTIFICATION_DIGEST_FLUSH_INTERVAL_SECONDS,
+                notification_service.flush_digests
+            )
 
-# Cloudinary setup
-cloudinary.config(
-    cloud_name=os.environ.get('CLOUDINARY_CLOUD_NAME'),
-    api_key=os.environ.get('CLOUDINARY_API_KEY'),
-    api_secret=os.environ.get('CLOUDINARY_API_SECRET')
-)
+@app.on_event("shutdown")
+async def shutdown_tasks():
+    await stop_background_jobs()
+    await close_integration_clients()
+    image_derivatives.shutdown()
 
 # Basic routes that don't need /api prefix
 @app.get("/health")
@@ -297,6 +423,8 @@ class DocumentUpload(BaseModel):
     file_url: str
     file_name: str
     file_size: int
+    storage_key: Optional[str] = None
+    storage_backend: Optional[str] = None
     upload_date: datetime
     is_verified: bool = False
     status: DocumentStatus = DocumentStatus.ACCEPTED
@@ -346,6 +474,7 @@ class VideoRoom(BaseModel):
     room_name: str
     scheduled_at: datetime
     duration_minutes: int = 60
+    ends_at: Optional[datetime] = None
     is_active: bool = True
     daily_room_id: Optional[str] = None
     created_at: datetime
@@ -374,7 +503,7 @@ class SessionCreate(BaseModel):
     course_id: str
     teacher_id: str
     scheduled_at: str  # ISO string
-    duration_minutes: int = 60
+    duration_minutes: int = Field(60, gt=0, le=MAX_SESSION_MINUTES)
     location: Optional[str] = None
 
 class ExternalExpert(BaseModel):
@@ -410,6 +539,16 @@ class ExamSchedule(BaseModel):
     notes: Optional[str] = None
     created_at: datetime
 
+class ExamSlotCreate(BaseModel):
+    starts_at: str  # ISO string
+    capacity: int = 1
+    location: str
+    exam_types: Optional[List[CourseType]] = None  # Defaults to the expert's specializations
+    duration_minutes: int = 90
+
+class ExamSlotBook(BaseModel):
+    course_id: str
+
 class ExamScheduleCreate(BaseModel):
     course_id: str
     exam_type: CourseType
@@ -438,6 +577,55 @@ class Notification(BaseModel):
     metadata: Optional[dict] = None
     created_at: datetime
 
+class NotificationBatchRead(BaseModel):
+    notification_ids: List[str]
+
+class DirectUploadCreate(BaseModel):
+    purpose: str  # 'document', 'profile_photo' or 'school_photo'
+    filename: str
+    content_type: str = "application/octet-stream"
+    size: int
+    document_type: Optional[str] = None
+    school_id: Optional[str] = None
+    photo_type: Optional[str] = None  # 'logo' or 'photo' for school photos
+
+class AvailabilityWindow(BaseModel):
+    weekday: int  # 0 = Monday ... 6 = Sunday
+    start_time: str  # "HH:MM"
+    end_time: str  # "HH:MM"
+
+class WorkingHoursUpdate(BaseModel):
+    windows: List[AvailabilityWindow]
+
+class TimetableGenerate(BaseModel):
+    week_start: str  # ISO date of the first day of the week to plan
+    course_ids: Optional[List[str]] = None  # Limit to these teacher-student pairs; all assigned pairs otherwise
+    teacher_availability: Dict[str, List[AvailabilityWindow]] = {}  # teacher_id -> windows
+    default_availability: Optional[List[AvailabilityWindow]] = None  # Teachers without windows or stored working hours; Sun-Thu 08:00-17:00 otherwise
+    session_duration_minutes: int = Field(60, gt=0, le=MAX_SESSION_MINUTES)
+    max_sessions_per_student_per_day: int = 2
+    max_sessions_per_student_per_week: int = 5
+    location: str = ""
+    commit: bool = False  # Preview only unless set
+
+class SessionRecurrence(BaseModel):
+    start_date: str  # ISO date of the first day of the series
+    weekdays: List[int]  # 0 = Monday ... 6 = Sunday
+    start_time: str  # "HH:MM"
+    weeks: Optional[int] = None  # Series length in weeks
+    count: Optional[int] = None  # Or a number of sessions
+
+class SessionSeriesCreate(BaseModel):
+    teacher_id: str
+    student_id: str
+    course_id: str
+    session_type: str
+    duration_minutes: int = Field(60, gt=0, le=MAX_SESSION_MINUTES)
+    location: str = ""
+    recurrence: Optional[SessionRecurrence] = None
+    slots: Optional[List[str]] = None  # Explicit ISO start times instead of a recurrence
+    skip_conflicts: bool = False  # Create the free slots and report the rest instead of failing
+
 class ProgressAnalytics(BaseModel):
     id: str
     student_id: str
@@ -493,6 +681,12 @@ REQUIRED_DOCUMENTS = {
     UserRole.EXTERNAL_EXPERT: [DocumentType.PROFILE_PHOTO, DocumentType.ID_CARD, DocumentType.DRIVING_LICENSE, DocumentType.TEACHING_LICENSE]
 }
 
+# users.document_status / users.documents_complete, kept in sync on every document status change
+document_status_service = DocumentStatusService(
+    client,
+    {role.value: [doc.value for doc in docs] for role, docs in REQUIRED_DOCUMENTS.items()}
+)
+
 # Helper functions
 def hash_password(password: str) -> str:
     return pwd_context.hash(password)
@@ -548,101 +742,77 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 
 async def check_user_documents_complete(user_id: str, role: str) -> bool:
     """Check if user has uploaded and accepted all required documents"""
-    required_docs = REQUIRED_DOCUMENTS.get(role, [])
-    
-    documents_cursor = db.documents.find({
-        "user_id": user_id,
-        "status": "accepted",  # Changed from is_verified to status: accepted
-        "document_type": {"$in": [doc.value for doc in required_docs]}
-    })
-    documents = await documents_cursor.to_list(length=None)
-    
-    uploaded_types = {doc["document_type"] for doc in documents}
-    required_types = {doc.value for doc in required_docs}
-    
-    return required_types.issubset(uploaded_types)
+    return await document_status_service.is_complete(user_id, role)
 
 async def check_user_documents_complete_enhanced(user_id: str, role: str) -> bool:
-    """Enhanced check for user documents with additional validation and logging"""
-    try:
-        logger.info(f"Checking document completeness for user {user_id} with role {role}")
-        
-        required_docs = REQUIRED_DOCUMENTS.get(role, [])
-        if not required_docs:
-            logger.warning(f"No required documents found for role {role}")
-            return True
-        
-        # Get all documents for this user
-        all_documents = await db.documents.find({"user_id": user_id}).to_list(length=None)
-        logger.info(f"Found {len(all_documents)} total documents for user {user_id}")
-        
-        # Filter for accepted documents of required types
-        accepted_documents = [
-            doc for doc in all_documents 
-            if doc.get("status") == "accepted" and doc.get("document_type") in [doc_type.value for doc_type in required_docs]
-        ]
-        logger.info(f"Found {len(accepted_documents)} accepted required documents")
-        
-        uploaded_types = {doc["document_type"] for doc in accepted_documents}
-        required_types = {doc.value for doc in required_docs}
-        
-        logger.info(f"Required types: {required_types}")
-        logger.info(f"Accepted types: {uploaded_types}")
-        
-        missing_types = required_types - uploaded_types
-        if missing_types:
-            logger.info(f"Missing document types: {missing_types}")
-            return False
-        
-        # Double-check: ensure we have exactly one accepted document for each required type
-        for doc_type in required_types:
-            type_docs = [doc for doc in accepted_documents if doc["document_type"] == doc_type]
-            if len(type_docs) == 0:
-                logger.warning(f"No accepted document found for type {doc_type}")
-                return False
-            elif len(type_docs) > 1:
-                logger.info(f"Multiple documents found for type {doc_type}, using latest")
-        
-        logger.info(f"All required documents are complete for user {user_id}")
-        return True
-        
-    except Exception as e:
-        logger.error(f"Error checking document completeness: {str(e)}")
-        # Fallback to original function
-        return await check_user_documents_complete(user_id, role)
+    """Kept for existing callers; completeness is a read of users.document_status"""
+    return await check_user_documents_complete(user_id, role)
 
 async def update_course_availability(enrollment_id: str):
     """Update course availability based on completion status"""
-    courses_cursor = db.courses.find({"enrollment_id": enrollment_id}).sort("course_type", 1)
-    courses = await courses_cursor.to_list(length=None)
+    courses = await db.courses.find(
+        {"enrollment_id": enrollment_id},
+        {"id": 1, "course_type": 1, "status": 1, "exam_status": 1}
+    ).to_list(length=None)
     
     # Sort courses by sequence
-    course_order = {CourseType.THEORY: 0, CourseType.PARK: 1, CourseType.ROAD: 2}
-    courses.sort(key=lambda x: course_order[x["course_type"]])
+    courses.sort(key=lambda x: COURSE_SEQUENCE.index(x["course_type"]))
     
+    # Each write re-checks the status it expects, so a concurrent transition is never overwritten
+    updates = []
     for i, course in enumerate(courses):
-        if i == 0:  # First course (theory) is always available
+        if i == 0 or courses[i-1]["exam_status"] == ExamStatus.PASSED:
+            # First course (theory) is always available, later ones once the previous exam is passed
             if course["status"] == CourseStatus.LOCKED:
-                await db.courses.update_one(
-                    {"id": course["id"]},
+                updates.append(UpdateOne(
+                    {"id": course["id"], "status": CourseStatus.LOCKED},
                     {"$set": {"status": CourseStatus.AVAILABLE, "updated_at": datetime.utcnow()}}
-                )
-        else:
-            # Check if previous course is completed and exam passed
-            prev_course = courses[i-1]
-            if prev_course["exam_status"] == ExamStatus.PASSED:
-                if course["status"] == CourseStatus.LOCKED:
-                    await db.courses.update_one(
-                        {"id": course["id"]},
-                        {"$set": {"status": CourseStatus.AVAILABLE, "updated_at": datetime.utcnow()}}
-                    )
-            else:
-                # Lock the course if previous not completed
-                if course["status"] != CourseStatus.LOCKED:
-                    await db.courses.update_one(
-                        {"id": course["id"]},
-                        {"$set": {"status": CourseStatus.LOCKED, "updated_at": datetime.utcnow()}}
-                    )
+                ))
+        elif course["status"] != CourseStatus.LOCKED:
+            # Lock the course if previous not completed
+            updates.append(UpdateOne(
+                {"id": course["id"], "status": {"$ne": CourseStatus.LOCKED}},
+                {"$set": {"status": CourseStatus.LOCKED, "updated_at": datetime.utcnow()}}
+            ))
+    
+    if updates:
+        await db.courses.bulk_write(updates, ordered=False)
+
+async def unlock_next_course(course: dict):
+    """Open the course after `course` in COURSE_SEQUENCE once its exam is passed"""
+    position = COURSE_SEQUENCE.index(course["course_type"])
+    if position + 1 < len(COURSE_SEQUENCE):
+        await db.courses.update_one(
+            {"enrollment_id": course["enrollment_id"], "course_type": COURSE_SEQUENCE[position + 1], "status": CourseStatus.LOCKED},
+            {"$set": {"status": CourseStatus.AVAILABLE, "updated_at": datetime.utcnow()}}
+        )
+
+async def record_completed_session(course_id: str) -> Optional[dict]:
+    """Count one completed session of a course; returns the course as it was before, None if missing.
+    
+    A single pipeline update, so concurrent completions are never lost: the
+    counter is incremented and, when it reaches total_sessions, the course
+    becomes completed and its exam available, exactly once.
+    """
+    reached_total = {"$and": [
+        {"$gte": ["$completed_sessions", "$total_sessions"]},
+        {"$ne": ["$status", CourseStatus.COMPLETED]}
+    ]}
+    return await db.courses.find_one_and_update(
+        {"id": course_id},
+        [
+            {"$set": {
+                "completed_sessions": {"$add": [{"$ifNull": ["$completed_sessions", 0]}, 1]},
+                "updated_at": datetime.utcnow()
+            }},
+            {"$set": {
+                "status": {"$cond": [reached_total, CourseStatus.COMPLETED, "$status"]},
+                "exam_status": {"$cond": [reached_total, ExamStatus.AVAILABLE, "$exam_status"]}
+            }}
+        ],
+        projection={"id": 1, "enrollment_id": 1, "status": 1, "completed_sessions": 1, "total_sessions": 1},
+        return_document=ReturnDocument.BEFORE
+    )
 
 async def create_sequential_courses(enrollment_id: str):
     """Create courses with proper sequential logic"""
@@ -681,78 +851,131 @@ async def create_sequential_courses(enrollment_id: str):
     await db.courses.insert_many(courses)
     return courses
 
+# Uploads are streamed to a staging file next to the upload root (same filesystem, not served) and renamed into place
+upload_staging_dir = Path("upload-staging")
+
+# File storage: STORAGE_BACKEND selects local disk, S3/MinIO or Cloudinary; local disk is the fallback
+local_storage = LocalStorageBackend(demo_uploads_dir, "/demo-uploads")
+storage_backend = create_storage_backend(os.environ.get('STORAGE_BACKEND'), local_storage, cloudinary_client)
+image_derivatives = ImageDerivativeService(demo_uploads_dir / "derivatives", "/demo-uploads/derivatives")
+blob_store = BlobStore(
+    client,
+    storage_backend,
+    local_storage if storage_backend is not local_storage else None,
+    image_derivatives=image_derivatives
+)
+
+async def image_variants_by_url(urls: List[str]) -> Dict[str, dict]:
+    """Size-specific derivative URLs for stored images, keyed by original URL"""
+    urls = [url for url in set(urls) if url]
+    if not urls:
+        return {}
+    blobs = await db.blobs.find(
+        {"url": {"$in": urls}, "derivatives": {"$ne": None}},
+        {"url": 1, "derivatives": 1}
+    ).to_list(length=None)
+    return {blob["url"]: blob["derivatives"] for blob in blobs}
+
+def validate_image_size(image_size: Optional[str], image_format: str):
+    if image_size and image_size not in DERIVATIVE_SIZES:
+        raise HTTPException(status_code=400, detail=f"Invalid image size, expected one of: {', '.join(DERIVATIVE_SIZES)}")
+    if image_format not in DERIVATIVE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Invalid image format, expected one of: {', '.join(DERIVATIVE_FORMATS)}")
+
+async def apply_school_image_sizes(schools: List[dict], image_size: Optional[str], image_format: str = "webp"):
+    """Attach derivative URLs to schools and, if a size is requested, serve that size instead of the originals"""
+    variants = await image_variants_by_url(
+        [school.get("logo_url") for school in schools] +
+        [url for school in schools for url in school.get("photos") or []]
+    )
+    for school in schools:
+        school["logo_variants"] = variants.get(school.get("logo_url"))
+        school["photo_variants"] = [variants.get(url) for url in school.get("photos") or []]
+        if image_size:
+            school["logo_url"] = sized_image_url(school.get("logo_url"), variants, image_size, image_format)
+            school["photos"] = [sized_image_url(url, variants, image_size, image_format) for url in school.get("photos") or []]
+
+def sized_image_url(url: Optional[str], variants: Dict[str, dict], size: Optional[str], image_format: str = "webp") -> Optional[str]:
+    """URL of the requested derivative, or the original when none exists"""
+    if not url or not size:
+        return url
+    return variants.get(url, {}).get(size, {}).get(image_format, url)
+
+def upload_too_large(e: UploadTooLargeError) -> HTTPException:
+    return HTTPException(status_code=413, detail=str(e))
+
+def session_conflict(e: Exception) -> HTTPException:
+    if isinstance(e, SessionDurationError):
+        return HTTPException(status_code=400, detail=str(e))
+    return HTTPException(status_code=409, detail=str(e))
+
+def new_storage_key(folder: str, filename: str) -> str:
+    return f"{folder}/{str(uuid.uuid4())}_{Path(filename).name}"
+
+def storage_upload_result(stored: dict, staged: StagedUpload, backend: StorageBackend) -> dict:
+    return {
+        "file_url": stored["url"],
+        "public_id": stored["key"],
+        "file_size": stored.get("size") or staged.size,
+        "format": stored.get("format", ""),
+        "width": stored.get("width"),
+        "height": stored.get("height"),
+        "sha256": staged.sha256,
+        "storage_key": stored["key"],
+        "storage_backend": backend.name
+    }
+
 # Cloudinary upload function
 async def upload_to_cloudinary(file: UploadFile, folder: str, resource_type: str = "auto"):
     """Upload file to Cloudinary"""
+    backend = CloudinaryStorageBackend(cloudinary_client)
     try:
-        file_content = await file.read()
-        
-        upload_result = cloudinary.uploader.upload(
-            file_content,
-            folder=folder,
-            resource_type=resource_type,
-            public_id=f"{str(uuid.uuid4())}_{file.filename}",
-            overwrite=True
-        )
-        
-        return {
-            "file_url": upload_result["secure_url"],
-            "public_id": upload_result["public_id"],
-            "file_size": upload_result.get("bytes", 0),
-            "format": upload_result.get("format", ""),
-            "width": upload_result.get("width"),
-            "height": upload_result.get("height")
-        }
+        async with stage_upload(file, upload_staging_dir) as staged:
+            stored = await backend.put(staged, new_storage_key(folder, staged.filename), resource_type)
+            return storage_upload_result(stored, staged, backend)
+    except UploadTooLargeError as e:
+        raise upload_too_large(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
 async def upload_to_local_storage(file: UploadFile, folder: str):
     """Upload file to local storage as fallback"""
     try:
-        # Reset file pointer
-        await file.seek(0)
-        file_content = await file.read()
-        
-        # Create upload directory
-        upload_dir = demo_uploads_dir / folder
-        upload_dir.mkdir(parents=True, exist_ok=True)
-        
-        # Generate unique filename
-        file_extension = file.filename.split('.')[-1] if '.' in file.filename else 'unknown'
-        unique_filename = f"{str(uuid.uuid4())}_{file.filename}"
-        file_path = upload_dir / unique_filename
-        
-        # Save file
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(file_content)
-        
-        # Return consistent format
-        return {
-            "file_url": f"/demo-uploads/{folder}/{unique_filename}",
-            "public_id": unique_filename,
-            "file_size": len(file_content),
-            "format": file_extension,
-            "width": None,
-            "height": None
-        }
+        async with stage_upload(file, upload_staging_dir) as staged:
+            stored = await local_storage.put(staged, new_storage_key(folder, staged.filename))
+            return storage_upload_result(stored, staged, local_storage)
+    except UploadTooLargeError as e:
+        raise upload_too_large(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to upload file locally: {str(e)}")
 
 async def upload_file_with_fallback(file: UploadFile, folder: str, resource_type: str = "auto"):
-    """Upload file with Cloudinary first, fallback to local storage"""
-    # Check if Cloudinary is properly configured
-    if (os.environ.get('CLOUDINARY_CLOUD_NAME') and 
-        os.environ.get('CLOUDINARY_API_KEY') and 
-        os.environ.get('CLOUDINARY_API_SECRET') and
-        os.environ.get('CLOUDINARY_CLOUD_NAME') != 'your-cloud-name'):
-        try:
-            return await upload_to_cloudinary(file, folder, resource_type)
-        except Exception as e:
-            logger.warning(f"Cloudinary upload failed, falling back to local storage: {str(e)}")
-    
-    # Fallback to local storage
-    logger.info(f"Using local storage for file upload: {file.filename}")
-    return await upload_to_local_storage(file, folder)
+    """Upload file to the configured storage backend (content-addressed), fallback to local storage"""
+    try:
+        # Stream the upload to disk once, then store it by content hash (identical files are stored once)
+        async with stage_upload(file, upload_staging_dir) as staged:
+            derivatives = None
+            if image_derivatives.is_image(staged.filename, staged.content_type):
+                # Thumbnails are rendered off the event loop before the staged file is moved
+                derivatives = await image_derivatives.generate(staged.path, staged.sha256)
+            blob = await blob_store.store(staged, resource_type, derivatives)
+            return {
+                "file_url": blob["url"],
+                "public_id": blob["key"],
+                "file_size": blob["size"],
+                "format": blob.get("format", ""),
+                "width": blob.get("width"),
+                "height": blob.get("height"),
+                "sha256": blob["sha256"],
+                "storage_key": blob["key"],
+                "storage_backend": blob["backend"],
+                "deduplicated": blob["deduplicated"],
+                "derivatives": blob.get("derivatives") or derivatives
+            }
+    except UploadTooLargeError as e:
+        raise upload_too_large(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to upload file: {str(e)}")
 
 # Enhanced Certificate Generation Functions
 async def generate_qr_code(data: str) -> str:
@@ -1036,13 +1259,18 @@ async def get_user_courses(current_user: dict = Depends(get_current_user)):
         raise HTTPException(status_code=500, detail="Failed to retrieve courses")
 
 @api_router.get("/notifications")
-async def get_user_notifications(current_user: dict = Depends(get_current_user)):
+async def get_user_notifications(lang: Optional[str] = None, current_user: dict = Depends(get_current_user)):
     """Get notifications for the current user"""
     try:
-        notifications_cursor = db.notifications.find({"user_id": current_user["id"]}).sort("created_at", -1).limit(20)
+        watermark = current_user.get("notifications_read_up_to")
+        notifications_cursor = db.enhanced_notifications.find({"user_id": current_user["id"]}).sort("created_at", -1).limit(20)
         notifications = await notifications_cursor.to_list(length=None)
+        notification_service.present_notifications(notifications, current_user, lang)
         
-        return {"notifications": serialize_doc(notifications)}
+        return {
+            "notifications": serialize_doc(notifications),
+            "unread_count": await notification_service.count_unread(current_user["id"], watermark)
+        }
     
     except Exception as e:
         logger.error(f"Get notifications error: {str(e)}")
@@ -1055,13 +1283,7 @@ async def mark_notification_read(
 ):
     """Mark a notification as read"""
     try:
-        # Update notification
-        result = await db.notifications.update_one(
-            {"id": notification_id, "user_id": current_user["id"]},
-            {"$set": {"is_read": True}}
-        )
-        
-        if result.matched_count == 0:
+        if not await notification_service.mark_as_read(notification_id, current_user["id"]):
             raise HTTPException(status_code=404, detail="Notification not found")
         
         return {"message": "Notification marked as read"}
@@ -1265,8 +1487,9 @@ async def get_dashboard_data(current_user: dict = Depends(get_current_user)):
         dashboard_data["documents"] = serialize_doc(documents)
         
         # Get user's notifications
-        notifications_cursor = db.notifications.find({"user_id": current_user["id"]}).sort("created_at", -1).limit(10)
+        notifications_cursor = db.enhanced_notifications.find({"user_id": current_user["id"]}).sort("created_at", -1).limit(10)
         notifications = await notifications_cursor.to_list(length=None)
+        notification_service.present_notifications(notifications, current_user)
         dashboard_data["notifications"] = serialize_doc(notifications)
         
         return dashboard_data
@@ -1275,6 +1498,47 @@ async def get_dashboard_data(current_user: dict = Depends(get_current_user)):
         logger.error(f"Dashboard error: {str(e)}")
         raise HTTPException(status_code=500, detail="Failed to load dashboard data")
 
+def build_document_record(current_user: dict, document_type: str, file_name: str, upload_result: dict) -> dict:
+    # Save document record with default status as accepted
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": current_user["id"],
+        "document_type": document_type,
+        "file_url": upload_result["file_url"],
+        "file_name": file_name,
+        "file_size": upload_result["file_size"],
+        "storage_key": upload_result.get("storage_key"),
+        "storage_backend": upload_result.get("storage_backend"),
+        "upload_date": datetime.utcnow(),
+        "is_verified": True,  # Auto-accept for simplified workflow
+        "status": "accepted",  # Auto-accept for simplified workflow
+        "refusal_reason": None
+    }
+
+async def save_uploaded_document(current_user: dict, document_type: str, file_name: str, upload_result: dict) -> dict:
+    """Create or replace the user's document of `document_type` with an uploaded file"""
+    document_data = build_document_record(current_user, document_type, file_name, upload_result)
+    
+    # Check if document already exists and update it
+    existing_doc = await db.documents.find_one({
+        "user_id": current_user["id"],
+        "document_type": document_type
+    })
+    
+    if existing_doc:
+        await db.documents.update_one(
+            {"id": existing_doc["id"]},
+            {"$set": document_data}
+        )
+        # The replaced file is deleted by blob garbage collection once nothing references it
+        if existing_doc.get("file_url") != document_data["file_url"]:
+            await blob_store.release(existing_doc.get("file_url"))
+    else:
+        await db.documents.insert_one(document_data)
+    
+    await document_status_service.set_statuses(current_user["id"], {document_type: document_data["status"]})
+    return document_data
+
 @api_router.post("/documents/upload")
 async def upload_document(
     document_type: str = Form(...),
@@ -1291,44 +1555,343 @@ async def upload_document(
         folder_name = f"documents/{document_type}"
         upload_result = await upload_file_with_fallback(file, folder_name, "auto")
         
-        # Save document record with default status as accepted
-        document_data = {
-            "id": str(uuid.uuid4()),
-            "user_id": current_user["id"],
-            "document_type": document_type,
-            "file_url": upload_result["file_url"],
-            "file_name": file.filename,
-            "file_size": upload_result["file_size"],
-            "upload_date": datetime.utcnow(),
-            "is_verified": True,  # Auto-accept for simplified workflow
-            "status": "accepted",  # Auto-accept for simplified workflow
-            "refusal_reason": None
+        document_data = await save_uploaded_document(current_user, document_type, file.filename, upload_result)
+        
+        return {
+            "message": "Document uploaded successfully",
+            "document": serialize_doc(document_data)
+        }
+    
+    except Exception as e:
+        logger.error(f"Document upload error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to upload document")
+
+@api_router.post("/documents/upload-batch")
+async def upload_documents_batch(
+    profile_photo: Optional[UploadFile] = File(None),
+    id_card: Optional[UploadFile] = File(None),
+    medical_certificate: Optional[UploadFile] = File(None),
+    residence_certificate: Optional[UploadFile] = File(None),
+    driving_license: Optional[UploadFile] = File(None),
+    teaching_license: Optional[UploadFile] = File(None),
+    current_user: dict = Depends(get_current_user)
+):
+    """Upload several documents at once, one multipart field per document type"""
+    try:
+        files = {
+            DocumentType.PROFILE_PHOTO.value: profile_photo,
+            DocumentType.ID_CARD.value: id_card,
+            DocumentType.MEDICAL_CERTIFICATE.value: medical_certificate,
+            DocumentType.RESIDENCE_CERTIFICATE.value: residence_certificate,
+            DocumentType.DRIVING_LICENSE.value: driving_license,
+            DocumentType.TEACHING_LICENSE.value: teaching_license
         }
+        files = {document_type: file for document_type, file in files.items() if file is not None and file.filename}
+        if not files:
+            raise HTTPException(status_code=400, detail="No documents provided")
+        
+        # Stream all files to storage concurrently
+        upload_results = await asyncio.gather(*(
+            upload_file_with_fallback(file, f"documents/{document_type}", "auto")
+            for document_type, file in files.items()
+        ))
+        
+        documents = [
+            build_document_record(current_user, document_type, file.filename, upload_result)
+            for (document_type, file), upload_result in zip(files.items(), upload_results)
+        ]
         
-        # Check if document already exists and update it
-        existing_doc = await db.documents.find_one({
-            "user_id": current_user["id"],
-            "document_type": document_type
-        })
+        # Files being replaced, so their blob references can be released
+        replaced_urls = {
+            doc["document_type"]: doc.get("file_url")
+            async for doc in db.documents.find(
+                {"user_id": current_user["id"], "document_type": {"$in": list(files)}},
+                {"document_type": 1, "file_url": 1}
+            )
+        }
         
-        if existing_doc:
-            await db.documents.update_one(
-                {"id": existing_doc["id"]},
-                {"$set": document_data}
+        await db.documents.bulk_write([
+            UpdateOne(
+                {"user_id": current_user["id"], "document_type": document["document_type"]},
+                {"$set": document},
+                upsert=True
             )
+            for document in documents
+        ], ordered=False)
+        
+        for document in documents:
+            replaced_url = replaced_urls.get(document["document_type"])
+            if replaced_url and replaced_url != document["file_url"]:
+                await blob_store.release(replaced_url)
+        await document_status_service.set_statuses(
+            current_user["id"],
+            {document["document_type"]: document["status"] for document in documents}
+        )
+        
+        # Evaluate completeness once for the whole batch
+        documents_complete = False
+        if current_user["role"] in ["guest", "student"]:
+            # Guests are checked against student requirements since they become students after approval
+            documents_complete = await check_user_documents_complete(current_user["id"], "student")
+            if documents_complete:
+                await db.enrollments.update_many(
+                    {
+                        "student_id": current_user["id"],
+                        "enrollment_status": EnrollmentStatus.PENDING_APPROVAL,
+                        "documents_completed_at": None
+                    },
+                    {"$set": {"documents_completed_at": datetime.utcnow()}}
+                )
+        
+        return {
+            "message": f"{len(documents)} documents uploaded successfully",
+            "documents": serialize_doc(documents),
+            "documents_complete": documents_complete
+        }
+    
+    except Exception as e:
+        logger.error(f"Batch document upload error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to upload documents")
+
+# DIRECT-TO-STORAGE UPLOADS
+
+@api_router.post("/storage/uploads")
+async def create_direct_upload(
+    upload_data: DirectUploadCreate,
+    current_user = Depends(get_current_user)
+):
+    """Presign a direct upload to the storage backend; finish it with /storage/uploads/{id}/complete"""
+    try:
+        max_bytes = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+        if upload_data.size <= 0 or upload_data.size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"File exceeds the maximum upload size of {MAX_UPLOAD_SIZE_MB} MB")
+        
+        if upload_data.purpose == "document":
+            if upload_data.document_type not in [doc.value for doc in DocumentType]:
+                raise HTTPException(status_code=400, detail="Invalid document type")
+            folder_name = f"documents/{upload_data.document_type}"
+        elif upload_data.purpose == "profile_photo":
+            folder_name = "profile_photos"
+        elif upload_data.purpose == "school_photo":
+            if current_user["role"] != "manager":
+                raise HTTPException(status_code=403, detail="Only managers can upload school photos")
+            if upload_data.photo_type not in ("logo", "photo"):
+                raise HTTPException(status_code=400, detail="Invalid photo type")
+            school = await db.driving_schools.find_one({
+                "id": upload_data.school_id,
+                "manager_id": current_user["id"]
+            })
+            if not school:
+                raise HTTPException(status_code=404, detail="Driving school not found or unauthorized")
+            folder_name = f"driving_schools/{upload_data.school_id}/{upload_data.photo_type}"
         else:
-            await db.documents.insert_one(document_data)
+            raise HTTPException(status_code=400, detail="Invalid upload purpose")
+        
+        key = new_storage_key(folder_name, upload_data.filename)
+        upload = await storage_backend.presign_upload(key, upload_data.content_type, max_bytes)
+        
+        upload_id = str(uuid.uuid4())
+        expires_at = datetime.utcnow() + timedelta(seconds=PRESIGN_EXPIRES_SECONDS)
+        await db.pending_uploads.insert_one({
+            "id": upload_id,
+            "user_id": current_user["id"],
+            "purpose": upload_data.purpose,
+            "storage_key": key,
+            "storage_backend": storage_backend.name,
+            "file_name": upload_data.filename,
+            "content_type": upload_data.content_type,
+            "max_bytes": max_bytes,
+            "document_type": upload_data.document_type,
+            "school_id": upload_data.school_id,
+            "photo_type": upload_data.photo_type,
+            "status": "pending",
+            "expires_at": expires_at,
+            "created_at": datetime.utcnow()
+        })
         
         return {
-            "message": "Document uploaded successfully",
-            "document": serialize_doc(document_data)
+            "upload_id": upload_id,
+            "storage_key": key,
+            "upload": upload,
+            "expires_at": expires_at
         }
     
     except Exception as e:
-        logger.error(f"Document upload error: {str(e)}")
+        logger.error(f"Create direct upload error: {str(e)}")
         if isinstance(e, HTTPException):
             raise e
-        raise HTTPException(status_code=500, detail="Failed to upload document")
+        raise HTTPException(status_code=500, detail="Failed to prepare upload")
+
+@api_router.post("/storage/uploads/{upload_id}/complete")
+async def complete_direct_upload(
+    upload_id: str,
+    current_user = Depends(get_current_user)
+):
+    """Attach a directly uploaded file to its document, profile or school"""
+    pending = None
+    try:
+        # Claim the pending upload so it is applied exactly once
+        now = datetime.utcnow()
+        pending = await db.pending_uploads.find_one_and_update(
+            {"id": upload_id, "user_id": current_user["id"], "$or": [
+                {"status": "pending"},
+                # Claims left behind by a worker that died mid-completion
+                {"status": "completing", "completing_at": {"$lt": now - timedelta(minutes=10)}}
+            ]},
+            {"$set": {"status": "completing", "completing_at": now}}
+        )
+        if not pending:
+            raise HTTPException(status_code=404, detail="Upload not found or already completed")
+        
+        stored = await storage_backend.stat(pending["storage_key"])
+        if not stored:
+            await db.pending_uploads.update_one({"id": upload_id}, {"$set": {"status": "pending"}})
+            raise HTTPException(status_code=400, detail="File has not been uploaded yet")
+        if stored["size"] > pending["max_bytes"]:
+            await storage_backend.delete(pending["storage_key"])
+            await db.pending_uploads.update_one({"id": upload_id}, {"$set": {"status": "rejected"}})
+            raise HTTPException(status_code=413, detail=f"File exceeds the maximum upload size of {MAX_UPLOAD_SIZE_MB} MB")
+        
+        await blob_store.register(stored["key"], stored["url"], storage_backend, stored["size"], pending["content_type"])
+        upload_result = {
+            "file_url": stored["url"],
+            "file_size": stored["size"],
+            "storage_key": stored["key"],
+            "storage_backend": storage_backend.name
+        }
+        
+        response = {"message": "Upload completed successfully", "file_url": stored["url"]}
+        if pending["purpose"] == "document":
+            document_data = await save_uploaded_document(current_user, pending["document_type"], pending["file_name"], upload_result)
+            response["document"] = serialize_doc(document_data)
+        elif pending["purpose"] == "profile_photo":
+            user = await db.users.find_one_and_update(
+                {"id": current_user["id"]},
+                {"$set": {"profile_photo_url": stored["url"]}}
+            )
+            if user and user.get("profile_photo_url") != stored["url"]:
+                await blob_store.release(user.get("profile_photo_url"))
+        elif pending["purpose"] == "school_photo":
+            await save_school_photo(pending["school_id"], pending["photo_type"], stored["url"])
+        
+        await db.pending_uploads.update_one(
+            {"id": upload_id},
+            {"$set": {"status": "completed", "completed_at": datetime.utcnow()}}
+        )
+        return response
+    
+    except Exception as e:
+        logger.error(f"Complete direct upload error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        if pending:
+            # Release the claim so the client can retry
+            await db.pending_uploads.update_one(
+                {"id": upload_id, "status": "completing"},
+                {"$set": {"status": "pending"}}
+            )
+        raise HTTPException(status_code=500, detail="Failed to complete upload")
+
+@api_router.put("/storage/local/{key:path}")
+async def receive_local_direct_upload(
+    key: str,
+    request: Request,
+    expires: int,
+    max_bytes: int,
+    signature: str
+):
+    """Target of presigned uploads when files are stored on local disk"""
+    try:
+        if not local_storage.verify_upload_signature(key, expires, max_bytes, signature):
+            raise HTTPException(status_code=403, detail="Invalid or expired upload signature")
+        
+        declared_size = request.headers.get("content-length")
+        if declared_size and declared_size.isdigit() and int(declared_size) > max_bytes:
+            raise HTTPException(status_code=413, detail="File exceeds the maximum upload size")
+        
+        async with stage_stream(
+            request.stream(),
+            upload_staging_dir,
+            Path(key).name,
+            request.headers.get("content-type"),
+            max_bytes
+        ) as staged:
+            stored = await local_storage.put(staged, key)
+        
+        return {"storage_key": key, "file_size": stored["size"], "sha256": staged.sha256}
+    
+    except UploadTooLargeError as e:
+        raise upload_too_large(e)
+    except Exception as e:
+        logger.error(f"Local direct upload error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to store upload")
+
+async def can_view_user_files(viewer: dict, owner_id: str) -> bool:
+    """Owners see their own files, managers those of their school's students and teachers, teachers those of their students"""
+    if viewer["id"] == owner_id:
+        return True
+    if viewer["role"] == "manager":
+        school_ids = await db.driving_schools.distinct("id", {"manager_id": viewer["id"]})
+        if not school_ids:
+            return False
+        if await db.enrollments.count_documents({"student_id": owner_id, "driving_school_id": {"$in": school_ids}}, limit=1):
+            return True
+        return bool(await db.teachers.count_documents({"user_id": owner_id, "driving_school_id": {"$in": school_ids}}, limit=1))
+    if viewer["role"] == "teacher":
+        teacher = await db.teachers.find_one({"user_id": viewer["id"]}, {"id": 1})
+        if not teacher:
+            return False
+        enrollment_ids = await db.enrollments.distinct("id", {"student_id": owner_id})
+        return bool(await db.courses.count_documents({"enrollment_id": {"$in": enrollment_ids}, "teacher_id": teacher["id"]}, limit=1))
+    return False
+
+@api_router.get("/storage/files/{key:path}")
+async def redirect_to_stored_file(key: str, current_user = Depends(get_current_user)):
+    """Redirect to a short-lived download URL for files in a private bucket"""
+    try:
+        # Documents (identity papers, medical certificates) are only for their owner and the owner's school
+        document = await db.documents.find_one({"storage_key": key}, {"user_id": 1})
+        if document and not await can_view_user_files(current_user, document["user_id"]):
+            raise HTTPException(status_code=403, detail="Not authorized to access this file")
+        
+        return RedirectResponse(await storage_backend.download_url(key), status_code=307)
+    except Exception as e:
+        logger.error(f"Storage download error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=404, detail="File not found")
+
+@api_router.get("/documents/{document_id}/download")
+async def get_document_download_url(
+    document_id: str,
+    current_user = Depends(get_current_user)
+):
+    """Short-lived direct download URL for a document"""
+    try:
+        document = await db.documents.find_one({"id": document_id})
+        if not document:
+            raise HTTPException(status_code=404, detail="Document not found")
+        if not await can_view_user_files(current_user, document["user_id"]):
+            raise HTTPException(status_code=403, detail="Not authorized to access this document")
+        
+        if document.get("storage_key") and document.get("storage_backend") == storage_backend.name:
+            url = await storage_backend.download_url(document["storage_key"])
+        else:
+            url = document["file_url"]
+        
+        return {"url": url, "expires_in": PRESIGN_EXPIRES_SECONDS}
+    
+    except Exception as e:
+        logger.error(f"Document download error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to create download URL")
 
 @api_router.get("/documents")
 async def get_user_documents(current_user: dict = Depends(get_current_user)):
@@ -1411,9 +1974,13 @@ async def get_driving_schools(
     sort_by: str = "name",  # name, price, rating, newest
     sort_order: str = "asc",  # asc, desc
     page: int = 1,
-    limit: int = 20
+    limit: int = 20,
+    image_size: Optional[str] = None,  # thumb, small, medium
+    image_format: str = "webp"  # webp, jpeg
 ):
     try:
+        validate_image_size(image_size, image_format)
+        
         # Build query
         query = {}
         
@@ -1463,6 +2030,7 @@ async def get_driving_schools(
         # Fetch schools with pagination and sorting
         schools_cursor = db.driving_schools.find(query).sort(sort_field, sort_direction).skip(skip).limit(limit)
         schools = await schools_cursor.to_list(length=None)
+        await apply_school_image_sizes(schools, image_size, image_format)
         
         # Calculate pagination info
         total_pages = (total_count + limit - 1) // limit
@@ -1495,6 +2063,8 @@ async def get_driving_schools(
     
     except Exception as e:
         logger.error(f"Error fetching driving schools: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
         raise HTTPException(status_code=500, detail="Failed to fetch driving schools")
 
 @api_router.get("/driving-schools/search-suggestions")
@@ -1662,10 +2232,11 @@ async def create_enrollment(
                 dashboard_data["courses"] = serialize_doc(courses)
         
         # Get recent notifications
-        notifications_cursor = db.notifications.find(
+        notifications_cursor = db.enhanced_notifications.find(
             {"user_id": current_user["id"]}
         ).sort("created_at", -1).limit(10)
         notifications = await notifications_cursor.to_list(length=None)
+        notification_service.present_notifications(notifications, current_user)
         dashboard_data["notifications"] = serialize_doc(notifications)
         
         return dashboard_data
@@ -1704,6 +2275,7 @@ async def upload_document(
         }
         
         await db.documents.insert_one(document_data)
+        await document_status_service.set_statuses(current_user["id"], {document_type: "accepted"})
         
         # Check if all required documents are uploaded and update enrollment status
         # Allow both guests and students to upload documents
@@ -1743,7 +2315,10 @@ async def get_user_documents(current_user = Depends(get_current_user)):
 
 # Manager Routes
 @api_router.get("/manager/enrollments")
-async def get_pending_enrollments(current_user = Depends(get_current_user)):
+async def get_pending_enrollments(
+    documents_complete: Optional[bool] = None,  # filter on the students' document completeness
+    current_user = Depends(get_current_user)
+):
     try:
         if current_user["role"] != "manager":
             raise HTTPException(status_code=403, detail="Only managers can access this")
@@ -1759,6 +2334,15 @@ async def get_pending_enrollments(current_user = Depends(get_current_user)):
         }).sort("created_at", -1)
         enrollments = await enrollments_cursor.to_list(length=None)
         
+        if documents_complete is not None:
+            # Indexed on users.documents_complete.student
+            matching_students = await db.users.distinct("id", {
+                "id": {"$in": list({enrollment["student_id"] for enrollment in enrollments})},
+                "documents_complete.student": True if documents_complete else {"$ne": True}
+            })
+            matching_students = set(matching_students)
+            enrollments = [enrollment for enrollment in enrollments if enrollment["student_id"] in matching_students]
+        
         # Get student information for each enrollment
         for enrollment in enrollments:
             student = await db.users.find_one({"id": enrollment["student_id"]})
@@ -1767,13 +2351,13 @@ async def get_pending_enrollments(current_user = Depends(get_current_user)):
                 enrollment["student_email"] = student["email"]
                 enrollment["student_phone"] = student["phone"]
                 enrollment["student_gender"] = student["gender"]
+                enrollment["student_photo_url"] = student.get("profile_photo_url")
                 
-                # Check if documents are verified
-                documents_complete = await check_user_documents_complete(
-                    enrollment["student_id"], 
-                    "student"
-                )
-                enrollment["documents_verified"] = documents_complete
+                # Check if documents are verified (read from the student's status map)
+                student_documents_complete = document_status_service.is_complete_for(student, "student")
+                if student_documents_complete is None:
+                    student_documents_complete = await check_user_documents_complete(enrollment["student_id"], "student")
+                enrollment["documents_verified"] = student_documents_complete
             
             # Get assigned teacher information if exists
             if enrollment.get("assigned_teacher_id"):
@@ -1795,6 +2379,11 @@ async def get_pending_enrollments(current_user = Depends(get_current_user)):
             else:
                 enrollment["assigned_teacher"] = None
         
+        # Thumbnails for the enrollment table instead of full-resolution photos
+        photo_variants = await image_variants_by_url([enrollment.get("student_photo_url") for enrollment in enrollments])
+        for enrollment in enrollments:
+            enrollment["student_photo_thumbnail_url"] = sized_image_url(enrollment.get("student_photo_url"), photo_variants, "thumb")
+        
         return {"enrollments": serialize_doc(enrollments)}
     
     except Exception as e:
@@ -1961,26 +2550,17 @@ async def accept_student_enrollment(
             {"id": enrollment["student_id"]},
             {"$set": {"role": UserRole.STUDENT}}
         )
+        await document_status_service.refresh(enrollment["student_id"])
         
         # Update course availability - student can now start lessons
         await update_course_availability(enrollment_id)
         
         # Send notification to student
-        notification_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": enrollment["student_id"],
-            "type": NotificationType.ENROLLMENT_APPROVED,
-            "title": "Enrollment Accepted - You Can Start Learning!",
-            "message": f"Congratulations! Your enrollment at {school['name']} has been accepted. You are now an official student and can start your lessons immediately!",
-            "is_read": False,
-            "metadata": {
-                "enrollment_id": enrollment_id, 
-                "school_name": school["name"],
-                "action": "accepted"
-            },
-            "created_at": datetime.utcnow()
-        }
-        await db.notifications.insert_one(notification_doc)
+        await notification_service.notify_many([enrollment["student_id"]], "enrollment_accepted", {
+            "enrollment_id": enrollment_id,
+            "school_name": school["name"],
+            "action": "accepted"
+        })
         
         return {
             "message": "Student enrollment accepted successfully",
@@ -2025,17 +2605,11 @@ async def reject_enrollment(
         )
         
         # Send notification to student
-        notification_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": enrollment["student_id"],
-            "type": NotificationType.ENROLLMENT_REJECTED,
-            "title": "Enrollment Rejected",
-            "message": f"Your enrollment at {school['name']} was rejected. Reason: {reason}",
-            "is_read": False,
-            "metadata": {"enrollment_id": enrollment_id, "school_name": school["name"], "reason": reason},
-            "created_at": datetime.utcnow()
-        }
-        await db.notifications.insert_one(notification_doc)
+        await notification_service.notify_many([enrollment["student_id"]], "enrollment_rejected", {
+            "enrollment_id": enrollment_id,
+            "school_name": school["name"],
+            "reason": reason
+        })
         
         return {"message": "Enrollment rejected"}
     
@@ -2113,39 +2687,19 @@ async def assign_teacher_to_enrollment(
             }
         )
         
-        # Create notification for student
-        notification_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": enrollment["student_id"],
-            "type": "teacher_assigned",
-            "title": "Teacher Assigned",
-            "message": f"Your teacher {teacher_user['first_name']} {teacher_user['last_name']} has been assigned for all your courses",
-            "is_read": False,
-            "metadata": {
+        # Notify the student and the teacher
+        await notification_service.notify_batch([
+            (enrollment["student_id"], "teacher_assigned", {
                 "enrollment_id": enrollment_id,
                 "teacher_id": teacher_id,
                 "teacher_name": f"{teacher_user['first_name']} {teacher_user['last_name']}"
-            },
-            "created_at": datetime.utcnow()
-        }
-        await db.notifications.insert_one(notification_doc)
-        
-        # Create notification for teacher
-        teacher_notification_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": teacher["user_id"],
-            "type": "student_assigned",
-            "title": "New Student Assigned",
-            "message": f"You have been assigned to teach {student['first_name']} {student['last_name']} all courses",
-            "is_read": False,
-            "metadata": {
+            }),
+            (teacher["user_id"], "student_assigned", {
                 "enrollment_id": enrollment_id,
                 "student_id": enrollment["student_id"],
                 "student_name": f"{student['first_name']} {student['last_name']}"
-            },
-            "created_at": datetime.utcnow()
-        }
-        await db.notifications.insert_one(teacher_notification_doc)
+            })
+        ])
         
         return {
             "message": "Teacher assigned successfully",
@@ -2337,25 +2891,16 @@ async def refuse_student_enrollment(
                 }
             }
         )
+        await document_status_service.refresh(enrollment["student_id"])
         
         # Send detailed notification to student
-        notification_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": enrollment["student_id"],
-            "type": NotificationType.ENROLLMENT_REJECTED,
-            "title": "Enrollment Refused",
-            "message": f"Your enrollment at {school['name']} has been refused. Reason: {reason.strip()}",
-            "is_read": False,
-            "metadata": {
-                "enrollment_id": enrollment_id,
-                "school_name": school["name"],
-                "rejection_reason": reason.strip(),
-                "action": "refused",
-                "manager_name": f"{current_user.get('first_name', '')} {current_user.get('last_name', '')}".strip()
-            },
-            "created_at": datetime.utcnow()
-        }
-        await db.notifications.insert_one(notification_doc)
+        await notification_service.notify_many([enrollment["student_id"]], "enrollment_refused", {
+            "enrollment_id": enrollment_id,
+            "school_name": school["name"],
+            "rejection_reason": reason.strip(),
+            "action": "refused",
+            "manager_name": f"{current_user.get('first_name', '')} {current_user.get('last_name', '')}".strip()
+        })
         
         return {
             "message": "Student enrollment refused successfully",
@@ -2501,19 +3046,14 @@ async def reject_document(
                 }
             }
         )
+        await document_status_service.set_statuses(student_id, {document["document_type"]: "refused"})
         
         # Send notification to student
-        notification_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": student_id,
-            "type": "document_rejected",
-            "title": "Document Rejected",
-            "message": f"Your {document['document_type'].replace('_', ' ')} has been rejected. Reason: {reason}. Please upload a new version.",
-            "is_read": False,
-            "metadata": {"document_type": document["document_type"], "reason": reason},
-            "created_at": datetime.utcnow()
-        }
-        await db.notifications.insert_one(notification_doc)
+        await notification_service.notify_many([student_id], "document_rejected", {
+            "document_type": document["document_type"],
+            "document_label": document["document_type"].replace('_', ' '),
+            "reason": reason
+        })
         
         return {"message": "Document rejected successfully"}
     
@@ -2572,12 +3112,18 @@ async def create_driving_school(
         raise HTTPException(status_code=500, detail="Failed to create driving school")
 
 @api_router.get("/driving-schools/{school_id}")
-async def get_driving_school(school_id: str):
+async def get_driving_school(
+    school_id: str,
+    image_size: Optional[str] = None,
+    image_format: str = "webp"
+):
     try:
+        validate_image_size(image_size, image_format)
         school = await db.driving_schools.find_one({"id": school_id})
         if not school:
             raise HTTPException(status_code=404, detail="Driving school not found")
         
+        await apply_school_image_sizes([school], image_size, image_format)
         return serialize_doc(school)
     
     except Exception as e:
@@ -2630,6 +3176,21 @@ async def update_driving_school(
             raise e
         raise HTTPException(status_code=500, detail="Failed to update driving school")
 
+async def save_school_photo(school_id: str, photo_type: str, file_url: str):
+    # Update school record
+    if photo_type == "logo":
+        school = await db.driving_schools.find_one_and_update(
+            {"id": school_id},
+            {"$set": {"logo_url": file_url}}
+        )
+        if school and school.get("logo_url") != file_url:
+            await blob_store.release(school.get("logo_url"))
+    else:
+        await db.driving_schools.update_one(
+            {"id": school_id},
+            {"$push": {"photos": file_url}}
+        )
+
 @api_router.post("/driving-schools/{school_id}/upload-photo")
 async def upload_school_photo(
     school_id: str,
@@ -2653,21 +3214,12 @@ async def upload_school_photo(
         folder_name = f"driving_schools/{school_id}/{photo_type}"
         upload_result = await upload_file_with_fallback(file, folder_name, "image")
         
-        # Update school record
-        if photo_type == "logo":
-            await db.driving_schools.update_one(
-                {"id": school_id},
-                {"$set": {"logo_url": upload_result["file_url"]}}
-            )
-        else:
-            await db.driving_schools.update_one(
-                {"id": school_id},
-                {"$push": {"photos": upload_result["file_url"]}}
-            )
+        await save_school_photo(school_id, photo_type, upload_result["file_url"])
         
         return {
             "message": f"School {photo_type} uploaded successfully",
-            "file_url": upload_result["file_url"]
+            "file_url": upload_result["file_url"],
+            "derivatives": upload_result.get("derivatives")
         }
     
     except Exception as e:
@@ -3079,44 +3631,7 @@ async def create_daily_room(room_name: str, duration_hours: int = 24) -> dict:
         }
     
     try:
-        headers = {
-            "Authorization": f"Bearer {DAILY_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        # Calculate expiry time
-        expiry_time = int((datetime.utcnow() + timedelta(hours=duration_hours)).timestamp())
-        
-        room_config = {
-            "name": room_name,
-            "properties": {
-                "exp": expiry_time,
-                "eject_at_room_exp": True,
-                "enable_chat": True,
-                "start_audio_off": True,
-                "start_video_off": True,
-                "enable_screenshare": True,
-                "max_participants": 10
-            }
-        }
-        
-        response = requests.post(
-            f"{DAILY_API_URL}/rooms",
-            headers=headers,
-            json=room_config
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            logger.error(f"Daily.co API error: {response.status_code} - {response.text}")
-            # Fallback to simple URL
-            return {
-                "name": room_name,
-                "url": f"https://daily.co/{room_name}",
-                "id": room_name
-            }
-            
+        return await daily_client.create_room(room_name, duration_hours)
     except Exception as e:
         logger.error(f"Error creating Daily.co room: {str(e)}")
         # Fallback to simple URL
@@ -3132,17 +3647,7 @@ async def delete_daily_room(room_name: str) -> bool:
         return True  # No cleanup needed for simple URLs
     
     try:
-        headers = {
-            "Authorization": f"Bearer {DAILY_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.delete(
-            f"{DAILY_API_URL}/rooms/{room_name}",
-            headers=headers
-        )
-        
-        return response.status_code in [200, 204, 404]  # 404 means already deleted
+        return await daily_client.delete_room(room_name)
         
     except Exception as e:
         logger.error(f"Error deleting Daily.co room: {str(e)}")
@@ -3173,8 +3678,17 @@ async def create_video_room(
         room_id = str(uuid.uuid4())
         room_name = f"driving-school-{course['id'][:8]}-{int(datetime.utcnow().timestamp())}"
         
-        # Create room via Daily.co API
-        daily_room = await create_daily_room(room_name, duration_hours=room_data.duration_minutes // 60 + 1)
+        try:
+            scheduled_at = to_naive_utc(datetime.fromisoformat(room_data.scheduled_at.replace('Z', '+00:00')))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format")
+        ends_at = scheduled_at + timedelta(minutes=room_data.duration_minutes)
+        
+        # Lease a pre-created room; only create one via Daily.co API if the pool is dry
+        daily_room = await video_room_pool.lease(ends_at)
+        if not daily_room:
+            duration_hours = max(1, int((ends_at - datetime.utcnow()).total_seconds() // 3600) + 1)
+            daily_room = await create_daily_room(room_name, duration_hours=duration_hours)
         
         room_doc = {
             "id": room_id,
@@ -3183,7 +3697,8 @@ async def create_video_room(
             "student_id": room_data.student_id,
             "room_url": daily_room["url"],
             "room_name": daily_room["name"],
-            "scheduled_at": datetime.fromisoformat(room_data.scheduled_at),
+            "scheduled_at": scheduled_at,
+            "ends_at": ends_at,
             "duration_minutes": room_data.duration_minutes,
             "is_active": True,
             "daily_room_id": daily_room["id"],
@@ -3193,6 +3708,7 @@ async def create_video_room(
         }
         
         await db.video_rooms.insert_one(room_doc)
+        await calendar_feed_service.touch_sessions([room_doc])
         
         return {
             "id": room_id,
@@ -3256,6 +3772,7 @@ async def register_external_expert(
             "rating": 0.0,
             "total_exams_conducted": 0,
             "is_available": True,
+            **expert_matcher.matching_fields(expert_data.specialization, expert_data.available_states),
             "created_at": datetime.utcnow()
         }
         
@@ -3337,7 +3854,7 @@ async def schedule_session(
             "updated_at": datetime.utcnow()
         }
         
-        await db.sessions.insert_one(session_doc)
+        await session_scheduler.insert_session(session_doc)
         
         return {"session_id": session_id, "message": "Session scheduled successfully"}
     
@@ -3345,6 +3862,8 @@ async def schedule_session(
         logger.error(f"Schedule session error: {str(e)}")
         if isinstance(e, HTTPException):
             raise e
+        if isinstance(e, (SessionConflictError, SessionDurationError, CalendarBusyError)):
+            raise session_conflict(e)
         raise HTTPException(status_code=500, detail="Failed to schedule session")
 
 @api_router.get("/sessions/my")
@@ -3379,14 +3898,9 @@ async def complete_session(
         if current_user["role"] not in ["teacher", "manager"]:
             raise HTTPException(status_code=403, detail="Only teachers and managers can complete sessions")
         
-        # Get session
-        session = await db.sessions.find_one({"id": session_id})
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found")
-        
-        # Update session
-        await db.sessions.update_one(
-            {"id": session_id},
+        # Update session; a session only counts towards its course once
+        session = await db.sessions.find_one_and_update(
+            {"id": session_id, "status": {"$ne": SessionStatus.COMPLETED}},
             {
                 "$set": {
                     "status": SessionStatus.COMPLETED,
@@ -3395,33 +3909,14 @@ async def complete_session(
                 }
             }
         )
+        if not session:
+            if await db.sessions.count_documents({"id": session_id}, limit=1):
+                raise HTTPException(status_code=400, detail="Session is already completed")
+            raise HTTPException(status_code=404, detail="Session not found")
+        await calendar_feed_service.touch_sessions([session])
         
         # Update course progress
-        course = await db.courses.find_one({"id": session["course_id"]})
-        if course:
-            new_completed = course["completed_sessions"] + 1
-            await db.courses.update_one(
-                {"id": session["course_id"]},
-                {
-                    "$set": {
-                        "completed_sessions": new_completed,
-                        "updated_at": datetime.utcnow()
-                    }
-                }
-            )
-            
-            # Check if course is completed
-            if new_completed >= course["total_sessions"]:
-                await db.courses.update_one(
-                    {"id": session["course_id"]},
-                    {
-                        "$set": {
-                            "status": CourseStatus.COMPLETED,
-                            "exam_status": ExamStatus.AVAILABLE,
-                            "updated_at": datetime.utcnow()
-                        }
-                    }
-                )
+        await record_completed_session(session["course_id"])
         
         return {"message": "Session completed successfully"}
     
@@ -3450,29 +3945,56 @@ async def schedule_exam(
         if course["exam_status"] != ExamStatus.AVAILABLE:
             raise HTTPException(status_code=400, detail="Course is not ready for exam")
         
-        # Find available external expert
-        experts_cursor = db.external_experts.find({
-            "specialization": {"$in": [exam_data.exam_type]},
-            "is_available": True
-        })
-        experts = await experts_cursor.to_list(length=None)
-        
-        if not experts:
-            raise HTTPException(status_code=404, detail="No available external experts for this exam type")
-        
-        # Select first available expert (in real app, would have better logic)
-        expert = experts[0]
+        if not exam_data.preferred_dates:
+            raise HTTPException(status_code=400, detail="At least one preferred date is required")
+        preferred_dates = [to_naive_utc(datetime.fromisoformat(value.replace('Z', '+00:00'))) for value in exam_data.preferred_dates]
+        scheduled_at = preferred_dates[0]  # Use first preferred date
+        
+        # Experts must cover the state of the student's driving school
+        enrollment = await db.enrollments.find_one({"id": course["enrollment_id"]}, {"driving_school_id": 1})
+        school = await db.driving_schools.find_one({"id": enrollment["driving_school_id"]}, {"state": 1}) if enrollment else None
+        state = school.get("state") if school else None
+        
+        # A published slot with a free seat at a preferred time is booked through its capacity counter
+        slot = await exam_slot_service.find_slot(exam_data.exam_type, state, preferred_dates)
+        
+        # Otherwise reserve the least-loaded eligible expert with free capacity,
+        # holding the course's booking claim so parallel requests cannot reserve twice
+        expert = None
+        if not slot:
+            claim = await exam_slot_service.claim_course(course["id"])
+            exam_id = str(uuid.uuid4())
+            try:
+                expert = await expert_matcher.reserve(exam_data.exam_type, state, scheduled_at, exam_id)
+            finally:
+                if not expert:
+                    await exam_slot_service.release_claim(course["id"], claim)
+        if not slot and not expert:
+            # Every option is taken: queue for a full slot if there is one
+            slot = await exam_slot_service.find_slot(exam_data.exam_type, state, preferred_dates, include_full=True)
+            if not slot:
+                raise HTTPException(status_code=404, detail="No available external experts for this exam type")
+        
+        if slot:
+            outcome, booked = await exam_slot_service.book(slot["id"], current_user["id"], course["id"], exam_data.exam_type)
+            if outcome == "waitlisted":
+                return {
+                    "waitlist_id": booked["id"],
+                    "position": booked["position"],
+                    "message": "All exam slots at your preferred dates are full; you have been added to the waitlist"
+                }
+            return {"exam_id": booked["id"], "message": "Exam scheduled successfully"}
         
         # Create exam
-        exam_id = str(uuid.uuid4())
         exam_doc = {
             "id": exam_id,
             "course_id": exam_data.course_id,
             "student_id": current_user["id"],
             "external_expert_id": expert["id"],
             "exam_type": exam_data.exam_type,
-            "scheduled_at": datetime.fromisoformat(exam_data.preferred_dates[0]),  # Use first preferred date
+            "scheduled_at": scheduled_at,
             "location": exam_data.location,
+            "state": state,
             "duration_minutes": 90,
             "status": ExamStatus.AVAILABLE,
             "score": None,
@@ -3480,7 +4002,18 @@ async def schedule_exam(
             "created_at": datetime.utcnow()
         }
         
-        await db.exam_schedules.insert_one(exam_doc)
+        try:
+            await db.exam_schedules.insert_one(exam_doc)
+        except Exception:
+            await expert_matcher.cancel_reservation(expert["id"], exam_id)
+            await exam_slot_service.release_claim(course["id"], claim)
+            raise
+        linked = await db.courses.update_one({"id": course["id"], "exam_booking_id": claim}, {"$set": {"exam_booking_id": exam_id}})
+        if linked.modified_count == 0:
+            # The exam was taken while we were booking: give the expert back
+            await exam_slot_service.cancel(exam_doc)
+            raise HTTPException(status_code=400, detail="Course is not ready for exam")
+        await calendar_feed_service.touch_exams([exam_doc])
         
         return {"exam_id": exam_id, "message": "Exam scheduled successfully"}
     
@@ -3488,8 +4021,184 @@ async def schedule_exam(
         logger.error(f"Schedule exam error: {str(e)}")
         if isinstance(e, HTTPException):
             raise e
+        if isinstance(e, ExamBookingError):
+            raise HTTPException(status_code=409, detail=str(e))
         raise HTTPException(status_code=500, detail="Failed to schedule exam")
 
+async def notify_promoted_exams(exams: List[dict]):
+    await notification_service.notify_batch([
+        (exam["student_id"], "exam_waitlist_promoted", {
+            "exam_id": exam["id"],
+            "exam_type": exam["exam_type"],
+            "location": exam["location"],
+            "scheduled_at": exam["scheduled_at"]
+        })
+        for exam in exams
+    ])
+
+@api_router.post("/exam-slots")
+async def create_exam_slot(
+    slot_data: ExamSlotCreate,
+    current_user = Depends(get_current_user)
+):
+    """Publish a bookable exam slot"""
+    try:
+        if current_user["role"] != "external_expert":
+            raise HTTPException(status_code=403, detail="Only external experts can publish exam slots")
+        
+        expert = await db.external_experts.find_one({"user_id": current_user["id"]})
+        if not expert:
+            raise HTTPException(status_code=404, detail="External expert not found")
+        
+        if slot_data.capacity < 1:
+            raise HTTPException(status_code=400, detail="Capacity must be at least 1")
+        exam_types = slot_data.exam_types or expert["specialization"]
+        if not set(exam_types) <= set(expert["specialization"]):
+            raise HTTPException(status_code=400, detail="Slots can only be published for your specializations")
+        try:
+            starts_at = to_naive_utc(datetime.fromisoformat(slot_data.starts_at.replace('Z', '+00:00')))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format")
+        
+        slot = await exam_slot_service.create_slot(
+            expert,
+            starts_at,
+            slot_data.capacity,
+            slot_data.location,
+            exam_types,
+            duration_minutes=slot_data.duration_minutes
+        )
+        
+        return {"slot_id": slot["id"], "message": "Exam slot published successfully"}
+    
+    except Exception as e:
+        logger.error(f"Create exam slot error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        if isinstance(e, SlotOverlapError):
+            raise HTTPException(status_code=409, detail=str(e))
+        raise HTTPException(status_code=500, detail="Failed to create exam slot")
+
+@api_router.get("/exam-slots")
+async def get_exam_slots(
+    exam_type: CourseType,
+    state: Optional[str] = None,
+    date_from: Optional[str] = None,
+    date_to: Optional[str] = None,
+    current_user = Depends(get_current_user)
+):
+    """Upcoming exam slots for an exam type, optionally in one state"""
+    try:
+        try:
+            start = datetime.fromisoformat(date_from) if date_from else datetime.utcnow()
+            end = datetime.fromisoformat(date_to) if date_to else start + timedelta(days=60)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format")
+        
+        slots = await exam_slot_service.open_slots(exam_type, state, start, end)
+        for slot in slots:
+            slot["seats_left"] = max(slot["capacity"] - slot["booked"], 0)
+        
+        return serialize_doc(slots)
+    
+    except Exception as e:
+        logger.error(f"Get exam slots error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to retrieve exam slots")
+
+@api_router.post("/exam-slots/{slot_id}/book")
+async def book_exam_slot(
+    slot_id: str,
+    booking: ExamSlotBook,
+    current_user = Depends(get_current_user)
+):
+    """Book a seat in an exam slot, or join its waitlist when it is full"""
+    try:
+        if current_user["role"] != "student":
+            raise HTTPException(status_code=403, detail="Only students can book exams")
+        
+        course = await db.courses.find_one({"id": booking.course_id})
+        if not course:
+            raise HTTPException(status_code=404, detail="Course not found")
+        enrollment = await db.enrollments.find_one({"id": course["enrollment_id"]}, {"student_id": 1})
+        if not enrollment or enrollment["student_id"] != current_user["id"]:
+            raise HTTPException(status_code=403, detail="Unauthorized to book exams for this course")
+        if course["exam_status"] != ExamStatus.AVAILABLE:
+            raise HTTPException(status_code=400, detail="Course is not ready for exam")
+        
+        slot = await db.exam_slots.find_one({"id": slot_id}, {"exam_types": 1, "starts_at": 1, "is_open": 1})
+        if not slot or not slot.get("is_open"):
+            raise HTTPException(status_code=404, detail="Exam slot not found")
+        if course["course_type"] not in slot["exam_types"]:
+            raise HTTPException(status_code=400, detail="This slot is not for this exam type")
+        if slot["starts_at"] <= datetime.utcnow():
+            raise HTTPException(status_code=400, detail="This exam slot has already started")
+        
+        outcome, booked = await exam_slot_service.book(slot_id, current_user["id"], course["id"], course["course_type"])
+        if outcome == "booked":
+            return {"status": "booked", "exam_id": booked["id"], "message": "Exam scheduled successfully"}
+        return {
+            "status": "waitlisted",
+            "waitlist_id": booked["id"],
+            "position": booked["position"],
+            "message": "The slot is full; you have been added to the waitlist"
+        }
+    
+    except Exception as e:
+        logger.error(f"Book exam slot error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        if isinstance(e, ExamBookingError):
+            raise HTTPException(status_code=409, detail=str(e))
+        raise HTTPException(status_code=500, detail="Failed to book exam slot")
+
+@api_router.post("/exams/{exam_id}/cancel")
+async def cancel_exam(
+    exam_id: str,
+    current_user = Depends(get_current_user)
+):
+    """Cancel a booked exam; its seat goes to the first student on the waitlist"""
+    try:
+        if current_user["role"] != "student":
+            raise HTTPException(status_code=403, detail="Only students can cancel exams")
+        
+        exam = await db.exam_schedules.find_one({"id": exam_id})
+        if not exam:
+            raise HTTPException(status_code=404, detail="Exam not found")
+        if exam["student_id"] != current_user["id"]:
+            raise HTTPException(status_code=403, detail="Unauthorized to cancel this exam")
+        if exam["status"] != ExamStatus.AVAILABLE:
+            raise HTTPException(status_code=400, detail="Only upcoming exams can be cancelled")
+        
+        promoted = await exam_slot_service.cancel(exam)
+        await notify_promoted_exams(promoted)
+        
+        return {"message": "Exam cancelled successfully"}
+    
+    except Exception as e:
+        logger.error(f"Cancel exam error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to cancel exam")
+
+@api_router.delete("/exam-waitlist/{waitlist_id}")
+async def leave_exam_waitlist(
+    waitlist_id: str,
+    current_user = Depends(get_current_user)
+):
+    try:
+        if not await exam_slot_service.leave_waitlist(waitlist_id, current_user["id"]):
+            raise HTTPException(status_code=404, detail="Waitlist entry not found")
+        
+        return {"message": "Removed from the waitlist"}
+    
+    except Exception as e:
+        logger.error(f"Leave exam waitlist error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to leave waitlist")
+
 @api_router.get("/exams/my")
 async def get_my_exams(current_user = Depends(get_current_user)):
     try:
@@ -3579,22 +4288,26 @@ async def complete_exam(
             }
         )
         
+        await expert_matcher.release(exam_id)
+        await calendar_feed_service.touch_exams([exam])
+        
         # Update course exam status
-        await db.courses.update_one(
+        course = await db.courses.find_one_and_update(
             {"id": exam["course_id"]},
             {
                 "$set": {
                     "exam_status": ExamStatus.PASSED if passed else ExamStatus.FAILED,
                     "exam_score": score,
+                    "exam_booking_id": None,
                     "updated_at": datetime.utcnow()
                 }
-            }
+            },
+            projection={"id": 1, "enrollment_id": 1, "course_type": 1}
         )
         
         # Update course availability for next course
-        course = await db.courses.find_one({"id": exam["course_id"]})
         if course and passed:
-            await update_course_availability(course["enrollment_id"])
+            await unlock_next_course(course)
         
         return {"message": "Exam completed successfully", "passed": passed}
     
@@ -3604,6 +4317,67 @@ async def complete_exam(
             raise e
         raise HTTPException(status_code=500, detail="Failed to complete exam")
 
+# CALENDAR FEED ENDPOINTS
+
+@api_router.post("/calendar/feed-token")
+async def create_calendar_feed_token(request: Request, current_user = Depends(get_current_user)):
+    """Create or rotate the caller's iCalendar feed URL"""
+    try:
+        if current_user["role"] not in ["student", "teacher", "external_expert"]:
+            raise HTTPException(status_code=403, detail="Only students, teachers and external experts have calendar feeds")
+        
+        token = await calendar_feed_service.issue_token(current_user)
+        
+        return {
+            "feed_url": str(request.url_for("get_calendar_feed", token=token)),
+            "message": "Calendar feed created; any previous feed URL no longer works"
+        }
+    
+    except Exception as e:
+        logger.error(f"Create calendar feed token error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to create calendar feed")
+
+@api_router.delete("/calendar/feed-token")
+async def revoke_calendar_feed_token(current_user = Depends(get_current_user)):
+    try:
+        if not await calendar_feed_service.revoke_token(current_user["id"]):
+            raise HTTPException(status_code=404, detail="No calendar feed to revoke")
+        
+        return {"message": "Calendar feed revoked"}
+    
+    except Exception as e:
+        logger.error(f"Revoke calendar feed token error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to revoke calendar feed")
+
+@api_router.get("/calendar/feeds/{token}.ics")
+async def get_calendar_feed(token: str, request: Request):
+    """iCalendar feed of sessions, exams and video rooms; the token in the URL is the credential"""
+    try:
+        feed = await calendar_feed_service.find_feed(token)
+        if not feed or feed.get("is_active") is False:
+            raise HTTPException(status_code=404, detail="Calendar feed not found")
+        
+        etag = await calendar_feed_service.etag(feed)
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+        if etag in [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=304, headers=headers)
+        
+        return StreamingResponse(
+            calendar_feed_service.events(feed),
+            media_type="text/calendar; charset=utf-8",
+            headers=headers
+        )
+    
+    except Exception as e:
+        logger.error(f"Get calendar feed error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to build calendar feed")
+
 # CERTIFICATE ENDPOINTS
 
 @api_router.get("/certificates/my")
@@ -3655,10 +4429,11 @@ async def verify_certificate(cert_id: str):
 # NOTIFICATION ENDPOINTS
 
 @api_router.get("/notifications/my")
-async def get_my_notifications(current_user = Depends(get_current_user)):
+async def get_my_notifications(lang: Optional[str] = None, current_user = Depends(get_current_user)):
     try:
-        notifications_cursor = db.notifications.find({"user_id": current_user["id"]}).sort("created_at", -1)
+        notifications_cursor = db.enhanced_notifications.find({"user_id": current_user["id"]}).sort("created_at", -1)
         notifications = await notifications_cursor.to_list(length=None)
+        notification_service.present_notifications(notifications, current_user, lang)
         
         return serialize_doc(notifications)
     
@@ -3674,20 +4449,10 @@ async def mark_notification_read(
     current_user = Depends(get_current_user)
 ):
     try:
-        # Verify notification ownership
-        notification = await db.notifications.find_one({
-            "id": notification_id,
-            "user_id": current_user["id"]
-        })
-        if not notification:
+        # Ownership is part of the update filter
+        if not await notification_service.mark_as_read(notification_id, current_user["id"]):
             raise HTTPException(status_code=404, detail="Notification not found")
         
-        # Mark as read
-        await db.notifications.update_one(
-            {"id": notification_id},
-            {"$set": {"is_read": True}}
-        )
-        
         return {"message": "Notification marked as read"}
     
     except Exception as e:
@@ -3696,13 +4461,27 @@ async def mark_notification_read(
             raise e
         raise HTTPException(status_code=500, detail="Failed to mark notification as read")
 
+@api_router.post("/notifications/mark-read")
+async def mark_notifications_read_batch(
+    batch: NotificationBatchRead,
+    current_user = Depends(get_current_user)
+):
+    try:
+        updated = await notification_service.mark_many_as_read(batch.notification_ids, current_user["id"])
+        
+        return {"message": "Notifications marked as read", "updated": updated}
+    
+    except Exception as e:
+        logger.error(f"Mark notifications read error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to mark notifications as read")
+
 @api_router.post("/notifications/mark-all-read")
 async def mark_all_notifications_read(current_user = Depends(get_current_user)):
     try:
-        await db.notifications.update_many(
-            {"user_id": current_user["id"], "is_read": False},
-            {"$set": {"is_read": True}}
-        )
+        # Advances the user's read watermark instead of rewriting every notification
+        await notification_service.mark_all_as_read(current_user["id"])
         
         return {"message": "All notifications marked as read"}
     
@@ -3941,30 +4720,11 @@ async def complete_course_session(
         if current_user["role"] not in ["student", "teacher", "manager"]:
             raise HTTPException(status_code=403, detail="Unauthorized to complete sessions")
         
-        # Get course
-        course = await db.courses.find_one({"id": course_id})
+        # Increment completed sessions, completing the course on the last one
+        course = await record_completed_session(course_id)
         if not course:
             raise HTTPException(status_code=404, detail="Course not found")
         
-        # Increment completed sessions
-        new_completed = course["completed_sessions"] + 1
-        
-        # Update course
-        update_data = {
-            "completed_sessions": new_completed,
-            "updated_at": datetime.utcnow()
-        }
-        
-        # Check if course is completed
-        if new_completed >= course["total_sessions"]:
-            update_data["status"] = CourseStatus.COMPLETED
-            update_data["exam_status"] = ExamStatus.AVAILABLE
-        
-        await db.courses.update_one({"id": course_id}, {"$set": update_data})
-        
-        # Update course availability
-        await update_course_availability(course["enrollment_id"])
-        
         return {"message": "Session completed successfully"}
     
     except Exception as e:
@@ -3995,21 +4755,35 @@ async def take_course_exam(
         passing_score = 70.0
         passed = score >= passing_score
         
-        # Update course
-        await db.courses.update_one(
-            {"id": course_id},
+        # Update course, unless another attempt was recorded in the meantime
+        previous = await db.courses.find_one_and_update(
+            {"id": course_id, "exam_status": ExamStatus.AVAILABLE},
             {
                 "$set": {
                     "exam_status": ExamStatus.PASSED if passed else ExamStatus.FAILED,
                     "exam_score": score,
+                    "exam_booking_id": None,
                     "updated_at": datetime.utcnow()
                 }
-            }
+            },
+            projection={"exam_booking_id": 1},
+            return_document=ReturnDocument.BEFORE
         )
+        if not previous:
+            raise HTTPException(status_code=400, detail="Exam is not available for this course")
+        
+        # An exam or waitlist place booked for the course is no longer needed: free the seat and expert
+        booking_id = previous.get("exam_booking_id")
+        if booking_id and not booking_id.startswith("pending:"):
+            booked_exam = await db.exam_schedules.find_one({"id": booking_id, "status": ExamStatus.AVAILABLE})
+            if booked_exam:
+                await notify_promoted_exams(await exam_slot_service.cancel(booked_exam))
+            else:
+                await exam_slot_service.leave_waitlist(booking_id, current_user["id"])
         
         # Update course availability for next course
         if passed:
-            await update_course_availability(course["enrollment_id"])
+            await unlock_next_course(course)
         
         return {"message": "Exam completed successfully", "passed": passed, "score": score}
     
@@ -4095,6 +4869,92 @@ async def get_dashboard(
 
 # PAYMENT ENDPOINTS
 
+@api_router.post("/payments/webhook/{provider}")
+async def receive_payment_webhook(provider: str, request: Request):
+    """Gateway callback: verify, store in the webhook inbox and acknowledge immediately"""
+    try:
+        payload = await request.json()
+        signature = request.headers.get("X-Webhook-Signature") or request.headers.get("X-Signature", "")
+        
+        return await payment_service.process_webhook(provider, payload, signature)
+    
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Payment webhook error: {str(e)}")
+        raise HTTPException(status_code=500, detail="Failed to record payment webhook")
+
+@api_router.post("/manager/payments/reconciliation")
+async def reconcile_settlement_file(
+    provider: str = Form(...),
+    file: UploadFile = File(...),
+    current_user = Depends(get_current_user)
+):
+    """Reconcile a BaridiMob/CCP settlement file against the school's payments"""
+    try:
+        if current_user["role"] != "manager":
+            raise HTTPException(status_code=403, detail="Only managers can reconcile payments")
+        
+        if provider not in ("baridimob", "ccp"):
+            raise HTTPException(status_code=400, detail="Unsupported payment provider")
+        
+        school = await db.driving_schools.find_one({"manager_id": current_user["id"]})
+        if not school:
+            raise HTTPException(status_code=404, detail="No driving school found for this manager")
+        
+        # The upload is read through a text wrapper chunk by chunk, never as a whole,
+        # and parsed in a worker thread so the event loop is not blocked
+        run_id = str(uuid.uuid4())
+        stream = TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+        try:
+            run = await reconciliation_service.reconcile(
+                provider,
+                iter_settlement_rows(stream, detect_format(file.filename or "")),
+                MongoReportSink(db, run_id),
+                school_id=school["id"],
+                run_id=run_id,
+                created_by=current_user["id"]
+            )
+        finally:
+            stream.detach()
+        
+        return serialize_doc(run)
+    
+    except (ValueError, UnicodeDecodeError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid settlement file: {str(e)}")
+    except Exception as e:
+        logger.error(f"Payment reconciliation error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to reconcile settlement file")
+
+@api_router.get("/manager/payments/reconciliation/{run_id}")
+async def get_reconciliation_report(
+    run_id: str,
+    category: Optional[ReconciliationCategory] = None,
+    limit: int = 100,
+    skip: int = 0,
+    current_user = Depends(get_current_user)
+):
+    """Summary and report rows of a reconciliation run"""
+    try:
+        if current_user["role"] != "manager":
+            raise HTTPException(status_code=403, detail="Only managers can view reconciliation reports")
+        
+        run = await db.payment_reconciliations.find_one({"id": run_id, "created_by": current_user["id"]})
+        if not run:
+            raise HTTPException(status_code=404, detail="Reconciliation run not found")
+        
+        items = await reconciliation_service.get_report_items(run_id, category, min(limit, 1000), skip)
+        
+        return {"run": serialize_doc(run), "items": serialize_doc(items)}
+    
+    except Exception as e:
+        logger.error(f"Get reconciliation report error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to retrieve reconciliation report")
+
 @api_router.post("/payments/complete")
 async def complete_payment(
     enrollment_id: str = Form(...),
@@ -4118,17 +4978,10 @@ async def complete_payment(
         # Create notification for manager
         school = await db.driving_schools.find_one({"id": enrollment["driving_school_id"]})
         if school:
-            notification_doc = {
-                "id": str(uuid.uuid4()),
-                "user_id": school["manager_id"],
-                "type": "payment_completed",
-                "title": "Payment Completed",
-                "message": f"Student has completed payment for enrollment at {school['name']}",
-                "is_read": False,
-                "metadata": {"enrollment_id": enrollment_id},
-                "created_at": datetime.utcnow()
-            }
-            await db.notifications.insert_one(notification_doc)
+            await notification_service.notify_many([school["manager_id"]], "enrollment_payment_completed", {
+                "enrollment_id": enrollment_id,
+                "school_name": school["name"]
+            })
         
         return {"message": "Payment completed successfully"}
     
@@ -4264,20 +5117,16 @@ async def accept_document(
                 "reviewed_by": current_user["id"]
             }}
         )
+        await document_status_service.set_statuses(document["user_id"], {document["document_type"]: "accepted"})
         
         # Check if all required documents are now accepted for this user using enhanced function
         document_owner = await db.users.find_one({"id": document["user_id"]})
         
         if document_owner and document_owner["role"] == "student":
-            logger.info(f"Checking document completeness for student {document['user_id']}")
-            
-            # Use the enhanced function with better logging
-            documents_complete = await check_user_documents_complete_enhanced(
-                document["user_id"], 
-                "student"
-            )
-            
-            logger.info(f"Documents complete for student {document['user_id']}: {documents_complete}")
+            # The owner was read after the status map update above
+            documents_complete = document_status_service.is_complete_for(document_owner, "student")
+            if documents_complete is None:
+                documents_complete = await check_user_documents_complete(document["user_id"], "student")
             
             if documents_complete:
                 # Update pending enrollments to pending_approval status
@@ -4301,16 +5150,7 @@ async def accept_document(
                 
                 # Send notification to student
                 if update_result.modified_count > 0:
-                    notification_doc = {
-                        "id": str(uuid.uuid4()),
-                        "user_id": document["user_id"],
-                        "type": "documents_approved",
-                        "title": "Documents Approved",
-                        "message": "All your documents have been approved! Your enrollment is now pending final approval.",
-                        "is_read": False,
-                        "created_at": datetime.utcnow()
-                    }
-                    await db.notifications.insert_one(notification_doc)
+                    await notification_service.notify_many([document["user_id"]], "documents_approved")
                     logger.info(f"Notification sent to student {document['user_id']}")
             else:
                 logger.info(f"Documents not yet complete for student {document['user_id']}")
@@ -4367,19 +5207,15 @@ async def refuse_document(
             {"id": document_id},
             {"$set": {"status": "refused", "refusal_reason": reason, "is_verified": False}}
         )
+        await document_status_service.set_statuses(document["user_id"], {document["document_type"]: "refused"})
         
         # Send notification to student about document refusal
-        notification_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": document["user_id"],
-            "type": "document_refused",
-            "title": "Document Refused",
-            "message": f"Your {document['document_type'].replace('_', ' ')} was refused. Reason: {reason}",
-            "is_read": False,
-            "metadata": {"document_id": document_id, "document_type": document['document_type'], "reason": reason},
-            "created_at": datetime.utcnow()
-        }
-        await db.notifications.insert_one(notification_doc)
+        await notification_service.notify_many([document["user_id"]], "document_refused", {
+            "document_id": document_id,
+            "document_type": document['document_type'],
+            "document_label": document['document_type'].replace('_', ' '),
+            "reason": reason
+        })
         
         return {"message": "Document refused successfully"}
     
@@ -4545,17 +5381,10 @@ async def check_and_generate_certificate(enrollment_id: str):
                 await db.certificates.insert_one(certificate_doc)
                 
                 # Send notification
-                notification_doc = {
-                    "id": str(uuid.uuid4()),
-                    "user_id": enrollment["student_id"],
-                    "type": NotificationType.CERTIFICATE_READY,
-                    "title": "Certificate Ready!",
-                    "message": f"Congratulations! Your driving certificate is ready for download.",
-                    "is_read": False,
-                    "metadata": {"certificate_id": cert_id, "certificate_number": cert_number},
-                    "created_at": datetime.utcnow()
-                }
-                await db.notifications.insert_one(notification_doc)
+                await notification_service.notify_many([enrollment["student_id"]], "certificate_ready", {
+                    "certificate_id": cert_id,
+                    "certificate_number": cert_number
+                })
                 
                 return cert_id
         
@@ -4603,22 +5432,26 @@ async def complete_exam_updated(
             }
         )
         
+        await expert_matcher.release(exam_id)
+        await calendar_feed_service.touch_exams([exam])
+        
         # Update course exam status
-        await db.courses.update_one(
+        course = await db.courses.find_one_and_update(
             {"id": exam["course_id"]},
             {
                 "$set": {
                     "exam_status": ExamStatus.PASSED if passed else ExamStatus.FAILED,
                     "exam_score": score,
+                    "exam_booking_id": None,
                     "updated_at": datetime.utcnow()
                 }
-            }
+            },
+            projection={"id": 1, "enrollment_id": 1, "course_type": 1}
         )
         
         # Update course availability for next course
-        course = await db.courses.find_one({"id": exam["course_id"]})
         if course and passed:
-            await update_course_availability(course["enrollment_id"])
+            await unlock_next_course(course)
             
             # Check if all courses completed and generate certificate
             cert_id = await check_and_generate_certificate(course["enrollment_id"])
@@ -5101,8 +5934,8 @@ async def create_session(
             "updated_at": datetime.utcnow()
         }
         
-        # Insert session
-        await db.sessions.insert_one(session_doc)
+        # Insert session unless the teacher or student is already booked
+        await session_scheduler.insert_session(session_doc)
         
         return {"message": "Session created successfully", "session_id": session_id}
         
@@ -5110,6 +5943,8 @@ async def create_session(
         logger.error(f"Create session error: {str(e)}")
         if isinstance(e, HTTPException):
             raise e
+        if isinstance(e, (SessionConflictError, SessionDurationError, CalendarBusyError)):
+            raise session_conflict(e)
         raise HTTPException(status_code=500, detail="Failed to create session")
 
 # TEACHER ASSIGNMENT ENDPOINTS - NEW FUNCTIONALITY
@@ -5227,39 +6062,21 @@ async def assign_teacher_to_course(
         # Get teacher user details for response
         teacher_user = await db.users.find_one({"id": teacher["user_id"]})
         
-        # Send notification to student about teacher assignment
-        notification_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": enrollment["student_id"],
-            "type": "teacher_assigned",
-            "title": "Teacher Assigned to Your Course",
-            "message": f"Teacher {teacher_user['first_name']} {teacher_user['last_name']} has been assigned to your {course['course_type']} course.",
-            "is_read": False,
-            "metadata": {
+        # Notify the student and the teacher about the assignment
+        await notification_service.notify_batch([
+            (enrollment["student_id"], "course_teacher_assigned", {
                 "course_id": course_id,
                 "teacher_id": teacher_id,
+                "teacher_name": f"{teacher_user['first_name']} {teacher_user['last_name']}",
                 "course_type": course["course_type"]
-            },
-            "created_at": datetime.utcnow()
-        }
-        await db.notifications.insert_one(notification_doc)
-        
-        # Send notification to teacher about assignment
-        teacher_notification_doc = {
-            "id": str(uuid.uuid4()),
-            "user_id": teacher["user_id"],
-            "type": "student_assigned",
-            "title": "New Student Assigned",
-            "message": f"You have been assigned to teach {student['first_name']} {student['last_name']} for {course['course_type']} course.",
-            "is_read": False,
-            "metadata": {
+            }),
+            (teacher["user_id"], "course_student_assigned", {
                 "course_id": course_id,
                 "student_id": enrollment["student_id"],
+                "student_name": f"{student['first_name']} {student['last_name']}",
                 "course_type": course["course_type"]
-            },
-            "created_at": datetime.utcnow()
-        }
-        await db.notifications.insert_one(teacher_notification_doc)
+            })
+        ])
         
         return {
             "message": "Teacher assigned successfully",
@@ -5412,6 +6229,44 @@ async def get_teacher_students_legacy(current_user = Depends(get_current_user)):
 
 # ENHANCED SCHEDULE MANAGEMENT ENDPOINTS - PHASE 2 FIX
 
+async def verify_schedule_pair(current_user: dict, teacher_id: str, student_id: str, course_id: str):
+    """Check the manager may schedule this teacher-student pair; returns (teacher_user, student_user)"""
+    # Get course to verify it exists and belongs to manager's school
+    course = await db.courses.find_one({"id": course_id})
+    if not course:
+        raise HTTPException(status_code=404, detail="Course not found")
+    
+    # Get enrollment to verify school ownership
+    enrollment = await db.enrollments.find_one({"id": course["enrollment_id"]})
+    if not enrollment:
+        raise HTTPException(status_code=404, detail="Enrollment not found")
+    
+    # Verify manager owns this school
+    school = await db.driving_schools.find_one({
+        "id": enrollment["driving_school_id"],
+        "manager_id": current_user["id"]
+    })
+    if not school:
+        raise HTTPException(status_code=403, detail="Unauthorized to create schedules for this school")
+    
+    # Verify teacher is assigned to this course
+    if course["teacher_id"] != teacher_id:
+        raise HTTPException(status_code=400, detail="Teacher is not assigned to this course")
+    
+    # Verify student belongs to this enrollment
+    if enrollment["student_id"] != student_id:
+        raise HTTPException(status_code=400, detail="Student does not belong to this course")
+    
+    # Get teacher and student details for notifications
+    teacher = await db.teachers.find_one({"id": teacher_id})
+    teacher_user = await db.users.find_one({"id": teacher["user_id"]}) if teacher else None
+    student_user = await db.users.find_one({"id": student_id})
+    
+    if not teacher_user or not student_user:
+        raise HTTPException(status_code=404, detail="Teacher or student not found")
+    
+    return teacher_user, student_user
+
 @api_router.post("/manager/create-schedule")
 async def create_schedule_for_assigned_students(
     teacher_id: str = Form(...),
@@ -5419,7 +6274,7 @@ async def create_schedule_for_assigned_students(
     course_id: str = Form(...),
     session_type: str = Form(...),
     scheduled_at: str = Form(...),
-    duration_minutes: int = Form(60),
+    duration_minutes: int = Form(60, gt=0, le=MAX_SESSION_MINUTES),
     location: str = Form(""),
     current_user = Depends(get_current_user)
 ):
@@ -5428,39 +6283,7 @@ async def create_schedule_for_assigned_students(
         if current_user["role"] != "manager":
             raise HTTPException(status_code=403, detail="Only managers can create schedules")
         
-        # Get course to verify it exists and belongs to manager's school
-        course = await db.courses.find_one({"id": course_id})
-        if not course:
-            raise HTTPException(status_code=404, detail="Course not found")
-        
-        # Get enrollment to verify school ownership
-        enrollment = await db.enrollments.find_one({"id": course["enrollment_id"]})
-        if not enrollment:
-            raise HTTPException(status_code=404, detail="Enrollment not found")
-        
-        # Verify manager owns this school
-        school = await db.driving_schools.find_one({
-            "id": enrollment["driving_school_id"],
-            "manager_id": current_user["id"]
-        })
-        if not school:
-            raise HTTPException(status_code=403, detail="Unauthorized to create schedules for this school")
-        
-        # Verify teacher is assigned to this course
-        if course["teacher_id"] != teacher_id:
-            raise HTTPException(status_code=400, detail="Teacher is not assigned to this course")
-        
-        # Verify student belongs to this enrollment
-        if enrollment["student_id"] != student_id:
-            raise HTTPException(status_code=400, detail="Student does not belong to this course")
-        
-        # Get teacher and student details for notifications
-        teacher = await db.teachers.find_one({"id": teacher_id})
-        teacher_user = await db.users.find_one({"id": teacher["user_id"]}) if teacher else None
-        student_user = await db.users.find_one({"id": student_id})
-        
-        if not teacher_user or not student_user:
-            raise HTTPException(status_code=404, detail="Teacher or student not found")
+        teacher_user, student_user = await verify_schedule_pair(current_user, teacher_id, student_id, course_id)
         
         # Create session document
         session_id = str(uuid.uuid4())
@@ -5479,46 +6302,28 @@ async def create_schedule_for_assigned_students(
             "updated_at": datetime.utcnow()
         }
         
-        # Insert session
-        await db.sessions.insert_one(session_doc)
+        # Insert session unless the teacher or student is already booked
+        await session_scheduler.insert_session(session_doc)
         
-        # Send notification to student
-        student_notification = {
-            "id": str(uuid.uuid4()),
-            "user_id": student_id,
-            "type": "session_scheduled",
-            "title": "New Session Scheduled",
-            "message": f"A {session_type} session has been scheduled with teacher {teacher_user['first_name']} {teacher_user['last_name']} on {datetime.fromisoformat(scheduled_at.replace('Z', '+00:00')).strftime('%B %d, %Y at %H:%M')}.",
-            "is_read": False,
-            "metadata": {
+        # Notify the student and the teacher
+        await notification_service.notify_batch([
+            (student_id, "session_scheduled_student", {
                 "session_id": session_id,
                 "teacher_id": teacher_id,
+                "teacher_name": f"{teacher_user['first_name']} {teacher_user['last_name']}",
                 "course_id": course_id,
                 "session_type": session_type,
-                "scheduled_at": scheduled_at
-            },
-            "created_at": datetime.utcnow()
-        }
-        await db.notifications.insert_one(student_notification)
-        
-        # Send notification to teacher
-        teacher_notification = {
-            "id": str(uuid.uuid4()),
-            "user_id": teacher_user["id"],
-            "type": "session_scheduled",
-            "title": "New Session Scheduled",
-            "message": f"A {session_type} session has been scheduled with student {student_user['first_name']} {student_user['last_name']} on {datetime.fromisoformat(scheduled_at.replace('Z', '+00:00')).strftime('%B %d, %Y at %H:%M')}.",
-            "is_read": False,
-            "metadata": {
+                "scheduled_at": session_doc["scheduled_at"]
+            }),
+            (teacher_user["id"], "session_scheduled_teacher", {
                 "session_id": session_id,
                 "student_id": student_id,
+                "student_name": f"{student_user['first_name']} {student_user['last_name']}",
                 "course_id": course_id,
                 "session_type": session_type,
-                "scheduled_at": scheduled_at
-            },
-            "created_at": datetime.utcnow()
-        }
-        await db.notifications.insert_one(teacher_notification)
+                "scheduled_at": session_doc["scheduled_at"]
+            })
+        ])
         
         return {
             "session_id": session_id,
@@ -5534,8 +6339,121 @@ async def create_schedule_for_assigned_students(
         logger.error(f"Create schedule error: {str(e)}")
         if isinstance(e, HTTPException):
             raise e
+        if isinstance(e, (SessionConflictError, SessionDurationError, CalendarBusyError)):
+            raise session_conflict(e)
         raise HTTPException(status_code=500, detail="Failed to create schedule")
 
+MAX_SERIES_SESSIONS = int(os.environ.get('MAX_SERIES_SESSIONS', '200'))
+
+@api_router.post("/manager/create-schedule/bulk")
+async def create_schedule_series(
+    series: SessionSeriesCreate,
+    current_user = Depends(get_current_user)
+):
+    """Create a recurring series or a list of sessions between an assigned teacher and student"""
+    try:
+        if current_user["role"] != "manager":
+            raise HTTPException(status_code=403, detail="Only managers can create schedules")
+        if (series.recurrence is None) == (series.slots is None):
+            raise HTTPException(status_code=400, detail="Provide either a recurrence or a list of slots")
+        if series.duration_minutes <= 0:
+            raise HTTPException(status_code=400, detail="Session duration must be positive")
+        
+        try:
+            if series.recurrence:
+                recurrence = series.recurrence
+                if any(weekday not in range(7) for weekday in recurrence.weekdays):
+                    raise HTTPException(status_code=400, detail="Weekdays must be between 0 (Monday) and 6 (Sunday)")
+                if recurrence.weeks is None and recurrence.count is None:
+                    raise HTTPException(status_code=400, detail="A recurrence needs a number of weeks or sessions")
+                starts = expand_weekly_series(
+                    date.fromisoformat(recurrence.start_date),
+                    recurrence.weekdays,
+                    time.fromisoformat(recurrence.start_time),
+                    weeks=recurrence.weeks,
+                    count=min(recurrence.count or MAX_SERIES_SESSIONS + 1, MAX_SERIES_SESSIONS + 1)
+                )
+            else:
+                starts = sorted({to_naive_utc(datetime.fromisoformat(slot.replace('Z', '+00:00'))) for slot in series.slots})
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date or time format")
+        if not starts:
+            raise HTTPException(status_code=400, detail="The series contains no sessions")
+        if len(starts) > MAX_SERIES_SESSIONS:
+            raise HTTPException(status_code=400, detail=f"A series can contain at most {MAX_SERIES_SESSIONS} sessions")
+        
+        # Ownership and assignment are validated once for the whole series
+        teacher_user, student_user = await verify_schedule_pair(current_user, series.teacher_id, series.student_id, series.course_id)
+        
+        series_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        sessions = [
+            {
+                "id": str(uuid.uuid4()),
+                "course_id": series.course_id,
+                "teacher_id": series.teacher_id,
+                "student_id": series.student_id,
+                "session_type": series.session_type,
+                "scheduled_at": scheduled_at,
+                "duration_minutes": series.duration_minutes,
+                "location": series.location,
+                "status": SessionStatus.SCHEDULED,
+                "notes": None,
+                "series_id": series_id,
+                "created_at": now,
+                "updated_at": now
+            }
+            for scheduled_at in starts
+        ]
+        
+        # One conflict pass over the whole series, then one insert_many
+        skipped = await session_scheduler.insert_sessions(sessions, skip_conflicts=series.skip_conflicts)
+        skipped_ids = {session["id"] for session, _ in skipped}
+        created = [session for session in sessions if session["id"] not in skipped_ids]
+        
+        if created:
+            teacher_name = f"{teacher_user['first_name']} {teacher_user['last_name']}"
+            student_name = f"{student_user['first_name']} {student_user['last_name']}"
+            series_params = {
+                "series_id": series_id,
+                "course_id": series.course_id,
+                "session_type": series.session_type,
+                "session_count": len(created),
+                "first_session": created[0]["scheduled_at"],
+                "last_session": created[-1]["scheduled_at"]
+            }
+            await notification_service.notify_batch([
+                (series.student_id, "session_series_scheduled_student", {
+                    **series_params,
+                    "teacher_id": series.teacher_id,
+                    "teacher_name": teacher_name
+                }),
+                (teacher_user["id"], "session_series_scheduled_teacher", {
+                    **series_params,
+                    "student_id": series.student_id,
+                    "student_name": student_name
+                })
+            ])
+        
+        return {
+            "series_id": series_id,
+            "message": f"{len(created)} sessions scheduled",
+            "sessions": serialize_doc(created),
+            "total_created": len(created),
+            "skipped": serialize_doc([
+                {"scheduled_at": session["scheduled_at"], "conflict": conflict}
+                for session, conflict in skipped
+            ])
+        }
+    
+    except Exception as e:
+        logger.error(f"Create schedule series error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        if isinstance(e, (SessionConflictError, SessionDurationError, CalendarBusyError)):
+            raise session_conflict(e)
+        raise HTTPException(status_code=500, detail="Failed to create schedule series")
+
 @api_router.get("/manager/assigned-teacher-student-pairs/{school_id}")
 async def get_assigned_teacher_student_pairs(
     school_id: str,
@@ -5610,6 +6528,259 @@ async def get_assigned_teacher_student_pairs(
             raise e
         raise HTTPException(status_code=500, detail="Failed to retrieve teacher-student pairs")
 
+def availability_windows(windows: List[AvailabilityWindow]) -> list:
+    try:
+        parsed = [(window.weekday, time.fromisoformat(window.start_time), time.fromisoformat(window.end_time)) for window in windows]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Availability times must be HH:MM")
+    for weekday, start, end in parsed:
+        if weekday not in range(7):
+            raise HTTPException(status_code=400, detail="Weekdays must be between 0 (Monday) and 6 (Sunday)")
+        if end != time(0, 0) and end <= start:
+            raise HTTPException(status_code=400, detail="Availability windows must end after they start")
+    return parsed
+
+async def get_managed_teacher(teacher_id: str, current_user: dict) -> dict:
+    """The teacher record, if the current user is that teacher or manages their school"""
+    teacher = await db.teachers.find_one({"id": teacher_id})
+    if not teacher:
+        raise HTTPException(status_code=404, detail="Teacher not found")
+    if current_user["role"] == "teacher" and teacher["user_id"] == current_user["id"]:
+        return teacher
+    if current_user["role"] == "manager":
+        school = await db.driving_schools.find_one({"id": teacher["driving_school_id"], "manager_id": current_user["id"]})
+        if school:
+            return teacher
+    raise HTTPException(status_code=403, detail="Unauthorized to manage this teacher")
+
+@api_router.get("/teachers/{teacher_id}/working-hours")
+async def get_teacher_working_hours(
+    teacher_id: str,
+    current_user = Depends(get_current_user)
+):
+    """Get a teacher's weekly working-hour template"""
+    try:
+        teacher = await db.teachers.find_one({"id": teacher_id}, {"working_hours": 1})
+        if not teacher:
+            raise HTTPException(status_code=404, detail="Teacher not found")
+        
+        return {
+            "teacher_id": teacher_id,
+            "windows": teacher.get("working_hours") or [
+                {"weekday": weekday, "start_time": start.strftime('%H:%M'), "end_time": end.strftime('%H:%M')}
+                for weekday, start, end in DEFAULT_WORKING_HOURS
+            ],
+            "is_default": not teacher.get("working_hours")
+        }
+    
+    except Exception as e:
+        logger.error(f"Get working hours error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to retrieve working hours")
+
+@api_router.put("/teachers/{teacher_id}/working-hours")
+async def update_teacher_working_hours(
+    teacher_id: str,
+    working_hours: WorkingHoursUpdate,
+    current_user = Depends(get_current_user)
+):
+    """Store a teacher's weekly working-hour template"""
+    try:
+        await get_managed_teacher(teacher_id, current_user)
+        availability_windows(working_hours.windows)
+        
+        windows = [window.dict() for window in working_hours.windows]
+        await teacher_availability_service.set_working_hours(teacher_id, windows)
+        
+        return {"message": "Working hours updated successfully", "windows": windows}
+    
+    except Exception as e:
+        logger.error(f"Update working hours error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to update working hours")
+
+@api_router.get("/teachers/free-slots")
+async def get_teacher_free_slots(
+    teacher_ids: str,
+    start_date: str,
+    end_date: str,
+    min_minutes: int = 15,
+    current_user = Depends(get_current_user)
+):
+    """Free periods of one or more teachers (comma-separated ids) between two dates"""
+    try:
+        ids = [teacher_id.strip() for teacher_id in teacher_ids.split(',') if teacher_id.strip()]
+        try:
+            first_day = date.fromisoformat(start_date)
+            last_day = date.fromisoformat(end_date)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date format. Use YYYY-MM-DD")
+        if not ids:
+            raise HTTPException(status_code=400, detail="At least one teacher id is required")
+        if len(ids) > teacher_availability_service.max_teachers:
+            raise HTTPException(status_code=400, detail=f"At most {teacher_availability_service.max_teachers} teachers per query")
+        if last_day < first_day or (last_day - first_day).days >= teacher_availability_service.max_days:
+            raise HTTPException(status_code=400, detail=f"The date range must cover 1 to {teacher_availability_service.max_days} days")
+        
+        free_slots = await teacher_availability_service.free_slots(ids, first_day, last_day, min_minutes=max(min_minutes, 1))
+        
+        return {
+            "teachers": [
+                {"teacher_id": teacher_id, "free_slots": serialize_doc(slots)}
+                for teacher_id, slots in free_slots.items()
+            ],
+            "start_date": start_date,
+            "end_date": end_date
+        }
+    
+    except Exception as e:
+        logger.error(f"Get free slots error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        raise HTTPException(status_code=500, detail="Failed to retrieve free slots")
+
+@api_router.post("/manager/schools/{school_id}/timetable")
+async def generate_weekly_timetable(
+    school_id: str,
+    timetable: TimetableGenerate,
+    current_user = Depends(get_current_user)
+):
+    """Plan a conflict-free week of sessions for a school's assigned teacher-student pairs"""
+    try:
+        if current_user["role"] != "manager":
+            raise HTTPException(status_code=403, detail="Only managers can generate timetables")
+        
+        school = await db.driving_schools.find_one({
+            "id": school_id,
+            "manager_id": current_user["id"]
+        })
+        if not school:
+            raise HTTPException(status_code=403, detail="Unauthorized to access this school")
+        
+        try:
+            week_start = date.fromisoformat(timetable.week_start)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="week_start must be an ISO date")
+        if timetable.session_duration_minutes <= 0:
+            raise HTTPException(status_code=400, detail="Session duration must be positive")
+        
+        # Load every pair of the school with a handful of queries
+        enrollments = await db.enrollments.find(
+            {"driving_school_id": school_id, "enrollment_status": EnrollmentStatus.APPROVED},
+            {"id": 1, "student_id": 1}
+        ).to_list(length=None)
+        student_by_enrollment = {enrollment["id"]: enrollment["student_id"] for enrollment in enrollments}
+        courses = await db.courses.find(
+            {"enrollment_id": {"$in": list(student_by_enrollment)}},
+            {"id": 1, "enrollment_id": 1, "course_type": 1, "status": 1, "teacher_id": 1, "total_sessions": 1, "completed_sessions": 1}
+        ).to_list(length=None)
+        pending_counts = {
+            row["_id"]: row["count"]
+            async for row in db.sessions.aggregate([
+                {"$match": {"course_id": {"$in": [course["id"] for course in courses]}, "status": SessionStatus.SCHEDULED}},
+                {"$group": {"_id": "$course_id", "count": {"$sum": 1}}}
+            ])
+        }
+        
+        courses_by_student = {}
+        for course in courses:
+            courses_by_student.setdefault(student_by_enrollment[course["enrollment_id"]], []).append(course)
+        selected = set(timetable.course_ids) if timetable.course_ids is not None else None
+        students = []
+        for student_id, student_courses in courses_by_student.items():
+            planned = plannable_courses(student_courses, pending_counts)
+            if selected is not None:
+                planned = [course for course in planned if course.course_id in selected]
+            if any(course.remaining for course in planned):
+                students.append(StudentPlan(student_id=student_id, courses=planned))
+        
+        # Windows given here win over the teachers' stored working hours
+        default_windows = availability_windows(timetable.default_availability) if timetable.default_availability else DEFAULT_WORKING_HOURS
+        teacher_ids = {course.teacher_id for student in students for course in student.courses}
+        availability = await teacher_availability_service.working_hours(list(teacher_ids), default=default_windows)
+        availability.update({
+            teacher_id: availability_windows(windows)
+            for teacher_id, windows in timetable.teacher_availability.items()
+        })
+        
+        week_begins = datetime.combine(week_start, datetime.min.time())
+        week_ends = week_begins + timedelta(days=7)
+        bookings = await session_scheduler.load_calendars(
+            teacher_ids,
+            [student.student_id for student in students],
+            week_begins,
+            week_ends
+        )
+        now = datetime.utcnow()
+        solver = WeeklyTimetableSolver(
+            session_scheduler,
+            bookings,
+            week_start,
+            duration_minutes=timetable.session_duration_minutes,
+            max_per_day=timetable.max_sessions_per_student_per_day,
+            max_per_week=timetable.max_sessions_per_student_per_week,
+            not_before=now
+        )
+        timetable_id = str(uuid.uuid4())
+        sessions, unplaced = solver.solve(students, availability, {
+            "location": timetable.location,
+            "status": SessionStatus.SCHEDULED,
+            "notes": None,
+            "timetable_id": timetable_id,
+            "created_at": now,
+            "updated_at": now
+        })
+        
+        if timetable.commit and sessions:
+            await session_scheduler.insert_sessions(sessions)
+            
+            # One summary notification per student and per teacher
+            teachers = await db.teachers.find({"id": {"$in": list(teacher_ids)}}, {"id": 1, "user_id": 1}).to_list(length=None)
+            teacher_user_ids = {teacher["id"]: teacher["user_id"] for teacher in teachers}
+            week_start_date = datetime.combine(week_start, time(0, 0))
+            by_student, by_teacher = {}, {}
+            for session in sessions:
+                by_student.setdefault(session["student_id"], []).append(session)
+                by_teacher.setdefault(session["teacher_id"], []).append(session)
+            notifications = [
+                (student_id, "timetable_published_student", {
+                    "timetable_id": timetable_id,
+                    "session_count": len(student_sessions),
+                    "week_start_date": week_start_date,
+                    "first_session": min(session["scheduled_at"] for session in student_sessions)
+                })
+                for student_id, student_sessions in by_student.items()
+            ]
+            notifications += [
+                (teacher_user_ids[teacher_id], "timetable_published_teacher", {
+                    "timetable_id": timetable_id,
+                    "session_count": len(teacher_sessions),
+                    "student_count": len({session["student_id"] for session in teacher_sessions}),
+                    "week_start_date": week_start_date
+                })
+                for teacher_id, teacher_sessions in by_teacher.items() if teacher_id in teacher_user_ids
+            ]
+            await notification_service.notify_batch(notifications)
+        
+        return {
+            "timetable_id": timetable_id,
+            "committed": bool(timetable.commit and sessions),
+            "sessions": serialize_doc(sorted(sessions, key=lambda session: session["scheduled_at"])),
+            "total_sessions": len(sessions),
+            "unplaced_sessions": unplaced,
+            "total_unplaced": sum(unplaced.values())
+        }
+    
+    except Exception as e:
+        logger.error(f"Generate timetable error: {str(e)}")
+        if isinstance(e, HTTPException):
+            raise e
+        if isinstance(e, (SessionConflictError, SessionDurationError, CalendarBusyError)):
+            raise session_conflict(e)
+        raise HTTPException(status_code=500, detail="Failed to generate timetable")
+
 app.include_router(api_router)
 
 if __name__ == "__main__":
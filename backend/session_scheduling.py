@@ -0,0 +1,335 @@
+# Session Conflict Detection for Driving School Platform
+import os
+import uuid
+import asyncio
+import logging
+from bisect import bisect_left, insort
+from contextlib import asynccontextmanager
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+# Sessions never run longer than this (enforced on insert); it bounds how far back an overlap range query looks
+MAX_SESSION_MINUTES = int(os.environ.get('SESSION_MAX_DURATION_MINUTES', '240'))
+
+# Statuses whose time slot is free again
+FREED_SESSION_STATUSES = ["cancelled"]
+
+class SessionConflictError(Exception):
+    """A session overlaps an existing booking of the same teacher or student"""
+
+    def __init__(self, conflicts: List[Dict]):
+        self.conflicts = conflicts
+        first = conflicts[0]
+        super().__init__(
+            f"{first['conflict_with'].capitalize()} already has a session from "
+            f"{first['scheduled_at'].strftime('%Y-%m-%d %H:%M')} to {first['ends_at'].strftime('%H:%M')}"
+        )
+
+class SessionDurationError(ValueError):
+    """A session is not between 1 and MAX_SESSION_MINUTES long"""
+
+class CalendarBusyError(Exception):
+    """Another request is booking the same calendar; the client should retry"""
+
+def to_naive_utc(value: datetime) -> datetime:
+    """MongoDB returns naive UTC datetimes; compare everything in that form"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def check_duration(session: Dict):
+    """Overlap checks only look back MAX_SESSION_MINUTES, so longer sessions must never be stored"""
+    duration = session.get("duration_minutes") or 60
+    if not 0 < duration <= MAX_SESSION_MINUTES:
+        raise SessionDurationError(f"Sessions must last between 1 and {MAX_SESSION_MINUTES} minutes")
+
+def session_end(session: Dict) -> datetime:
+    return session["scheduled_at"] + timedelta(minutes=session.get("duration_minutes") or 60)
+
+class IntervalIndex:
+    """Booked intervals of one calendar day, sorted by start time.
+
+    Bookings of a calendar do not overlap each other, so the only candidates
+    for overlapping [start, end) are the bookings starting in
+    [start - MAX_SESSION_MINUTES, end): a bisect finds them in O(log n).
+    """
+
+    def __init__(self):
+        self._intervals: List[Tuple[datetime, datetime, str]] = []
+
+    def __len__(self):
+        return len(self._intervals)
+
+    def overlapping(self, start: datetime, end: datetime) -> Optional[Tuple[datetime, datetime, str]]:
+        position = bisect_left(self._intervals, (end,))
+        earliest = start - timedelta(minutes=MAX_SESSION_MINUTES)
+        # Walk back over the few bookings that start early enough to reach `start`
+        while position > 0:
+            position -= 1
+            interval = self._intervals[position]
+            if interval[0] < earliest:
+                break
+            if interval[1] > start:
+                return interval
+        return None
+
+    def add(self, start: datetime, end: datetime, session_id: str):
+        insort(self._intervals, (start, end, session_id))
+
+class BookingIndex:
+    """In-memory interval indexes keyed by (calendar, day), for validating bulk plans"""
+
+    def __init__(self):
+        self._days: Dict[Tuple[str, object], IntervalIndex] = {}
+
+    def _day(self, calendar: str, day) -> IntervalIndex:
+        index = self._days.get((calendar, day))
+        if index is None:
+            index = self._days[(calendar, day)] = IntervalIndex()
+        return index
+
+    def find(self, calendar: str, start: datetime, end: datetime) -> Optional[Tuple[datetime, datetime, str]]:
+        days = {(start - timedelta(minutes=MAX_SESSION_MINUTES)).date(), start.date(), end.date()}
+        for day in days:
+            index = self._days.get((calendar, day))
+            if index:
+                interval = index.overlapping(start, end)
+                if interval:
+                    return interval
+        return None
+
+    def add(self, calendar: str, start: datetime, end: datetime, session_id: str):
+        self._day(calendar, start.date()).add(start, end, session_id)
+
+def _calendars(session: Dict) -> List[Tuple[str, str]]:
+    calendars = [("teacher", session.get("teacher_id")), ("student", session.get("student_id"))]
+    return [(role, calendar_id) for role, calendar_id in calendars if calendar_id]
+
+def _conflict(role: str, start: datetime, end: datetime, session_id: str) -> Dict:
+    return {"conflict_with": role, "session_id": session_id, "scheduled_at": start, "ends_at": end}
+
+def expand_weekly_series(
+    start_date: date,
+    weekdays: List[int],
+    start_time: time,
+    weeks: Optional[int] = None,
+    count: Optional[int] = None
+) -> List[datetime]:
+    """Start times of a weekly series ("every Sun/Tue 09:00 for 10 weeks"), Monday = 0.
+
+    The series runs for `weeks` weeks from `start_date`, or until `count`
+    sessions when only a count is given; with both, whichever ends first.
+    """
+    if not weekdays or (weeks is None and count is None):
+        return []
+    days = set(weekdays)
+    last_day = start_date + timedelta(weeks=weeks) if weeks is not None else None
+    starts = []
+    day = start_date
+    while (last_day is None or day < last_day) and (count is None or len(starts) < count):
+        if day.weekday() in days:
+            starts.append(datetime.combine(day, start_time))
+        day += timedelta(days=1)
+    return starts
+
+class SessionScheduler:
+    """Rejects sessions that overlap another booking of the same teacher or student.
+
+    Single inserts run an overlap range query on the (teacher_id, scheduled_at)
+    and (student_id, scheduled_at) indexes. Bulk plans load the affected
+    calendars once into a `BookingIndex` and check every planned session in
+    memory, including against each other. Inserts hold short-lived locks in
+    `calendar_locks`, so concurrent requests on different workers cannot both
+    book the same slot.
+    """
+
+    def __init__(self, db_client, calendar_feeds=None):
+        self.db = db_client.driving_school_platform
+        self.calendar_feeds = calendar_feeds
+        self.lock_ttl_seconds = int(os.environ.get('CALENDAR_LOCK_TTL_SECONDS', '10'))
+        self.lock_wait_seconds = float(os.environ.get('CALENDAR_LOCK_WAIT_SECONDS', '3'))
+
+    async def ensure_indexes(self):
+        await self.db.sessions.create_index([("teacher_id", ASCENDING), ("scheduled_at", ASCENDING)])
+        await self.db.sessions.create_index([("student_id", ASCENDING), ("scheduled_at", ASCENDING)])
+        await self.db.calendar_locks.create_index("expires_at", expireAfterSeconds=0)
+
+    def _range_query(self, role: str, calendar_ids, start: datetime, end: datetime) -> Dict:
+        return {
+            f"{role}_id": calendar_ids,
+            "scheduled_at": {"$gt": start - timedelta(minutes=MAX_SESSION_MINUTES), "$lt": end},
+            "status": {"$nin": FREED_SESSION_STATUSES}
+        }
+
+    async def find_conflicts(
+        self,
+        teacher_id: Optional[str],
+        student_id: Optional[str],
+        scheduled_at: datetime,
+        duration_minutes: int,
+        exclude_session_id: Optional[str] = None
+    ) -> List[Dict]:
+        """Existing bookings overlapping [scheduled_at, scheduled_at + duration)"""
+        start = to_naive_utc(scheduled_at)
+        end = start + timedelta(minutes=duration_minutes)
+        conflicts = []
+        for role, calendar_id in _calendars({"teacher_id": teacher_id, "student_id": student_id}):
+            async for session in self.db.sessions.find(
+                self._range_query(role, calendar_id, start, end),
+                {"id": 1, "scheduled_at": 1, "duration_minutes": 1}
+            ):
+                if session["id"] != exclude_session_id and session_end(session) > start:
+                    conflicts.append(_conflict(role, session["scheduled_at"], session_end(session), session["id"]))
+        return conflicts
+
+    async def load_bookings(self, sessions: List[Dict]) -> BookingIndex:
+        """Existing bookings of every calendar a plan touches, over the plan's time window"""
+        if not sessions:
+            return BookingIndex()
+        window_start = min(to_naive_utc(session["scheduled_at"]) for session in sessions)
+        window_end = max(session_end({**session, "scheduled_at": to_naive_utc(session["scheduled_at"])}) for session in sessions)
+        return await self.load_calendars(
+            {session["teacher_id"] for session in sessions if session.get("teacher_id")},
+            {session["student_id"] for session in sessions if session.get("student_id")},
+            window_start,
+            window_end
+        )
+
+    async def load_calendars(
+        self,
+        teacher_ids: Iterable[str],
+        student_ids: Iterable[str],
+        window_start: datetime,
+        window_end: datetime
+    ) -> BookingIndex:
+        """Existing bookings of the given teachers and students between two times"""
+        index = BookingIndex()
+        window_start, window_end = to_naive_utc(window_start), to_naive_utc(window_end)
+        for role, calendar_ids in (("teacher", list(teacher_ids)), ("student", list(student_ids))):
+            if not calendar_ids:
+                continue
+            async for session in self.db.sessions.find(
+                self._range_query(role, {"$in": calendar_ids}, window_start, window_end),
+                {"id": 1, f"{role}_id": 1, "scheduled_at": 1, "duration_minutes": 1}
+            ):
+                index.add(f"{role}:{session[f'{role}_id']}", session["scheduled_at"], session_end(session), session["id"])
+        return index
+
+    def check_plan(self, sessions: List[Dict], bookings: BookingIndex) -> List[Tuple[int, Dict]]:
+        """(position, conflict) for planned sessions that overlap a booking or an earlier planned session.
+
+        Accepted sessions are added to `bookings`, so a planner can keep
+        probing candidate slots against the same index.
+        """
+        conflicts = []
+        for position, session in enumerate(sessions):
+            conflict = self.try_book(session, bookings)
+            if conflict:
+                conflicts.append((position, conflict))
+        return conflicts
+
+    def try_book(self, session: Dict, bookings: BookingIndex) -> Optional[Dict]:
+        """Add a planned session to `bookings` unless it overlaps; returns the conflict otherwise"""
+        start = to_naive_utc(session["scheduled_at"])
+        end = start + timedelta(minutes=session.get("duration_minutes") or 60)
+        calendars = _calendars(session)
+        for role, calendar_id in calendars:
+            interval = bookings.find(f"{role}:{calendar_id}", start, end)
+            if interval:
+                return _conflict(role, *interval)
+        for role, calendar_id in calendars:
+            bookings.add(f"{role}:{calendar_id}", start, end, session["id"])
+        return None
+
+    @asynccontextmanager
+    async def locked(self, sessions: Iterable[Dict]):
+        """Hold the calendar locks of every teacher and student in `sessions`"""
+        # A fixed acquisition order keeps two bulk bookings from deadlocking
+        lock_ids = sorted({f"{role}:{calendar_id}" for session in sessions for role, calendar_id in _calendars(session)})
+        token = str(uuid.uuid4())
+        acquired = []
+        try:
+            if len(lock_ids) > 1:
+                # Uncontended bulk bookings take every lock in one write
+                acquired = await self._acquire_all(lock_ids, token)
+            for lock_id in lock_ids:
+                if lock_id not in acquired:
+                    await self._acquire(lock_id, token)
+                    acquired.append(lock_id)
+            yield
+        finally:
+            if acquired:
+                await self.db.calendar_locks.delete_many({"_id": {"$in": acquired}, "token": token})
+
+    async def _acquire_all(self, lock_ids: List[str], token: str) -> List[str]:
+        lock = {"token": token, "expires_at": datetime.utcnow() + timedelta(seconds=self.lock_ttl_seconds)}
+        try:
+            await self.db.calendar_locks.insert_many([{"_id": lock_id, **lock} for lock_id in lock_ids], ordered=False)
+            return list(lock_ids)
+        except BulkWriteError:
+            # Some calendar is busy: give back what we got and queue up in order instead
+            await self.db.calendar_locks.delete_many({"_id": {"$in": lock_ids}, "token": token})
+            return []
+
+    async def _acquire(self, lock_id: str, token: str):
+        deadline = asyncio.get_running_loop().time() + self.lock_wait_seconds
+        while True:
+            now = datetime.utcnow()
+            lock = {"token": token, "expires_at": now + timedelta(seconds=self.lock_ttl_seconds)}
+            try:
+                await self.db.calendar_locks.insert_one({"_id": lock_id, **lock})
+                return
+            except DuplicateKeyError:
+                # Take over a lock whose holder died before releasing it
+                taken = await self.db.calendar_locks.find_one_and_update(
+                    {"_id": lock_id, "expires_at": {"$lt": now}},
+                    {"$set": lock}
+                )
+                if taken:
+                    return
+            if asyncio.get_running_loop().time() >= deadline:
+                raise CalendarBusyError(f"Calendar {lock_id} is being updated, please retry")
+            await asyncio.sleep(0.05)
+
+    async def insert_session(self, session: Dict):
+        """Insert a session unless it overlaps a booking of its teacher or student"""
+        check_duration(session)
+        async with self.locked([session]):
+            conflicts = await self.find_conflicts(
+                session.get("teacher_id"),
+                session.get("student_id"),
+                session["scheduled_at"],
+                session.get("duration_minutes") or 60
+            )
+            if conflicts:
+                raise SessionConflictError(conflicts)
+            await self.db.sessions.insert_one(session)
+        if self.calendar_feeds:
+            await self.calendar_feeds.touch_sessions([session])
+
+    async def insert_sessions(self, sessions: List[Dict], skip_conflicts: bool = False) -> List[Tuple[Dict, Dict]]:
+        """Insert a bulk plan in one write if none of its sessions overlap.
+
+        With `skip_conflicts` the overlapping sessions are left out instead and
+        returned as (session, conflict) pairs.
+        """
+        if not sessions:
+            return []
+        for session in sessions:
+            check_duration(session)
+        async with self.locked(sessions):
+            bookings = await self.load_bookings(sessions)
+            conflicts = self.check_plan(sessions, bookings)
+            if conflicts and not skip_conflicts:
+                raise SessionConflictError([conflict for _, conflict in conflicts])
+            skipped = {position for position, _ in conflicts}
+            accepted = [session for position, session in enumerate(sessions) if position not in skipped]
+            if accepted:
+                await self.db.sessions.insert_many(accepted, ordered=False)
+                if self.calendar_feeds:
+                    await self.calendar_feeds.touch_sessions(accepted)
+            return [(sessions[position], conflict) for position, conflict in conflicts]
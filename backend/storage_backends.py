@@ -0,0 +1,331 @@
+# Pluggable File Storage Backends for Driving School Platform
+import os
+import hmac
+import time
+import asyncio
+import hashlib
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import quote, urlencode
+import aiofiles.os
+from upload_staging import StagedUpload
+from external_integrations import CloudinaryClient
+
+logger = logging.getLogger(__name__)
+
+PRESIGN_EXPIRES_SECONDS = int(os.environ.get('STORAGE_PRESIGN_EXPIRES_SECONDS', '900'))
+
+class StorageBackend(ABC):
+    """Where uploaded files live.
+
+    `put` stores a staged upload server-side. `presign_upload` and
+    `download_url` let clients move bytes directly to and from the storage
+    service, so large files never pass through the API workers.
+    """
+
+    name: str = ""
+
+    @abstractmethod
+    async def put(self, staged: StagedUpload, key: str, resource_type: str = "auto") -> Dict:
+        """Store a staged file; returns key, url, size, format, width, height"""
+
+    @abstractmethod
+    async def stat(self, key: str) -> Optional[Dict]:
+        """Metadata (key, url, size, ...) of a stored object, None if missing"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> bool:
+        """Delete an object; deleting a missing object counts as success"""
+
+    @abstractmethod
+    async def presign_upload(self, key: str, content_type: str, max_bytes: int, expires_in: int = PRESIGN_EXPIRES_SECONDS) -> Dict:
+        """Instructions for a direct upload: method, url, form fields and headers"""
+
+    @abstractmethod
+    async def download_url(self, key: str, expires_in: int = PRESIGN_EXPIRES_SECONDS) -> str:
+        """URL the client can fetch the object from"""
+
+def _file_format(key: str) -> str:
+    name = key.rsplit('/', 1)[-1]
+    return name.split('.')[-1] if '.' in name else 'unknown'
+
+class LocalStorageBackend(StorageBackend):
+    """Files on local disk, served by the API's static mount.
+
+    Direct uploads are PUT to an API route that verifies an HMAC-signed URL and
+    streams the request body to disk.
+    """
+
+    name = "local"
+
+    def __init__(self, root: Path, url_prefix: str, upload_route: str = "/api/storage/local"):
+        self.root = Path(root)
+        self.url_prefix = url_prefix.rstrip('/')
+        self.upload_route = upload_route.rstrip('/')
+        self.signing_key = os.environ.get('SECRET_KEY', 'your-secret-key-here').encode()
+
+    def path_for(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root.resolve()):
+            raise ValueError("Invalid storage key")
+        return path
+
+    def public_url(self, key: str) -> str:
+        return f"{self.url_prefix}/{quote(key)}"
+
+    def _signature(self, key: str, expires: int, max_bytes: int) -> str:
+        message = f"{key}\n{expires}\n{max_bytes}".encode()
+        return hmac.new(self.signing_key, message, hashlib.sha256).hexdigest()
+
+    def verify_upload_signature(self, key: str, expires: int, max_bytes: int, signature: str) -> bool:
+        if expires < time.time():
+            return False
+        return hmac.compare_digest(self._signature(key, expires, max_bytes), signature)
+
+    async def put(self, staged: StagedUpload, key: str, resource_type: str = "auto") -> Dict:
+        await staged.move_to(self.path_for(key))
+        return {
+            "key": key,
+            "url": self.public_url(key),
+            "size": staged.size,
+            "format": _file_format(key),
+            "width": None,
+            "height": None
+        }
+
+    async def stat(self, key: str) -> Optional[Dict]:
+        try:
+            result = await aiofiles.os.stat(self.path_for(key))
+        except FileNotFoundError:
+            return None
+        return {"key": key, "url": self.public_url(key), "size": result.st_size, "format": _file_format(key)}
+
+    async def delete(self, key: str) -> bool:
+        try:
+            await aiofiles.os.remove(self.path_for(key))
+        except FileNotFoundError:
+            pass
+        return True
+
+    async def presign_upload(self, key: str, content_type: str, max_bytes: int, expires_in: int = PRESIGN_EXPIRES_SECONDS) -> Dict:
+        expires = int(time.time()) + expires_in
+        query = urlencode({
+            "expires": expires,
+            "max_bytes": max_bytes,
+            "signature": self._signature(key, expires, max_bytes)
+        })
+        return {
+            "method": "PUT",
+            "url": f"{self.upload_route}/{quote(key)}?{query}",
+            "fields": {},
+            "headers": {"Content-Type": content_type}
+        }
+
+    async def download_url(self, key: str, expires_in: int = PRESIGN_EXPIRES_SECONDS) -> str:
+        return self.public_url(key)
+
+class S3StorageBackend(StorageBackend):
+    """S3-compatible object storage (AWS S3, MinIO) through boto3.
+
+    boto3 is blocking, so every call runs in a worker thread. Server-side puts
+    use boto3's managed transfer, which switches to multipart uploads above
+    S3_MULTIPART_THRESHOLD_MB.
+    """
+
+    name = "s3"
+
+    def __init__(self):
+        self.bucket = os.environ.get('S3_BUCKET', 'driving-school-uploads')
+        self.endpoint_url = os.environ.get('S3_ENDPOINT_URL')  # e.g. http://localhost:9000 for MinIO
+        self.region = os.environ.get('S3_REGION', 'us-east-1')
+        self.public_base_url = os.environ.get('S3_PUBLIC_BASE_URL')
+        self.download_route = os.environ.get('S3_DOWNLOAD_ROUTE', '/api/storage/files')
+        self.multipart_threshold = int(os.environ.get('S3_MULTIPART_THRESHOLD_MB', '8')) * 1024 * 1024
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+            from botocore.config import Config
+
+            self._client = boto3.client(
+                "s3",
+                endpoint_url=self.endpoint_url,
+                region_name=self.region,
+                aws_access_key_id=os.environ.get('S3_ACCESS_KEY_ID'),
+                aws_secret_access_key=os.environ.get('S3_SECRET_ACCESS_KEY'),
+                config=Config(
+                    signature_version="s3v4",
+                    # MinIO and most self-hosted stores need path-style addressing
+                    s3={"addressing_style": "path" if self.endpoint_url else "auto"},
+                    max_pool_connections=int(os.environ.get('S3_MAX_CONNECTIONS', '20'))
+                )
+            )
+        return self._client
+
+    def public_url(self, key: str) -> str:
+        if self.public_base_url:
+            return f"{self.public_base_url.rstrip('/')}/{quote(key)}"
+        # Private bucket: the API redirects to a short-lived presigned URL
+        return f"{self.download_route}/{quote(key)}"
+
+    async def put(self, staged: StagedUpload, key: str, resource_type: str = "auto") -> Dict:
+        from boto3.s3.transfer import TransferConfig
+
+        transfer_config = TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_threshold
+        )
+        await asyncio.to_thread(
+            self.client.upload_file,
+            str(staged.path),
+            self.bucket,
+            key,
+            ExtraArgs={"ContentType": staged.content_type or "application/octet-stream"},
+            Config=transfer_config
+        )
+        return {
+            "key": key,
+            "url": self.public_url(key),
+            "size": staged.size,
+            "format": _file_format(key),
+            "width": None,
+            "height": None
+        }
+
+    async def stat(self, key: str) -> Optional[Dict]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return {
+            "key": key,
+            "url": self.public_url(key),
+            "size": head["ContentLength"],
+            "format": _file_format(key),
+            "content_type": head.get("ContentType")
+        }
+
+    async def delete(self, key: str) -> bool:
+        await asyncio.to_thread(self.client.delete_object, Bucket=self.bucket, Key=key)
+        return True
+
+    async def presign_upload(self, key: str, content_type: str, max_bytes: int, expires_in: int = PRESIGN_EXPIRES_SECONDS) -> Dict:
+        # A presigned POST lets S3 itself enforce the size limit and content type
+        post = await asyncio.to_thread(
+            self.client.generate_presigned_post,
+            Bucket=self.bucket,
+            Key=key,
+            Fields={"Content-Type": content_type},
+            Conditions=[
+                ["content-length-range", 1, max_bytes],
+                {"Content-Type": content_type}
+            ],
+            ExpiresIn=expires_in
+        )
+        return {"method": "POST", "url": post["url"], "fields": post["fields"], "headers": {}}
+
+    async def download_url(self, key: str, expires_in: int = PRESIGN_EXPIRES_SECONDS) -> str:
+        if self.public_base_url:
+            return self.public_url(key)
+        return await asyncio.to_thread(
+            self.client.generate_presigned_url,
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": key},
+            ExpiresIn=expires_in
+        )
+
+class CloudinaryStorageBackend(StorageBackend):
+    """Cloudinary media storage; keys are Cloudinary public ids"""
+
+    name = "cloudinary"
+
+    def __init__(self, cloudinary_client: CloudinaryClient):
+        self.cloudinary = cloudinary_client
+
+    @staticmethod
+    def _public_id(key: str) -> tuple:
+        folder, _, name = key.rpartition('/')
+        return folder, name.rsplit('.', 1)[0] if '.' in name else name
+
+    @staticmethod
+    def _result(upload_result: Dict) -> Dict:
+        return {
+            "key": upload_result["public_id"],
+            "url": upload_result["secure_url"],
+            "size": upload_result.get("bytes", 0),
+            "format": upload_result.get("format", ""),
+            "width": upload_result.get("width"),
+            "height": upload_result.get("height"),
+            "resource_type": upload_result.get("resource_type")
+        }
+
+    async def put(self, staged: StagedUpload, key: str, resource_type: str = "auto") -> Dict:
+        folder, public_id = self._public_id(key)
+        with open(staged.path, "rb") as handle:
+            upload_result = await self.cloudinary.upload(
+                handle,
+                staged.filename,
+                folder=folder,
+                public_id=public_id,
+                resource_type=resource_type
+            )
+        return self._result(upload_result)
+
+    async def stat(self, key: str) -> Optional[Dict]:
+        folder, public_id = self._public_id(key)
+        full_id = f"{folder}/{public_id}".strip('/')
+        for resource_type in ("image", "raw", "video"):
+            resource = await self.cloudinary.resource(full_id, resource_type)
+            if resource:
+                return self._result(resource)
+        return None
+
+    async def delete(self, key: str) -> bool:
+        folder, public_id = self._public_id(key)
+        full_id = f"{folder}/{public_id}".strip('/')
+        results = [await self.cloudinary.destroy(full_id, resource_type) for resource_type in ("image", "raw")]
+        return any(results)
+
+    async def presign_upload(self, key: str, content_type: str, max_bytes: int, expires_in: int = PRESIGN_EXPIRES_SECONDS) -> Dict:
+        # Cloudinary signatures cannot cap the size; completion checks it instead
+        folder, public_id = self._public_id(key)
+        return {
+            "method": "POST",
+            "url": self.cloudinary.upload_url("auto"),
+            "fields": self.cloudinary.signed_upload_params(folder, public_id),
+            "headers": {}
+        }
+
+    async def download_url(self, key: str, expires_in: int = PRESIGN_EXPIRES_SECONDS) -> str:
+        stored = await self.stat(key)
+        if not stored:
+            raise FileNotFoundError(key)
+        return stored["url"]
+
+def create_storage_backend(
+    name: Optional[str],
+    local_backend: LocalStorageBackend,
+    cloudinary_client: CloudinaryClient
+) -> StorageBackend:
+    """Backend selected by STORAGE_BACKEND (local, s3 or cloudinary).
+
+    Without an explicit choice Cloudinary is used when configured, local disk otherwise.
+    """
+    if not name:
+        name = "cloudinary" if cloudinary_client.configured else "local"
+    name = name.lower()
+    if name == "local":
+        return local_backend
+    if name in ("s3", "minio"):
+        return S3StorageBackend()
+    if name == "cloudinary":
+        return CloudinaryStorageBackend(cloudinary_client)
+    raise ValueError(f"Unknown storage backend: {name}")
@@ -0,0 +1,140 @@
+# Teacher Availability Engine for Driving School Platform
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from session_scheduling import FREED_SESSION_STATUSES, MAX_SESSION_MINUTES, to_naive_utc
+
+logger = logging.getLogger(__name__)
+
+SLOT_MINUTES = 15
+SLOTS_PER_DAY = 24 * 60 // SLOT_MINUTES
+
+# (weekday, start, end) with Monday = 0; Sunday to Thursday, 08:00-17:00
+DEFAULT_WORKING_HOURS = [(weekday, time(8, 0), time(17, 0)) for weekday in (6, 0, 1, 2, 3)]
+
+def parse_working_hours(windows: Optional[List[Dict]]) -> Optional[List[Tuple[int, time, time]]]:
+    """Stored {weekday, start_time, end_time} windows as (weekday, start, end) tuples"""
+    if windows is None:
+        return None
+    return [
+        (window["weekday"], time.fromisoformat(window["start_time"]), time.fromisoformat(window["end_time"]))
+        for window in windows
+    ]
+
+def _minutes(value: time) -> int:
+    return value.hour * 60 + value.minute
+
+def week_template(windows: List[Tuple[int, time, time]]) -> np.ndarray:
+    """(7, SLOTS_PER_DAY) bitset of working slots, one row per weekday"""
+    template = np.zeros((7, SLOTS_PER_DAY), dtype=bool)
+    for weekday, start, end in windows:
+        # Only whole slots inside the window count; an end of 00:00 means midnight
+        start_slot = -(-_minutes(start) // SLOT_MINUTES)
+        end_slot = _minutes(end) // SLOT_MINUTES if end != time(0, 0) else SLOTS_PER_DAY
+        template[weekday, start_slot:end_slot] = True
+    return template
+
+class TeacherAvailabilityService:
+    """Free time of teachers as 15-minute bitsets.
+
+    Each teacher's stored weekly working-hour template (`teachers.working_hours`)
+    is expanded over the requested days into one boolean row per teacher;
+    all their sessions in the range are subtracted at once with a
+    difference array, and free runs are read off with a vectorized diff.
+    """
+
+    def __init__(self, db_client):
+        self.db = db_client.driving_school_platform
+        self.max_days = 62
+        self.max_teachers = 200
+
+    async def set_working_hours(self, teacher_id: str, windows: List[Dict]):
+        await self.db.teachers.update_one(
+            {"id": teacher_id},
+            {"$set": {"working_hours": windows, "working_hours_updated_at": datetime.utcnow()}}
+        )
+
+    async def working_hours(self, teacher_ids: List[str], default=DEFAULT_WORKING_HOURS) -> Dict[str, List[Tuple[int, time, time]]]:
+        """Stored templates of the given teachers, `default` for those without one"""
+        stored = {
+            teacher["id"]: parse_working_hours(teacher.get("working_hours"))
+            async for teacher in self.db.teachers.find({"id": {"$in": teacher_ids}}, {"id": 1, "working_hours": 1})
+        }
+        return {teacher_id: stored.get(teacher_id) or default for teacher_id in teacher_ids}
+
+    async def busy_intervals(self, teacher_ids: List[str], range_start: datetime, range_end: datetime) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(teacher index, first slot, end slot) of every session in the range, as slot offsets from range_start"""
+        row_of = {teacher_id: row for row, teacher_id in enumerate(teacher_ids)}
+        rows, starts, ends = [], [], []
+        async for session in self.db.sessions.find(
+            {
+                "teacher_id": {"$in": teacher_ids},
+                "scheduled_at": {"$gt": range_start - timedelta(minutes=MAX_SESSION_MINUTES), "$lt": range_end},
+                "status": {"$nin": FREED_SESSION_STATUSES}
+            },
+            {"teacher_id": 1, "scheduled_at": 1, "duration_minutes": 1}
+        ):
+            offset = (session["scheduled_at"] - range_start).total_seconds() / 60
+            rows.append(row_of[session["teacher_id"]])
+            starts.append(offset)
+            ends.append(offset + (session.get("duration_minutes") or 60))
+        total_slots = int((range_end - range_start).total_seconds() // 60) // SLOT_MINUTES
+        # A session blocks every slot it touches
+        first = np.clip(np.floor(np.array(starts, dtype=float) / SLOT_MINUTES), 0, total_slots).astype(np.int64)
+        last = np.clip(np.ceil(np.array(ends, dtype=float) / SLOT_MINUTES), 0, total_slots).astype(np.int64)
+        return np.array(rows, dtype=np.int64), first, last
+
+    async def free_slots(
+        self,
+        teacher_ids: List[str],
+        start_date: date,
+        end_date: date,
+        min_minutes: int = SLOT_MINUTES,
+        now: Optional[datetime] = None
+    ) -> Dict[str, List[Dict]]:
+        """Free periods of each teacher between two dates (inclusive), at least `min_minutes` long"""
+        teacher_ids = list(dict.fromkeys(teacher_ids))
+        days = (end_date - start_date).days + 1
+        if not teacher_ids or days <= 0:
+            return {teacher_id: [] for teacher_id in teacher_ids}
+        range_start = datetime.combine(start_date, time(0, 0))
+        range_end = range_start + timedelta(days=days)
+
+        templates = await self.working_hours(teacher_ids)
+        weekdays = np.array([(start_date + timedelta(days=offset)).weekday() for offset in range(days)])
+        # (teachers, days, slots): each teacher's weekly template laid over the calendar
+        free = np.stack([week_template(templates[teacher_id])[weekdays] for teacher_id in teacher_ids])
+        free = free.reshape(len(teacher_ids), days * SLOTS_PER_DAY)
+
+        rows, first, last = await self.busy_intervals(teacher_ids, range_start, range_end)
+        if rows.size:
+            # Difference array: +1 where a session starts, -1 where it ends, cumulative sum > 0 is busy
+            delta = np.zeros((len(teacher_ids), days * SLOTS_PER_DAY + 1), dtype=np.int32)
+            np.add.at(delta, (rows, first), 1)
+            np.add.at(delta, (rows, last), -1)
+            free &= ~(np.cumsum(delta[:, :-1], axis=1) > 0)
+
+        now = to_naive_utc(now or datetime.utcnow())
+        if now > range_start:
+            elapsed = int(np.ceil((now - range_start).total_seconds() / 60 / SLOT_MINUTES))
+            free[:, :min(elapsed, days * SLOTS_PER_DAY)] = False
+
+        # Runs of free slots, cut at midnight
+        free = free.reshape(len(teacher_ids), days, SLOTS_PER_DAY)
+        edges = np.diff(np.pad(free.astype(np.int8), ((0, 0), (0, 0), (1, 1))), axis=2)
+        run_starts = np.argwhere(edges == 1)
+        run_ends = np.argwhere(edges == -1)[:, 2]
+        min_slots = max(1, -(-min_minutes // SLOT_MINUTES))
+
+        result: Dict[str, List[Dict]] = {teacher_id: [] for teacher_id in teacher_ids}
+        for (row, day, start_slot), end_slot in zip(run_starts.tolist(), run_ends.tolist()):
+            if end_slot - start_slot < min_slots:
+                continue
+            day_start = range_start + timedelta(days=day)
+            result[teacher_ids[row]].append({
+                "start": day_start + timedelta(minutes=start_slot * SLOT_MINUTES),
+                "end": day_start + timedelta(minutes=end_slot * SLOT_MINUTES),
+                "minutes": (end_slot - start_slot) * SLOT_MINUTES
+            })
+        return result
@@ -0,0 +1,173 @@
+# Weekly Timetable Generation for Driving School Platform
+import heapq
+import uuid
+import logging
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Optional, Tuple
+from session_scheduling import BookingIndex, SessionScheduler
+from teacher_availability import DEFAULT_WORKING_HOURS
+
+logger = logging.getLogger(__name__)
+
+# Students take their courses strictly in this order
+COURSE_ORDER = ["theory", "park", "road"]
+
+@dataclass
+class PlannedCourse:
+    course_id: str
+    course_type: str
+    teacher_id: str
+    remaining: int
+
+@dataclass
+class StudentPlan:
+    student_id: str
+    courses: List[PlannedCourse]
+    # Sessions of the next course may only start after this time
+    not_before: datetime = datetime.min
+    placed: int = 0
+    per_day: Dict[date, int] = field(default_factory=dict)
+
+def plannable_courses(courses: List[Dict], pending_counts: Dict[str, int]) -> List[PlannedCourse]:
+    """A student's courses in THEORY -> PARK -> ROAD order, up to the first one that is still locked"""
+    planned = []
+    for course in sorted(courses, key=lambda course: COURSE_ORDER.index(course["course_type"])):
+        if course["status"] == "completed":
+            continue
+        if course["status"] in ("locked", "failed") or not course.get("teacher_id"):
+            break
+        remaining = course["total_sessions"] - course["completed_sessions"] - pending_counts.get(course["id"], 0)
+        planned.append(PlannedCourse(course["id"], course["course_type"], course["teacher_id"], max(remaining, 0)))
+    return planned
+
+def teacher_slots(
+    windows: List[Tuple[int, time, time]],
+    week_start: date,
+    duration_minutes: int,
+    not_before: datetime
+) -> List[datetime]:
+    """Candidate session starts inside a teacher's availability windows for one week"""
+    slots = set()
+    step = timedelta(minutes=duration_minutes)
+    for offset in range(7):
+        day = week_start + timedelta(days=offset)
+        for weekday, start, end in windows:
+            if weekday != day.weekday():
+                continue
+            slot = datetime.combine(day, start)
+            window_end = datetime.combine(day, end)
+            while slot + step <= window_end:
+                if slot >= not_before:
+                    slots.add(slot)
+                slot += step
+    return sorted(slots)
+
+class WeeklyTimetableSolver:
+    """Greedy weekly planner for teacher-student pairs.
+
+    Students are served round-robin (fewest sessions placed first), and each
+    gets the earliest free slot of the teacher of its current course that is
+    also free for the student, under per-day and per-week caps. A course's
+    sessions are all placed before the next course in COURSE_ORDER starts;
+    a course that cannot be finished this week holds back the later ones.
+    Conflicts are checked against a `BookingIndex` preloaded with existing
+    sessions, which also absorbs every placed session.
+    """
+
+    def __init__(
+        self,
+        scheduler: SessionScheduler,
+        bookings: BookingIndex,
+        week_start: date,
+        duration_minutes: int = 60,
+        max_per_day: int = 2,
+        max_per_week: int = 5,
+        not_before: Optional[datetime] = None
+    ):
+        self.scheduler = scheduler
+        self.bookings = bookings
+        self.week_start = week_start
+        self.duration_minutes = duration_minutes
+        self.max_per_day = max_per_day
+        self.max_per_week = max_per_week
+        self.not_before = not_before or datetime.utcnow()
+
+    def solve(
+        self,
+        students: List[StudentPlan],
+        availability: Dict[str, List[Tuple[int, time, time]]],
+        session_fields: Optional[Dict] = None
+    ) -> Tuple[List[Dict], Dict[str, int]]:
+        """Planned session documents, and the sessions per course that did not fit"""
+        slots: Dict[str, List[datetime]] = {}
+        sessions = []
+        queue = [(0, order) for order in range(len(students))]
+        heapq.heapify(queue)
+
+        while queue:
+            _, order = heapq.heappop(queue)
+            student = students[order]
+            course = self._current_course(student)
+            if course is None or student.placed >= self.max_per_week:
+                continue
+            if course.teacher_id not in slots:
+                slots[course.teacher_id] = teacher_slots(
+                    availability.get(course.teacher_id, DEFAULT_WORKING_HOURS),
+                    self.week_start,
+                    self.duration_minutes,
+                    self.not_before
+                )
+            session = self._place(student, course, slots[course.teacher_id], session_fields or {})
+            if session is None:
+                # The current course is stuck this week, and later courses must wait for it
+                continue
+            sessions.append(session)
+            heapq.heappush(queue, (student.placed, order))
+
+        unplaced = {
+            course.course_id: course.remaining
+            for student in students for course in student.courses if course.remaining
+        }
+        return sessions, unplaced
+
+    def _current_course(self, student: StudentPlan) -> Optional[PlannedCourse]:
+        for course in student.courses:
+            if course.remaining:
+                return course
+        return None
+
+    def _place(self, student: StudentPlan, course: PlannedCourse, free_slots: List[datetime], session_fields: Dict) -> Optional[Dict]:
+        position = bisect_left(free_slots, student.not_before)
+        while position < len(free_slots):
+            slot = free_slots[position]
+            if student.per_day.get(slot.date(), 0) >= self.max_per_day:
+                position += 1
+                continue
+            session = {
+                "id": str(uuid.uuid4()),
+                "course_id": course.course_id,
+                "teacher_id": course.teacher_id,
+                "student_id": student.student_id,
+                "session_type": course.course_type,
+                "scheduled_at": slot,
+                "duration_minutes": self.duration_minutes,
+                **session_fields
+            }
+            conflict = self.scheduler.try_book(session, self.bookings)
+            if conflict is None:
+                free_slots.pop(position)
+                course.remaining -= 1
+                student.placed += 1
+                student.per_day[slot.date()] = student.per_day.get(slot.date(), 0) + 1
+                if course.remaining == 0:
+                    # The next course starts after the last session of this one
+                    student.not_before = slot + timedelta(minutes=self.duration_minutes)
+                return session
+            if conflict["conflict_with"] == "teacher":
+                # Booked elsewhere: no student can have this slot
+                free_slots.pop(position)
+            else:
+                position += 1
+        return None
@@ -0,0 +1,118 @@
+# Streaming Upload Staging for Driving School Platform
+import os
+import hashlib
+import tempfile
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Optional
+import aiofiles
+import aiofiles.os
+from fastapi import UploadFile
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+MAX_UPLOAD_SIZE_MB = int(os.environ.get('MAX_UPLOAD_SIZE_MB', '15'))
+
+class UploadTooLargeError(Exception):
+    def __init__(self, max_bytes: int):
+        super().__init__(f"File exceeds the maximum upload size of {max_bytes // (1024 * 1024)} MB")
+        self.max_bytes = max_bytes
+
+@dataclass
+class StagedUpload:
+    """An upload written to a temp file, with size and digest computed while streaming"""
+    path: Path
+    filename: str
+    content_type: Optional[str]
+    size: int
+    sha256: str
+
+    @property
+    def extension(self) -> str:
+        return self.filename.split('.')[-1] if '.' in self.filename else 'unknown'
+
+    async def move_to(self, destination: Path):
+        """Atomically rename the staged file into place (same filesystem)"""
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        await aiofiles.os.replace(self.path, destination)
+        self.path = destination
+
+async def _iter_upload_file(file: UploadFile, chunk_size: int) -> AsyncIterator[bytes]:
+    await file.seek(0)
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+@asynccontextmanager
+async def stage_stream(
+    chunks: AsyncIterator[bytes],
+    staging_dir: Path,
+    filename: str,
+    content_type: Optional[str] = None,
+    max_bytes: Optional[int] = None
+) -> AsyncIterator[StagedUpload]:
+    """Write an async byte stream to a temp file in `staging_dir`.
+
+    Raises UploadTooLargeError as soon as the limit is crossed. The temp file is
+    removed on exit unless it was moved with `StagedUpload.move_to`.
+    """
+    if max_bytes is None:
+        max_bytes = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    fd, temp_name = tempfile.mkstemp(dir=staging_dir, suffix=".part")
+    os.close(fd)
+    temp_path = Path(temp_name)
+
+    try:
+        digest = hashlib.sha256()
+        size = 0
+        async with aiofiles.open(temp_path, 'wb') as out:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                await out.write(chunk)
+
+        yield StagedUpload(
+            path=temp_path,
+            filename=filename,
+            content_type=content_type,
+            size=size,
+            sha256=digest.hexdigest()
+        )
+    finally:
+        if temp_path.exists():
+            try:
+                await aiofiles.os.remove(temp_path)
+            except OSError as e:
+                logger.warning(f"Failed to remove staged upload {temp_path}: {str(e)}")
+
+@asynccontextmanager
+async def stage_upload(
+    file: UploadFile,
+    staging_dir: Path,
+    max_bytes: Optional[int] = None,
+    chunk_size: int = UPLOAD_CHUNK_SIZE
+) -> AsyncIterator[StagedUpload]:
+    """Stream `file` to a staging temp file in fixed-size chunks (see `stage_stream`)"""
+    if max_bytes is None:
+        max_bytes = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+    declared_size = getattr(file, "size", None)
+    if declared_size is not None and declared_size > max_bytes:
+        raise UploadTooLargeError(max_bytes)
+
+    async with stage_stream(
+        _iter_upload_file(file, chunk_size),
+        staging_dir,
+        file.filename or "upload",
+        file.content_type,
+        max_bytes
+    ) as staged:
+        yield staged
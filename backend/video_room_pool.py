@@ -0,0 +1,165 @@
+# Pre-provisioned Daily.co Room Pool for Driving School Platform
+import os
+import uuid
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo import ASCENDING, UpdateOne
+from external_integrations import DailyClient
+from background_jobs import JobLease
+
+logger = logging.getLogger(__name__)
+
+# Pooled rooms this close to their Daily expiry are reclaimed instead of leased
+RECLAIM_MARGIN = timedelta(hours=1)
+
+class VideoRoomPool:
+    """Keeps a stock of ready Daily rooms in `daily_room_pool`.
+
+    Leasing is a single find_one_and_delete, so `create_video_room` never waits
+    on Daily. The pool is topped up in the background, one refill at a time
+    across all workers, and rooms whose session has ended (or pooled rooms about
+    to expire) are deleted from Daily in batches.
+    """
+
+    def __init__(self, db_client, daily_client: DailyClient):
+        self.db = db_client.driving_school_platform
+        self.daily = daily_client
+        self.target_size = int(os.environ.get('ROOM_POOL_SIZE', '10'))
+        self.room_ttl_hours = int(os.environ.get('ROOM_POOL_ROOM_TTL_HOURS', '72'))
+        self.refill_concurrency = int(os.environ.get('ROOM_POOL_REFILL_CONCURRENCY', '5'))
+        self.reclaim_batch_size = int(os.environ.get('ROOM_RECLAIM_BATCH_SIZE', '50'))
+        # Refills triggered by leases and the periodic job share one lease, so two workers
+        # never count the same shortfall and both create rooms for it
+        self.refill_lease = JobLease(self.db, "daily_room_pool_refill", ttl_seconds=int(os.environ.get('ROOM_POOL_REFILL_LEASE_SECONDS', '60')))
+        self._refill_lock = asyncio.Lock()
+        self._refill_task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.daily.configured and self.target_size > 0
+
+    async def ensure_indexes(self):
+        await self.db.daily_room_pool.create_index([("expires_at", ASCENDING)])
+        await self.db.video_rooms.create_index([("is_active", ASCENDING), ("ends_at", ASCENDING)])
+
+    async def lease(self, ends_at: datetime) -> Optional[dict]:
+        """Take a pooled room valid until at least `ends_at`, or None if the pool is dry"""
+        if not self.enabled:
+            return None
+
+        # Soonest-expiring room that still covers the session, keeping long-lived rooms
+        # for later sessions. Rooms inside the reclaim margin are never leased.
+        valid_until = max(ends_at, datetime.utcnow() + RECLAIM_MARGIN)
+        room = await self.db.daily_room_pool.find_one_and_delete(
+            {"expires_at": {"$gte": valid_until}},
+            sort=[("expires_at", ASCENDING)]
+        )
+        self.request_refill()
+        if not room:
+            return None
+        return {"id": room["daily_room_id"], "name": room["name"], "url": room["url"]}
+
+    def request_refill(self):
+        """Start a background refill unless one is already running in this process"""
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.create_task(self.refill(), name="daily_room_pool_refill")
+
+    async def refill(self) -> int:
+        """Create rooms until the pool holds `target_size` rooms with useful lifetime left.
+
+        Skipped while another refill runs in this process or another worker holds the lease.
+        """
+        if not self.enabled or self._refill_lock.locked():
+            return 0
+        async with self._refill_lock:
+            if not await self.refill_lease.acquire():
+                return 0
+            return await self._refill()
+
+    async def _refill(self) -> int:
+        usable_after = datetime.utcnow() + RECLAIM_MARGIN
+        available = await self.db.daily_room_pool.count_documents({"expires_at": {"$gte": usable_after}})
+        missing = self.target_size - available
+        if missing <= 0:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.refill_concurrency)
+
+        async def create_one():
+            async with semaphore:
+                name = f"driving-school-pool-{uuid.uuid4().hex[:16]}"
+                try:
+                    room = await self.daily.create_room(name, duration_hours=self.room_ttl_hours)
+                except Exception as e:
+                    logger.warning(f"Room pool refill failed for {name}: {str(e)}")
+                    return None
+                now = datetime.utcnow()
+                return {
+                    "id": str(uuid.uuid4()),
+                    "name": room["name"],
+                    "url": room["url"],
+                    "daily_room_id": room.get("id", room["name"]),
+                    "expires_at": now + timedelta(hours=self.room_ttl_hours),
+                    "created_at": now
+                }
+
+        rooms = [room for room in await asyncio.gather(*(create_one() for _ in range(missing))) if room]
+        if rooms:
+            await self.db.daily_room_pool.insert_many(rooms)
+        return len(rooms)
+
+    async def _delete_rooms(self, names: list) -> set:
+        """Delete rooms from Daily concurrently; returns the names that are gone"""
+        semaphore = asyncio.Semaphore(self.refill_concurrency)
+
+        async def delete_one(name):
+            async with semaphore:
+                try:
+                    return name if await self.daily.delete_room(name) else None
+                except Exception as e:
+                    logger.warning(f"Failed to delete Daily room {name}: {str(e)}")
+                    return None
+
+        return {name for name in await asyncio.gather(*(delete_one(name) for name in names)) if name}
+
+    async def reclaim(self) -> dict:
+        """Delete rooms of ended sessions and pooled rooms too close to expiry, one batch each"""
+        now = datetime.utcnow()
+        reclaimed = {"video_rooms": 0, "pooled_rooms": 0}
+        if not self.daily.configured:
+            return reclaimed
+
+        ended = await self.db.video_rooms.find(
+            {"is_active": True, "ends_at": {"$lt": now}},
+            {"id": 1, "room_name": 1}
+        ).limit(self.reclaim_batch_size).to_list(length=self.reclaim_batch_size)
+        if ended:
+            deleted = await self._delete_rooms([room["room_name"] for room in ended])
+            operations = [
+                UpdateOne(
+                    {"id": room["id"], "is_active": True},
+                    {"$set": {"is_active": False, "reclaimed_at": now}}
+                )
+                for room in ended if room["room_name"] in deleted
+            ]
+            if operations:
+                result = await self.db.video_rooms.bulk_write(operations, ordered=False)
+                reclaimed["video_rooms"] = result.modified_count
+
+        stale = await self.db.daily_room_pool.find(
+            {"expires_at": {"$lt": now + RECLAIM_MARGIN}},
+            {"id": 1, "name": 1}
+        ).limit(self.reclaim_batch_size).to_list(length=self.reclaim_batch_size)
+        if stale:
+            deleted = await self._delete_rooms([room["name"] for room in stale])
+            if deleted:
+                result = await self.db.daily_room_pool.delete_many(
+                    {"id": {"$in": [room["id"] for room in stale if room["name"] in deleted]}}
+                )
+                reclaimed["pooled_rooms"] = result.deleted_count
+
+        if reclaimed["video_rooms"] or reclaimed["pooled_rooms"]:
+            logger.info(f"Reclaimed {reclaimed['video_rooms']} session rooms and {reclaimed['pooled_rooms']} pooled rooms")
+        return reclaimed
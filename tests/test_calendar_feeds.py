@@ -0,0 +1,55 @@
+from datetime import datetime
+
+from calendar_feeds import fold, hash_token, ics_datetime, ics_escape
+
+
+def unfold(text):
+    return text.replace("\r\n ", "")
+
+
+def test_ics_escape_special_characters():
+    assert ics_escape("Rue 1, Alger; bloc B\\C\nporte 2") == "Rue 1\\, Alger\\; bloc B\\\\C\\nporte 2"
+    assert ics_escape(None) == ""
+
+
+def test_ics_escape_enum_values():
+    class Kind:
+        value = "road"
+
+    assert ics_escape(Kind()) == "road"
+
+
+def test_ics_datetime_is_utc_basic_format():
+    assert ics_datetime(datetime(2030, 1, 6, 9, 5, 7, 123)) == "20300106T090507Z"
+
+
+def test_fold_keeps_short_lines():
+    assert fold("SUMMARY:Road session") == "SUMMARY:Road session\r\n"
+
+
+def test_fold_limits_lines_to_75_octets():
+    line = "DESCRIPTION:" + "x" * 200
+
+    folded = fold(line)
+
+    physical = folded[:-2].split("\r\n")
+    assert all(len(part.encode()) <= 75 for part in physical)
+    assert all(part.startswith(" ") for part in physical[1:])
+    assert unfold(folded) == line + "\r\n"
+
+
+def test_fold_never_splits_multibyte_characters():
+    for line in ("LOCATION:" + "é" * 80, "SUMMARY:" + "حصة قيادة " * 20, "X:" + "🚗" * 40):
+        folded = fold(line)
+
+        physical = folded[:-2].split("\r\n")
+        assert all(len(part.encode()) <= 75 for part in physical)
+        # Every physical line decodes on its own
+        assert all(part.encode().decode() == part for part in physical)
+        assert unfold(folded) == line + "\r\n"
+
+
+def test_hash_token_is_stable_and_hides_the_token():
+    assert hash_token("abc") == hash_token("abc")
+    assert hash_token("abc") != hash_token("abd")
+    assert "abc" not in hash_token("abc")
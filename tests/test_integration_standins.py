@@ -0,0 +1,193 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from pymongo.errors import DuplicateKeyError
+
+from external_integrations import CloudinaryClient, DailyClient, IntegrationError
+from external_integrations.standins import use_standins
+from storage_backends import CloudinaryStorageBackend
+from video_room_pool import VideoRoomPool
+
+
+class FakeRoomPool:
+    """In-memory `daily_room_pool` supporting the queries VideoRoomPool makes"""
+
+    def __init__(self):
+        self.docs = []
+
+    async def count_documents(self, query):
+        return sum(1 for doc in self.docs if doc["expires_at"] >= query["expires_at"]["$gte"])
+
+    async def insert_many(self, docs):
+        self.docs.extend(docs)
+
+    async def find_one_and_delete(self, query, sort=None):
+        matching = sorted(
+            (doc for doc in self.docs if doc["expires_at"] >= query["expires_at"]["$gte"]),
+            key=lambda doc: doc["expires_at"]
+        )
+        if not matching:
+            return None
+        self.docs.remove(matching[0])
+        return matching[0]
+
+
+class FakeLeases:
+    """`job_leases` where every lease is free"""
+
+    async def update_one(self, query, update, upsert=False):
+        return SimpleNamespace(modified_count=1)
+
+    async def delete_one(self, query):
+        return SimpleNamespace(deleted_count=1)
+
+
+def room_pool(target_size):
+    db = SimpleNamespace(daily_room_pool=FakeRoomPool(), job_leases=FakeLeases())
+    pool = VideoRoomPool(SimpleNamespace(driving_school_platform=db), DailyClient(api_key="test-key"))
+    pool.target_size = target_size
+    return pool, db
+
+
+@pytest.fixture
+def standins():
+    return use_standins()
+
+
+def test_daily_room_lifecycle(standins):
+    daily = DailyClient(api_key="test-key")
+
+    async def run():
+        room = await daily.create_room("lesson-1")
+        assert standins.state.rooms["lesson-1"]["url"] == room["url"]
+        assert await daily.delete_room("lesson-1")
+        # Already deleted counts as deleted
+        assert await daily.delete_room("lesson-1")
+
+    asyncio.run(run())
+    assert standins.state.rooms == {}
+
+
+def test_daily_duplicate_name_returns_the_existing_room(standins):
+    daily = DailyClient(api_key="test-key")
+
+    async def run():
+        first = await daily.create_room("lesson-2")
+        second = await daily.create_room("lesson-2")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert second["id"] == first["id"]
+    assert len(standins.state.rooms) == 1
+
+
+def test_daily_failure_raises_integration_error(standins):
+    standins.state.fail_with = 503
+    daily = DailyClient(api_key="test-key")
+
+    with pytest.raises(IntegrationError) as error:
+        asyncio.run(daily.create_room("lesson-3"))
+    assert error.value.status_code == 503
+
+
+def test_existing_clients_follow_re_registration():
+    daily = DailyClient(api_key="test-key")
+    app = use_standins()
+
+    asyncio.run(daily.create_room("lesson-4"))
+
+    assert "lesson-4" in app.state.rooms
+
+
+def test_room_pool_refills_after_lease(standins):
+    pool, db = room_pool(3)
+
+    async def run():
+        assert await pool.refill() == 3
+        assert await pool.refill() == 0
+        room = await pool.lease(datetime.utcnow() + timedelta(hours=2))
+        await pool._refill_task
+        return room
+
+    room = asyncio.run(run())
+    assert room["name"] in standins.state.rooms
+    assert room["name"] not in {doc["name"] for doc in db.daily_room_pool.docs}
+    assert len(db.daily_room_pool.docs) == 3
+    assert len(standins.state.rooms) == 4
+
+
+def test_room_pool_lease_skips_rooms_expiring_before_the_session(standins):
+    pool, db = room_pool(1)
+
+    async def run():
+        await pool.refill()
+        room = await pool.lease(datetime.utcnow() + timedelta(hours=pool.room_ttl_hours + 1))
+        await pool._refill_task
+        return room
+
+    assert asyncio.run(run()) is None
+    assert len(db.daily_room_pool.docs) == 1
+
+
+def test_room_pool_concurrent_refills_do_not_overfill(standins):
+    pool, db = room_pool(3)
+
+    async def run():
+        return await asyncio.gather(*(pool.refill() for _ in range(4)))
+
+    assert sorted(asyncio.run(run())) == [0, 0, 0, 3]
+    assert len(db.daily_room_pool.docs) == 3
+    assert len(standins.state.rooms) == 3
+
+
+def test_room_pool_refill_skipped_while_another_worker_holds_the_lease(standins):
+    pool, db = room_pool(3)
+
+    async def held(query, update, upsert=False):
+        raise DuplicateKeyError("lease held")
+
+    db.job_leases.update_one = held
+
+    assert asyncio.run(pool.refill()) == 0
+    assert standins.state.rooms == {}
+
+
+def cloudinary_backend():
+    return CloudinaryStorageBackend(CloudinaryClient(cloud_name="demo", api_key="key", api_secret="secret"))
+
+
+def test_presigned_upload_round_trip(standins):
+    backend = cloudinary_backend()
+    key = "documents/u1/licence.pdf"
+
+    async def run():
+        upload = await backend.presign_upload(key, "application/pdf", 1024)
+        # The browser posts the signed form straight to the storage provider
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=standins)) as browser:
+            response = await browser.post(upload["url"], data=upload["fields"], files={"file": ("licence.pdf", b"%PDF-1.4 test")})
+        assert response.status_code == 200
+
+        stored = await backend.stat(key)
+        assert await backend.delete(key)
+        return stored, await backend.stat(key)
+
+    stored, after_delete = asyncio.run(run())
+    assert stored["key"] == "documents/u1/licence"
+    assert stored["size"] == len(b"%PDF-1.4 test")
+    assert stored["resource_type"] == "raw"
+    assert after_delete is None
+
+
+def test_cloudinary_delete_of_missing_resource(standins):
+    assert asyncio.run(cloudinary_backend().delete("documents/u1/missing.png"))
+
+
+def test_cloudinary_resource_requires_credentials(standins):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=standins)) as anonymous:
+            return await anonymous.get("http://standins/cloudinary/v1_1/demo/resources/image/upload/x")
+
+    assert asyncio.run(run()).status_code == 401
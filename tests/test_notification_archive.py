@@ -0,0 +1,89 @@
+import asyncio
+import json
+import zlib
+from datetime import datetime
+from types import SimpleNamespace
+
+from bson import ObjectId
+
+from enhanced_notifications import (
+    EnhancedNotificationService,
+    decode_archive,
+    encode_archive,
+    render_notification,
+)
+
+SCHEDULED_AT = datetime(2030, 3, 14, 9, 30)
+
+
+def notification(user_id="u1"):
+    return {
+        "_id": ObjectId(),
+        "id": f"n-{user_id}",
+        "user_id": user_id,
+        "template_id": "session_scheduled_student",
+        "metadata": {"session_type": "road", "teacher_name": "Karim", "scheduled_at": SCHEDULED_AT},
+        "is_read": True,
+        "created_at": datetime(2030, 3, 1, 8, 0),
+    }
+
+
+class FakeArchive:
+    def __init__(self):
+        self.docs = []
+
+    async def insert_many(self, docs):
+        self.docs.extend(docs)
+
+    async def _iterate(self, query):
+        for doc in self.docs:
+            if doc["month"] == query["month"] and query["user_ids"] in doc["user_ids"]:
+                yield doc
+
+    def find(self, query):
+        return self._iterate(query)
+
+
+class FakeNotifications:
+    async def delete_many(self, query):
+        return SimpleNamespace(deleted_count=len(query["_id"]["$in"]))
+
+
+class FakeDatabase(SimpleNamespace):
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+def test_archive_round_trip_keeps_datetimes():
+    original = notification()
+
+    decoded = decode_archive(encode_archive([original]))
+
+    assert decoded[0]["metadata"]["scheduled_at"] == SCHEDULED_AT
+    assert decoded[0]["created_at"] == original["created_at"]
+    assert "_id" not in decoded[0]
+
+
+def test_legacy_archive_metadata_dates_are_revived():
+    legacy = [{"user_id": "u1", "metadata": {"scheduled_at": SCHEDULED_AT.isoformat(), "location": "Alger"}}]
+
+    decoded = decode_archive(zlib.compress(json.dumps(legacy).encode()))
+
+    assert decoded[0]["metadata"] == {"scheduled_at": SCHEDULED_AT, "location": "Alger"}
+
+
+def test_archived_notifications_render_dates():
+    db = FakeDatabase(notifications_archive=FakeArchive(), enhanced_notifications=FakeNotifications())
+    service = EnhancedNotificationService(SimpleNamespace(driving_school_platform=db))
+
+    async def run():
+        await service._archive_batch("enhanced_notifications", [notification("u1"), notification("u2")])
+        return await service.get_archived_notifications("u1", "2030-03", locale="fr")
+
+    archived = asyncio.run(run())
+
+    expected = render_notification(notification(), "fr")
+    assert [n["id"] for n in archived] == ["n-u1"]
+    assert archived[0]["message"] == expected["message"]
+    assert "14 mars 2030 à 09:30" in archived[0]["message"]
+    assert archived[0]["created_at"] == "2030-03-01T08:00:00"
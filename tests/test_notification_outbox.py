@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from enhanced_notifications import DeliveryFailedError, EnhancedNotificationService
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def to_list(self, length=None):
+        return self.docs
+
+
+class FakeCollection:
+    """Returns its documents for any query and records bulk writes"""
+
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+        self.writes = []
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(self.docs)
+
+    async def bulk_write(self, operations, ordered=True):
+        self.writes.extend(operation._doc["$set"] for operation in operations)
+
+
+def outbox_service(notification, send_email):
+    db = SimpleNamespace(
+        enhanced_notifications=FakeCollection([notification]),
+        users=FakeCollection([{"id": "u1", "email": "student@example.com", "language": "en"}])
+    )
+    service = EnhancedNotificationService(SimpleNamespace(driving_school_platform=db))
+    service._send_email = send_email
+    return service, db
+
+
+def notification(delivery_status=None):
+    return {
+        "id": "n1",
+        "user_id": "u1",
+        "title": "Payment received",
+        "message": "Thanks",
+        "priority": "medium",
+        "channels": ["email", "in_app"],
+        "metadata": {},
+        "delivery_status": delivery_status or {},
+    }
+
+
+def test_failed_channel_raises_so_the_entry_is_retried():
+    async def send_email(user, notification):
+        return False
+
+    service, db = outbox_service(notification(), send_email)
+
+    with pytest.raises(DeliveryFailedError):
+        asyncio.run(service._deliver_outbox_entry({"notification_ids": ["n1"]}))
+
+    written = db.enhanced_notifications.writes[0]
+    assert written["is_delivered"] is False
+    assert written["delivery_status"]["email"]["success"] is False
+    assert written["delivery_status"]["in_app"]["success"] is True
+
+
+def test_retry_only_resends_failed_channels():
+    sent = []
+
+    async def send_email(user, notification):
+        sent.append(user["email"])
+        return True
+
+    previous = {"email": {"success": False}, "in_app": {"success": True, "delivered_at": "earlier"}}
+    service, db = outbox_service(notification(previous), send_email)
+
+    assert asyncio.run(service._deliver_outbox_entry({"notification_ids": ["n1"]})) == 1
+
+    written = db.enhanced_notifications.writes[0]
+    assert sent == ["student@example.com"]
+    assert written["is_delivered"] is True
+    assert written["delivery_status"]["in_app"]["delivered_at"] == "earlier"
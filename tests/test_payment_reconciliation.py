@@ -0,0 +1,54 @@
+import io
+
+import pytest
+
+from payment_reconciliation import iter_json_rows, iter_settlement_rows
+
+
+def rows(text, chunk_size=65536):
+    return list(iter_json_rows(io.StringIO(text), chunk_size=chunk_size))
+
+
+def test_iter_json_rows_reads_an_array():
+    assert rows('[{"Transaction_ID": "t1", "amount": 10}, {"transaction_id": "t2"}]') == [
+        {"transaction_id": "t1", "amount": 10},
+        {"transaction_id": "t2"},
+    ]
+
+
+def test_iter_json_rows_reads_json_lines():
+    assert rows('{"id": 1}\n{"id": 2}\n\n{"id": 3}\n') == [{"id": 1}, {"id": 2}, {"id": 3}]
+
+
+def test_iter_json_rows_objects_spanning_chunks():
+    text = "[" + ", ".join('{"reference": "ref-%d", "amount": "1 500,50"}' % n for n in range(50)) + "]"
+
+    parsed = rows(text, chunk_size=7)
+
+    assert len(parsed) == 50
+    assert parsed[-1] == {"reference": "ref-49", "amount": "1 500,50"}
+
+
+def test_iter_json_rows_multibyte_text_across_chunks():
+    assert rows('[{"note": "paiement reçu – تم الدفع"}]', chunk_size=3) == [{"note": "paiement reçu – تم الدفع"}]
+
+
+def test_iter_json_rows_skips_non_objects():
+    assert rows('[1, "x", {"id": 1}, null]') == [{"id": 1}]
+
+
+def test_iter_json_rows_empty_input():
+    assert rows("") == []
+    assert rows("[]") == []
+
+
+def test_iter_json_rows_rejects_truncated_file():
+    with pytest.raises(ValueError):
+        rows('[{"id": 1}, {"id": ', chunk_size=4)
+
+
+def test_iter_settlement_rows_dispatches_on_format():
+    assert list(iter_settlement_rows(io.StringIO("Amount,Reference\n10,r1\n"), "csv")) == [{"amount": "10", "reference": "r1"}]
+    assert list(iter_settlement_rows(io.StringIO('{"id": 1}'), "jsonl")) == [{"id": 1}]
+    with pytest.raises(ValueError):
+        iter_settlement_rows(io.StringIO(""), "xml")
@@ -0,0 +1,185 @@
+import asyncio
+from datetime import date, datetime, time, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+from session_scheduling import (
+    MAX_SESSION_MINUTES,
+    BookingIndex,
+    IntervalIndex,
+    SessionConflictError,
+    SessionDurationError,
+    SessionScheduler,
+    check_duration,
+    expand_weekly_series,
+    to_naive_utc,
+)
+
+
+def at(hour, minute=0, day=1):
+    return datetime(2030, 1, day, hour, minute)
+
+
+def session(session_id, start, minutes=60, teacher_id="t1", student_id="s1"):
+    return {
+        "id": session_id,
+        "teacher_id": teacher_id,
+        "student_id": student_id,
+        "scheduled_at": start,
+        "duration_minutes": minutes,
+    }
+
+
+@pytest.fixture
+def scheduler():
+    return SessionScheduler(SimpleNamespace(driving_school_platform=None))
+
+
+def test_interval_index_detects_overlap():
+    index = IntervalIndex()
+    index.add(at(9), at(10), "a")
+    index.add(at(13), at(14), "b")
+
+    assert index.overlapping(at(9, 30), at(10, 30))[2] == "a"
+    assert index.overlapping(at(8), at(13, 1))[2] == "b"
+    assert len(index) == 2
+
+
+def test_interval_index_touching_intervals_do_not_overlap():
+    index = IntervalIndex()
+    index.add(at(9), at(10), "a")
+
+    assert index.overlapping(at(10), at(11)) is None
+    assert index.overlapping(at(8), at(9)) is None
+
+
+def test_interval_index_finds_long_booking_started_earlier():
+    index = IntervalIndex()
+    index.add(at(8), at(8) + timedelta(minutes=MAX_SESSION_MINUTES), "long")
+    index.add(at(9), at(9), "empty")
+
+    start = at(8) + timedelta(minutes=MAX_SESSION_MINUTES - 30)
+    assert index.overlapping(start, start + timedelta(minutes=60))[2] == "long"
+
+
+def test_booking_index_separates_calendars():
+    bookings = BookingIndex()
+    bookings.add("teacher:t1", at(9), at(10), "a")
+
+    assert bookings.find("teacher:t2", at(9), at(10)) is None
+    assert bookings.find("teacher:t1", at(9, 30), at(10, 30))[2] == "a"
+
+
+def test_booking_index_finds_booking_crossing_midnight():
+    bookings = BookingIndex()
+    bookings.add("teacher:t1", at(23, 30, day=1), at(0, 30, day=2), "late")
+
+    assert bookings.find("teacher:t1", at(0, 0, day=2), at(1, 0, day=2))[2] == "late"
+    assert bookings.find("teacher:t1", at(0, 30, day=2), at(1, 30, day=2)) is None
+
+
+def test_booking_index_finds_booking_starting_next_day():
+    bookings = BookingIndex()
+    bookings.add("student:s1", at(0, 15, day=2), at(1, 15, day=2), "early")
+
+    assert bookings.find("student:s1", at(23, 45, day=1), at(0, 45, day=2))[2] == "early"
+
+
+def test_try_book_rejects_overlap_and_records_accepted(scheduler):
+    bookings = BookingIndex()
+
+    assert scheduler.try_book(session("a", at(9)), bookings) is None
+    conflict = scheduler.try_book(session("b", at(9, 30), student_id="s2"), bookings)
+
+    assert conflict["conflict_with"] == "teacher"
+    assert conflict["session_id"] == "a"
+    assert scheduler.try_book(session("c", at(10), student_id="s2"), bookings) is None
+
+
+def test_try_book_reports_student_conflict(scheduler):
+    bookings = BookingIndex()
+    scheduler.try_book(session("a", at(9)), bookings)
+
+    conflict = scheduler.try_book(session("b", at(9), teacher_id="t2"), bookings)
+
+    assert conflict["conflict_with"] == "student"
+
+
+def test_check_plan_checks_planned_sessions_against_each_other(scheduler):
+    plan = [session("a", at(9)), session("b", at(9, 30)), session("c", at(11))]
+
+    conflicts = scheduler.check_plan(plan, BookingIndex())
+
+    assert [position for position, _ in conflicts] == [1]
+
+
+def test_try_book_normalizes_aware_datetimes(scheduler):
+    bookings = BookingIndex()
+    scheduler.try_book(session("a", at(9)), bookings)
+    aware = datetime(2030, 1, 1, 10, 30, tzinfo=timezone(timedelta(hours=1)))
+
+    assert scheduler.try_book(session("b", aware), bookings)["session_id"] == "a"
+
+
+def test_to_naive_utc():
+    aware = datetime(2030, 1, 1, 10, 0, tzinfo=timezone(timedelta(hours=1)))
+
+    assert to_naive_utc(aware) == datetime(2030, 1, 1, 9, 0)
+    assert to_naive_utc(at(9)) == at(9)
+
+
+def test_conflict_error_message():
+    error = SessionConflictError([{"conflict_with": "teacher", "session_id": "a", "scheduled_at": at(9), "ends_at": at(10)}])
+
+    assert str(error) == "Teacher already has a session from 2030-01-01 09:00 to 10:00"
+
+
+def test_expand_weekly_series_by_weeks():
+    # 2030-01-06 is a Sunday
+    starts = expand_weekly_series(date(2030, 1, 6), [6, 1], time(9, 0), weeks=2)
+
+    assert starts == [
+        datetime(2030, 1, 6, 9, 0),
+        datetime(2030, 1, 8, 9, 0),
+        datetime(2030, 1, 13, 9, 0),
+        datetime(2030, 1, 15, 9, 0),
+    ]
+
+
+def test_expand_weekly_series_by_count():
+    starts = expand_weekly_series(date(2030, 1, 6), [0, 2, 4], time(14, 30), count=4)
+
+    assert [start.weekday() for start in starts] == [0, 2, 4, 0]
+    assert starts[-1] == datetime(2030, 1, 14, 14, 30)
+
+
+def test_expand_weekly_series_stops_at_whichever_ends_first():
+    assert len(expand_weekly_series(date(2030, 1, 6), [6], time(9, 0), weeks=10, count=3)) == 3
+    assert len(expand_weekly_series(date(2030, 1, 6), [6], time(9, 0), weeks=2, count=10)) == 2
+
+
+def test_expand_weekly_series_needs_weekdays_and_a_bound():
+    assert expand_weekly_series(date(2030, 1, 6), [], time(9, 0), weeks=2) == []
+    assert expand_weekly_series(date(2030, 1, 6), [6], time(9, 0)) == []
+
+
+def test_check_duration_accepts_up_to_the_cap():
+    check_duration(session("a", at(9), minutes=MAX_SESSION_MINUTES))
+    check_duration({"id": "a", "scheduled_at": at(9)})
+
+
+@pytest.mark.parametrize("minutes", [-30, MAX_SESSION_MINUTES + 1, MAX_SESSION_MINUTES + 60])
+def test_check_duration_rejects_out_of_range(minutes):
+    with pytest.raises(SessionDurationError):
+        check_duration(session("a", at(9), minutes=minutes))
+
+
+def test_inserts_reject_sessions_longer_than_the_cap(scheduler):
+    # The overlap search only looks back MAX_SESSION_MINUTES, so longer bookings are refused before any write
+    too_long = session("a", at(9), minutes=MAX_SESSION_MINUTES + 60)
+
+    with pytest.raises(SessionDurationError):
+        asyncio.run(scheduler.insert_session(too_long))
+    with pytest.raises(SessionDurationError):
+        asyncio.run(scheduler.insert_sessions([session("b", at(14)), too_long]))
@@ -0,0 +1,150 @@
+import asyncio
+from datetime import date, datetime, time
+from types import SimpleNamespace
+
+import numpy as np
+
+from teacher_availability import (
+    SLOT_MINUTES,
+    SLOTS_PER_DAY,
+    TeacherAvailabilityService,
+    parse_working_hours,
+    week_template,
+)
+
+# 2030-01-06 is a Sunday (weekday 6)
+SUNDAY = date(2030, 1, 6)
+
+
+class FakeCollection:
+    """Returns its documents for any query; the filtering under test happens in Python"""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    async def _iterate(self):
+        for doc in self.docs:
+            yield doc
+
+    def find(self, query=None, projection=None):
+        return self._iterate()
+
+
+def service(working_hours=None, sessions=()):
+    teachers = [{"id": "t1", "working_hours": working_hours}]
+    db = SimpleNamespace(teachers=FakeCollection(teachers), sessions=FakeCollection(list(sessions)))
+    availability = TeacherAvailabilityService(SimpleNamespace(driving_school_platform=db))
+    return availability
+
+
+def free_slots(availability, start_date, end_date, **kwargs):
+    kwargs.setdefault("now", datetime(2030, 1, 1))
+    return asyncio.run(availability.free_slots(["t1"], start_date, end_date, **kwargs))["t1"]
+
+
+def hours(*windows):
+    return [{"weekday": weekday, "start_time": start, "end_time": end} for weekday, start, end in windows]
+
+
+def test_parse_working_hours():
+    assert parse_working_hours(None) is None
+    assert parse_working_hours(hours((6, "08:00", "12:30"))) == [(6, time(8, 0), time(12, 30))]
+
+
+def test_week_template_keeps_only_whole_slots():
+    template = week_template([(0, time(8, 10), time(9, 20))])
+
+    assert template.shape == (7, SLOTS_PER_DAY)
+    # 08:15 to 09:15: four whole quarter-hours
+    assert np.flatnonzero(template[0]).tolist() == list(range(33, 37))
+    assert not template[1:].any()
+
+
+def test_week_template_midnight_end_covers_rest_of_day():
+    template = week_template([(2, time(22, 0), time(0, 0))])
+
+    assert template[2, 22 * 60 // SLOT_MINUTES:].all()
+    assert template[2].sum() == 8
+
+
+def test_free_slots_subtract_sessions():
+    availability = service(
+        hours((6, "08:00", "12:00")),
+        [{"teacher_id": "t1", "scheduled_at": datetime(2030, 1, 6, 9, 0), "duration_minutes": 60}]
+    )
+
+    runs = free_slots(availability, SUNDAY, SUNDAY)
+
+    assert [(run["start"].hour, run["end"].hour) for run in runs] == [(8, 9), (10, 12)]
+    assert [run["minutes"] for run in runs] == [60, 120]
+
+
+def test_free_slots_block_every_touched_slot():
+    availability = service(
+        hours((6, "08:00", "10:00")),
+        [{"teacher_id": "t1", "scheduled_at": datetime(2030, 1, 6, 8, 20), "duration_minutes": 30}]
+    )
+
+    runs = free_slots(availability, SUNDAY, SUNDAY)
+
+    assert [(run["start"].time(), run["end"].time()) for run in runs] == [
+        (time(8, 0), time(8, 15)),
+        (time(9, 0), time(10, 0)),
+    ]
+
+
+def test_free_slots_cut_runs_at_midnight():
+    availability = service(hours((6, "00:00", "00:00"), (0, "00:00", "02:00")))
+
+    runs = free_slots(availability, SUNDAY, date(2030, 1, 7))
+
+    assert [(run["start"], run["end"]) for run in runs] == [
+        (datetime(2030, 1, 6, 0, 0), datetime(2030, 1, 7, 0, 0)),
+        (datetime(2030, 1, 7, 0, 0), datetime(2030, 1, 7, 2, 0)),
+    ]
+
+
+def test_free_slots_clip_sessions_partly_outside_range():
+    availability = service(
+        hours((6, "00:00", "04:00"), (0, "22:00", "00:00")),
+        [
+            # Started the evening before the range and runs into it
+            {"teacher_id": "t1", "scheduled_at": datetime(2030, 1, 5, 23, 0), "duration_minutes": 120},
+            # Starts inside the range and runs past its end
+            {"teacher_id": "t1", "scheduled_at": datetime(2030, 1, 7, 23, 30), "duration_minutes": 120},
+        ]
+    )
+
+    runs = free_slots(availability, SUNDAY, date(2030, 1, 7))
+
+    assert [(run["start"], run["end"]) for run in runs] == [
+        (datetime(2030, 1, 6, 1, 0), datetime(2030, 1, 6, 4, 0)),
+        (datetime(2030, 1, 7, 22, 0), datetime(2030, 1, 7, 23, 30)),
+    ]
+
+
+def test_free_slots_mask_the_past():
+    availability = service(hours((6, "08:00", "12:00")))
+
+    runs = free_slots(availability, SUNDAY, SUNDAY, now=datetime(2030, 1, 6, 9, 50))
+
+    assert [(run["start"].time(), run["end"].time()) for run in runs] == [(time(10, 0), time(12, 0))]
+
+
+def test_free_slots_minimum_length():
+    availability = service(
+        hours((6, "08:00", "12:00")),
+        [{"teacher_id": "t1", "scheduled_at": datetime(2030, 1, 6, 8, 30), "duration_minutes": 60}]
+    )
+
+    runs = free_slots(availability, SUNDAY, SUNDAY, min_minutes=60)
+
+    assert [(run["start"].time(), run["end"].time()) for run in runs] == [(time(9, 30), time(12, 0))]
+
+
+def test_free_slots_default_working_hours():
+    # Monday is a default working day (08:00-17:00), Friday is not
+    availability = service()
+
+    assert [run["minutes"] for run in free_slots(availability, date(2030, 1, 7), date(2030, 1, 7))] == [540]
+    assert free_slots(availability, date(2030, 1, 11), date(2030, 1, 11)) == []
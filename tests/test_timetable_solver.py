@@ -0,0 +1,127 @@
+from datetime import date, datetime, time
+from types import SimpleNamespace
+
+from session_scheduling import BookingIndex, SessionScheduler
+from timetable_solver import (
+    PlannedCourse,
+    StudentPlan,
+    WeeklyTimetableSolver,
+    plannable_courses,
+    teacher_slots,
+)
+
+# 2030-01-06 is a Sunday
+WEEK_START = date(2030, 1, 6)
+# Sunday only, 08:00-12:00: four one-hour slots
+SUNDAY_MORNING = [(6, time(8, 0), time(12, 0))]
+# Sunday to Tuesday, 08:00-12:00
+THREE_MORNINGS = [(weekday, time(8, 0), time(12, 0)) for weekday in (6, 0, 1)]
+
+
+def course(course_type, status="available", total=3, completed=0, teacher_id="t1"):
+    return {
+        "id": f"c-{course_type}",
+        "course_type": course_type,
+        "status": status,
+        "total_sessions": total,
+        "completed_sessions": completed,
+        "teacher_id": teacher_id,
+    }
+
+
+def solver(**kwargs):
+    scheduler = SessionScheduler(SimpleNamespace(driving_school_platform=None))
+    options = {"duration_minutes": 60, "max_per_day": 4, "max_per_week": 10, "not_before": datetime(2030, 1, 1)}
+    options.update(kwargs)
+    return WeeklyTimetableSolver(scheduler, BookingIndex(), WEEK_START, **options)
+
+
+def test_plannable_courses_follow_course_order():
+    courses = [course("road", status="locked"), course("park", status="locked"), course("theory")]
+
+    planned = plannable_courses(courses, {})
+
+    assert [item.course_type for item in planned] == ["theory"]
+
+
+def test_plannable_courses_skip_completed_and_subtract_pending():
+    courses = [course("theory", status="completed"), course("park", total=5, completed=1), course("road", status="locked")]
+
+    planned = plannable_courses(courses, {"c-park": 2})
+
+    assert [(item.course_type, item.remaining) for item in planned] == [("park", 2)]
+
+
+def test_plannable_courses_stop_at_course_without_teacher():
+    courses = [course("theory", teacher_id=None), course("park")]
+
+    assert plannable_courses(courses, {}) == []
+
+
+def test_teacher_slots_fit_inside_windows():
+    slots = teacher_slots([(6, time(8, 0), time(10, 30))], WEEK_START, 60, datetime(2030, 1, 1))
+
+    assert slots == [datetime(2030, 1, 6, 8, 0), datetime(2030, 1, 6, 9, 0)]
+
+
+def test_teacher_slots_respect_not_before():
+    slots = teacher_slots(SUNDAY_MORNING, WEEK_START, 60, datetime(2030, 1, 6, 9, 30))
+
+    assert slots == [datetime(2030, 1, 6, 10, 0), datetime(2030, 1, 6, 11, 0)]
+
+
+def test_solver_places_theory_before_park():
+    student = StudentPlan("s1", [PlannedCourse("c-theory", "theory", "t1", 2), PlannedCourse("c-park", "park", "t2", 1)])
+    availability = {"t1": THREE_MORNINGS, "t2": THREE_MORNINGS}
+
+    sessions, unplaced = solver().solve([student], availability)
+
+    theory = [item["scheduled_at"] for item in sessions if item["session_type"] == "theory"]
+    park = [item["scheduled_at"] for item in sessions if item["session_type"] == "park"]
+    assert len(theory) == 2 and len(park) == 1
+    assert max(theory) < min(park)
+    assert unplaced == {}
+
+
+def test_solver_holds_back_later_courses_when_one_is_stuck():
+    # The theory teacher has only one slot, so park must wait for next week
+    student = StudentPlan("s1", [PlannedCourse("c-theory", "theory", "t1", 2), PlannedCourse("c-park", "park", "t2", 1)])
+    availability = {"t1": [(6, time(8, 0), time(9, 0))], "t2": THREE_MORNINGS}
+
+    sessions, unplaced = solver().solve([student], availability)
+
+    assert [item["session_type"] for item in sessions] == ["theory"]
+    assert unplaced == {"c-theory": 1, "c-park": 1}
+
+
+def test_solver_respects_per_day_cap():
+    student = StudentPlan("s1", [PlannedCourse("c-theory", "theory", "t1", 4)])
+
+    sessions, _ = solver(max_per_day=2).solve([student], {"t1": THREE_MORNINGS})
+
+    per_day = {}
+    for item in sessions:
+        per_day[item["scheduled_at"].date()] = per_day.get(item["scheduled_at"].date(), 0) + 1
+    assert len(sessions) == 4
+    assert max(per_day.values()) == 2
+
+
+def test_solver_respects_per_week_cap():
+    student = StudentPlan("s1", [PlannedCourse("c-theory", "theory", "t1", 6)])
+
+    sessions, unplaced = solver(max_per_week=3).solve([student], {"t1": THREE_MORNINGS})
+
+    assert len(sessions) == 3
+    assert unplaced == {"c-theory": 3}
+
+
+def test_solver_never_double_books_a_teacher():
+    students = [StudentPlan(f"s{n}", [PlannedCourse(f"c{n}", "theory", "t1", 3)]) for n in range(3)]
+
+    sessions, unplaced = solver().solve(students, {"t1": SUNDAY_MORNING})
+
+    starts = [item["scheduled_at"] for item in sessions]
+    assert len(starts) == len(set(starts)) == 4
+    assert sum(unplaced.values()) == 5
+    # Round-robin: every student gets a session before anyone gets a second one
+    assert {item["student_id"] for item in sessions[:3]} == {"s0", "s1", "s2"}